@@ -0,0 +1,86 @@
+"""
+Benchmark of the Braun & Willett stack builder (flowNetwork.ordered_node_array).
+
+A synthetic drainage network is defined on a regular grid using steepest descent
+over a tilted random surface, which gives long trunk rivers draining towards the
+lower border. A second case drains every node through a single trunk river,
+which gives the deepest possible walk along the donors. Run it on two versions
+of the code to compare the builders:
+
+    python stack_bench.py 1000000 4000000 16000000
+"""
+
+import sys
+import time
+import numpy as np
+
+from pyBadlands.flow.flowNetwork import flowNetwork
+
+def synthetic_receivers(nbPts, seed=0):
+    """
+    Build single flow direction receivers and base levels on a square grid.
+    """
+
+    n = int(np.sqrt(nbPts))
+    rng = np.random.RandomState(seed)
+    z = 0.1 * rng.rand(n, n) + np.arange(n)[:, None]
+    ids = np.arange(n*n, dtype=np.int32).reshape(n, n)
+
+    big = np.inf
+    zpad = np.full((n+2, n+2), big)
+    zpad[1:-1, 1:-1] = z
+    ipad = np.full((n+2, n+2), -1, dtype=np.int32)
+    ipad[1:-1, 1:-1] = ids
+
+    zmin = z.copy()
+    rcv = ids.copy()
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            if dx == 0 and dy == 0:
+                continue
+            zn = zpad[1+dy:n+1+dy, 1+dx:n+1+dx]
+            lower = zn < zmin
+            zmin[lower] = zn[lower]
+            rcv[lower] = ipad[1+dy:n+1+dy, 1+dx:n+1+dx][lower]
+
+    rcv = rcv.ravel()
+    base = np.where(rcv == np.arange(n*n))[0].astype(np.int32)
+
+    return rcv, base
+
+def trunk_receivers(nbPts):
+    """
+    Build a single river where each node drains into the previous one.
+    """
+
+    rcv = np.arange(nbPts, dtype=np.int32) - 1
+    rcv[0] = 0
+    base = np.zeros(1, dtype=np.int32)
+
+    return rcv, base
+
+def run(name, rcv, base):
+    """
+    Time the stack construction (best of 3).
+    """
+
+    flow = flowNetwork()
+    flow.receivers = rcv
+    flow.localbase = base
+    best = None
+    for it in range(3):
+        walltime = time.time()
+        flow.ordered_node_array()
+        tt = time.time() - walltime
+        if best is None or tt < best:
+            best = tt
+    print '%-8s %10d nodes %8d basins: stack built in %.3f s' % (name, len(rcv), len(base), best)
+
+if __name__ == '__main__':
+
+    sizes = [int(float(s)) for s in sys.argv[1:]] or [1000000, 4000000, 16000000]
+    for nbPts in sizes:
+        rcv, base = synthetic_receivers(nbPts)
+        run('rivers', rcv, base)
+        rcv, base = trunk_receivers(nbPts)
+        run('trunk', rcv, base)
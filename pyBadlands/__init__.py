@@ -13,6 +13,10 @@
 from .flow import flowNetwork
 from .surface import FVmethod
 from .surface import raster2TIN
+from .surface import reorderTIN
+from .surface import meshCache
+from .surface import gridFile
+from .surface import interpTIN
 from .underland import eroMesh
 from .underland import strataMesh
 from .flow import visualiseFlow
@@ -25,6 +29,9 @@ from .surface import visSurf
 from .forcing import xmlParser
 from .forcing import forceSim
 from .forcing import isoFlex
+from .forcing import forceArchive
+from .forcing import forcePrefetch
+from .forcing import oroRain
 from .simulation import buildMesh
 from .simulation import checkPoints
 from .simulation import buildFlux
@@ -11,11 +11,12 @@ This module encapsulates functions related to Badlands stream network computatio
 """
 
 import math
+import heapq
 import numpy
 import warnings
 import mpi4py.MPI as mpi
+from scipy import sparse
 from scipy.spatial import cKDTree
-from scipy.interpolate import RegularGridInterpolator
 from scipy.ndimage.filters import gaussian_filter
 
 from pyBadlands.libUtils import SFDalgo as SFD
@@ -38,11 +39,14 @@ class flowNetwork:
         self.base = None
         self.localbase = None
         self.receivers = None
-        self.arrdonor = None
         self.delta = None
         self.donors = None
         self.localstack = None
-        self.stack = None
+        self.localbasins = None
+        self.basinorder = None
+        self.basinWork = None
+        self.basinCounts = None
+        self.imbalance = 1.
         self.partFlow = None
         self.maxdonors = 0
         self.CFL = None
@@ -57,6 +61,7 @@ class flowNetwork:
         self.spl = False
         self.capacity = False
         self.filter = False
+        self.implicit = False
         self.depo = 0
 
         self.discharge = None
@@ -67,23 +72,352 @@ class flowNetwork:
         self.diff_cfl = None
         self.chi = None
         self.basinID = None
+        self.sfdInputs = None
+        self.sfdOutputs = None
+        self.sfdSea = None
+        self.sfdRatio = 0.5
+        self.rcvtol = 0.
+        self.adjacency = None
+
+        self.gather = False
+        self.ownedIDs = None
+        self._ownedNbs = None
+        self._ownedGIDs = None
+        self._ownedBase = None
+        self._pendingNetwork = None
+        self._pendingBasins = None
+        self.fused = True
 
         self.xgrid = None
         self.xgrid = None
         self.xi = None
         self.yi = None
         self.xyi = None
+        self.tin2grid = None
+        self.grid2tin = None
 
         self._comm = mpi.COMM_WORLD
         self._rank = self._comm.Get_rank()
         self._size = self._comm.Get_size()
 
-    def SFD_receivers(self, fillH, elev, neighbours, edges, distances, globalIDs, sea):
+    def set_owned(self, inGIDs):
+        """
+        Define the nodes owned by each processor when the flow network is gathered from
+        the partitions instead of being reduced globally. Each processor only computes the
+        network of the nodes it owns and receives the values of all the other nodes with a
+        packed all-gather (see gather_network).
+
+        Parameters
+        ----------
+        variable: inGIDs
+            Numpy integer-type array filled with the global vertex IDs for each local grid located
+            within the partition (not those on the edges).
+        """
+
+        self.gather = True
+        self.ownedIDs = inGIDs
+
+        # Global IDs ordered by processor used to complete the network arrays
+        gids = inGIDs.astype(numpy.int32)
+        self._ownedNbs = self._comm.allgather(len(gids))
+        self._ownedGIDs = numpy.zeros(sum(self._ownedNbs), dtype=numpy.int32)
+        self._comm.Allgatherv(sendbuf=[gids, mpi.INT],
+                              recvbuf=[self._ownedGIDs, (self._ownedNbs, None), mpi.INT])
+
+    def _start_reduction(self, fields, ops):
+        """
+        Pack a list of arrays in a single buffer per data type (integer or float) and start
+        non-blocking global reductions. The arrays reduced with a MIN operation are negated so
+        that each buffer is reduced with a MAX operation. When the fused attribute is set to
+        False, each array is instead reduced straight away with a blocking reduction using its
+        own data type and operation.
+
+        Parameters
+        ----------
+        variable : fields
+            List of numpy arrays which are updated in place once the reduction is completed.
+
+        variable : ops
+            List of MPI operations (MAX or MIN) associated to each array.
+
+        Return
+        ----------
+        variable: pending
+            List of tuples containing the MPI request, the packed buffer, the arrays to update
+            and their signs for each data type.
+        """
+
+        pending = []
+        if not self.fused:
+            for f, op in zip(fields, ops):
+                self._comm.Allreduce(mpi.IN_PLACE, f, op=op)
+            return pending
+
+        for dtype, mtype in [(numpy.int32, mpi.INT), (numpy.float64, mpi.DOUBLE)]:
+            isint = dtype == numpy.int32
+            group = [(f, -1 if op == mpi.MIN else 1) for f, op in zip(fields, ops)
+                     if (numpy.asarray(f).dtype.kind in 'iu') == isint]
+            if len(group) == 0:
+                continue
+            gfields, signs = zip(*group)
+            buf = numpy.concatenate([s * numpy.asarray(f).ravel()
+                                     for f, s in group]).astype(dtype)
+            request = self._comm.Iallreduce(mpi.IN_PLACE, [buf, mtype], op=mpi.MAX)
+            pending.append((request, buf, gfields, signs))
+
+        return pending
+
+    def _finish_reduction(self, pending):
+        """
+        Wait for a reduction started with _start_reduction and unpack the buffers.
+
+        Parameters
+        ----------
+        variable : pending
+            List returned by _start_reduction.
+        """
+
+        for request, buf, fields, signs in pending:
+            request.Wait()
+            offset = 0
+            for f, s in zip(fields, signs):
+                f[...] = (s * buf[offset:offset+f.size]).reshape(f.shape)
+                offset += f.size
+
+    def _reduce(self, fields, ops):
+        """
+        Blocking global reduction of a list of arrays packed in a single buffer per data type.
+        It is used when the reduced values are needed straight away.
+
+        Parameters
+        ----------
+        variable : fields
+            List of numpy arrays which are updated in place.
+
+        variable : ops
+            List of MPI operations (MAX or MIN) associated to each array.
+        """
+
+        self._finish_reduction(self._start_reduction(fields, ops))
+
+    def _reduce_network(self, base, receivers, fields, ops):
+        """
+        Combine the flow network computed on each partition. The base levels and receivers
+        are needed straight away to build the stack and are reduced first. The other arrays
+        are only used by the sediment fluxes computation: their reduction is left running
+        while the basins are distributed and the stack and discharge are computed, and it is
+        completed by complete_network at the start of the sediment fluxes computation.
+
+        Parameters
+        ----------
+        variable : base
+            Numpy integer-type array containing the base level IDs of the local nodes.
+
+        variable : receivers
+            Numpy integer-type array containing the receiver IDs of the local nodes.
+
+        variable : fields
+            List of numpy float-type arrays reduced in the background.
+
+        variable : ops
+            List of MPI operations (MAX or MIN) associated to each of these arrays.
+        """
+
+        self.complete_network()
+        pending = self._start_reduction([base, receivers], [mpi.MAX, mpi.MAX])
+        self._pendingNetwork = self._start_reduction(fields, ops)
+        self._finish_reduction(pending)
+
+        bpos = numpy.where(base >= 0)[0]
+        self.base = base[bpos]
+        numpy.random.shuffle(self.base)
+        self.receivers = receivers
+
+    def complete_network(self):
+        """
+        Complete the background reduction of the flow network arrays (maximum heights and
+        deposition, diffusion flux and diffusion CFL) before they are used.
+        """
+
+        if self._pendingNetwork is not None:
+            self._finish_reduction(self._pendingNetwork)
+            self._pendingNetwork = None
+
+    def _mask_nonlocal(self, globalIDs, fields):
+        """
+        Reset the values of the nodes which have not been computed on the partition, so
+        that only the processors holding these nodes contribute to the MAX reduction. Integer
+        arrays (base levels and receivers) are reset to -1.
+
+        Parameters
+        ----------
+        variable: globalIDs
+            Numpy integer-type array containing for local nodes their global IDs.
+
+        variable : fields
+            List of numpy arrays defined on the global TIN which are updated in place.
+        """
+
+        if self._size == 1:
+            return
+
+        outside = numpy.ones(len(fields[0]), dtype=bool)
+        outside[globalIDs] = False
+        for f in fields:
+            f[outside] = -1 if f.dtype.kind == 'i' else -numpy.inf
+
+    def gather_network(self):
+        """
+        Complete the flow network arrays on all processors once each of them has computed
+        the receivers of the nodes it owns. Each node is sent once by the partition that owns
+        it and the arrays are packed in one all-gather per data type: the base levels and
+        receivers as integers and the other arrays as floats. The drainage basins cross the
+        partitions so that the complete network is needed to build the stacks and each
+        processor receives the values of all the TIN nodes.
+        """
+
+        base = self._ownedBase
+        floats = [self.diff_flux]
+        if isinstance(self.maxh, numpy.ndarray):
+            floats += [self.maxh, self.maxdep]
+
+        requests = []
+        buffers = []
+        for fields, dtype, mtype in [([base, self.receivers], numpy.int32, mpi.INT),
+                                     (floats, numpy.float64, mpi.DOUBLE)]:
+            nf = len(fields)
+            sbuf = numpy.concatenate([f[self.ownedIDs] for f in fields]).astype(dtype)
+            counts = [nf*nb for nb in self._ownedNbs]
+            rbuf = numpy.empty(sum(counts), dtype=dtype)
+            requests.append(self._comm.Iallgatherv([sbuf, mtype], [rbuf, (counts, None), mtype]))
+            buffers.append((fields, sbuf, rbuf))
+        mpi.Request.Waitall(requests)
+
+        for fields, sbuf, rbuf in buffers:
+            nf = len(fields)
+            offset = 0
+            start = 0
+            for nb in self._ownedNbs:
+                ids = self._ownedGIDs[start:start+nb]
+                for k in range(nf):
+                    fields[k][ids] = rbuf[offset+k*nb:offset+(k+1)*nb]
+                offset += nf*nb
+                start += nb
+
+        bpos = numpy.where(base >= 0)[0]
+        self.base = base[bpos]
+        numpy.random.shuffle(self.base)
+
+    def _sfd_dirty_nodes(self, inputs, ngbOffsets, neighbours, globalIDs, sea):
+        """
+        Find the local nodes for which the flow directions need to be recomputed. The receiver,
+        the maximum heights and the diffusion flux of a node only depend on the elevations of
+        the node and its neighbours and on the sea level. The elevations used by the SFD function
+        are stored and only replaced when they differ from the new ones by more than the rcvtol
+        tolerance. The nodes to update are the ones which have been replaced and their 1-ring,
+        so that the outputs always correspond to a complete computation on the stored surface.
+        When the sea level moves, the nodes whose elevation lies between the previous and the
+        new sea level are updated as well together with their 1-ring.
+
+        Parameters
+        ----------
+        variable : inputs
+            List of numpy arrays containing the elevations used by the SFD function, the last
+            one being compared to the sea level.
+
+        variable : ngbOffsets
+            Numpy integer-type array containing the offsets of each node neighbourhood.
+
+        variable : neighbours
+            Numpy integer-type array with the neighbourhood IDs.
+
+        variable: globalIDs
+            Numpy integer-type array containing for local nodes their global IDs.
+
+        variable : sea
+            Current elevation of sea level.
+
+        Return
+        ----------
+        variable: ids
+            Numpy integer-type array containing the global IDs of the nodes to update or None
+            when all the local nodes need to be computed.
+        """
+
+        numPts = len(inputs[0])
+        full = self.sfdInputs is None or self.sfdOutputs is None \
+            or len(self.sfdInputs) != len(inputs) or len(self.sfdInputs[0]) != numPts
+
+        if full:
+            self.sfdInputs = [numpy.array(f, copy=True) for f in inputs]
+            self.sfdSea = sea
+            return None
+
+        changed = numpy.zeros(numPts, dtype=bool)
+        for old, new in zip(self.sfdInputs, inputs):
+            changed |= abs(new - old) > self.rcvtol
+        for old, new in zip(self.sfdInputs, inputs):
+            old[changed] = new[changed]
+
+        # Nodes crossing the sea level between the two computations
+        if sea != self.sfdSea:
+            z = self.sfdInputs[-1]
+            changed |= (z >= min(sea, self.sfdSea)) & (z <= max(sea, self.sfdSea))
+            self.sfdSea = sea
+
+        if self.adjacency is None:
+            self.adjacency = sparse.csr_matrix((numpy.ones(len(neighbours), dtype=bool),
+                                               neighbours, ngbOffsets), shape=(numPts, numPts))
+
+        dirty = changed.copy()
+        dirty[self.adjacency[numpy.where(changed)[0]].indices] = True
+        ids = globalIDs[dirty[globalIDs]]
+
+        # The complete computation is cheaper when most of the nodes have changed
+        if len(ids) > self.sfdRatio * len(globalIDs):
+            return None
+
+        return ids
+
+    def _sfd_outputs(self, ids, numPts, defaults):
+        """
+        Return the arrays updated in place by the SFD function. They are kept from one call to
+        the next and are only created, filled with the values of the nodes which are not
+        computed, when all the local nodes need to be computed.
+
+        Parameters
+        ----------
+        variable : ids
+            Numpy integer-type array containing the global IDs of the nodes to update or None
+            when all the local nodes need to be computed.
+
+        variable : numPts
+            Number of nodes of the TIN.
+
+        variable : defaults
+            List of the initial values of each output, integer values give integer-type arrays.
+        """
+
+        # The outputs may still be combined in the background from the previous computation
+        self.complete_network()
+
+        if ids is None:
+            self.sfdOutputs = [numpy.full(numPts, v, dtype=numpy.int32 if isinstance(v, int)
+                                          else numpy.float64) for v in defaults]
+
+        return self.sfdOutputs
+
+    def SFD_receivers(self, fillH, elev, ngbOffsets, neighbours, edges, distances, globalIDs, sea):
         """
         Single Flow Direction function computes downslope flow directions by inspecting the neighborhood
         elevations around each node. The SFD method assigns a unique flow direction towards the steepest
         downslope neighbor.
 
+        Only the nodes whose neighbourhood elevations have changed by more than rcvtol since the
+        previous computation are updated, together with the nodes reached by a change of the sea
+        level. The complete computation is performed after a change of the mesh. The stored
+        outputs are combined in place between processors.
+
         Parameters
         ----------
         variable : fillH
@@ -92,6 +426,9 @@ class flowNetwork:
         variable : elev
             Numpy arrays containing the elevation of the TIN nodes.
 
+        variable : ngbOffsets
+            Numpy integer-type array containing the offsets of each node neighbourhood.
+
         variable : neighbours
             Numpy integer-type array with the neighbourhood IDs.
 
@@ -108,49 +445,57 @@ class flowNetwork:
             Current elevation of sea level.
         """
 
+        # Only the owned nodes are computed when the network is gathered from the partitions
+        if self.gather:
+            globalIDs = self.ownedIDs
+
         # Call the SFD function from libUtils
         if self.depo == 0 or self.capacity or self.filter:
-            base, receivers, diff_flux = sfd.directions_base(elev, neighbours, edges, distances, globalIDs, sea)
-
-            # Send local base level globally
-            self._comm.Allreduce(mpi.IN_PLACE,base,op=mpi.MAX)
-
-            bpos = numpy.where(base >= 0)[0]
-            self.base = base[bpos]
-            numpy.random.shuffle(self.base)
-            # Send local receivers globally
-            self._comm.Allreduce(mpi.IN_PLACE,receivers,op=mpi.MAX)
-            self.receivers = receivers
-
-            # Send local diffusion flux globally
-            self._comm.Allreduce(mpi.IN_PLACE,diff_flux,op=mpi.MAX)
+            ids = self._sfd_dirty_nodes([elev], ngbOffsets, neighbours, globalIDs, sea)
+            elev, = self.sfdInputs
+            base, receivers, diff_flux = self._sfd_outputs(ids, len(elev), [-1, -1, 0.])
+            sfd.directions_base(elev, ngbOffsets, neighbours, edges, distances,
+                                globalIDs if ids is None else ids, sea, base, receivers, diff_flux)
+
+            if self.gather:
+                self._ownedBase = base
+                self.receivers = receivers
+                self.diff_flux = diff_flux
+                return
+
+            # Nodes computed on other partitions should not take part in the reduction
+            self._mask_nonlocal(globalIDs, [base, receivers, diff_flux])
+
+            # Send local network globally
+            self._reduce_network(base, receivers, [diff_flux], [mpi.MAX])
             self.diff_flux = diff_flux
         else:
-            base, receivers, maxh, maxdep, diff_flux = sfd.directions(fillH, elev, neighbours, edges, distances, globalIDs, sea)
-
-            # Send local base level globally
-            self._comm.Allreduce(mpi.IN_PLACE,base,op=mpi.MAX)
-            bpos = numpy.where(base >= 0)[0]
-            self.base = base[bpos]
-            numpy.random.shuffle(self.base)
-
-            # Send local receivers globally
-            self._comm.Allreduce(mpi.IN_PLACE,receivers,op=mpi.MAX)
-            self.receivers = receivers
-
-            # Send local maximum height globally
-            self._comm.Allreduce(mpi.IN_PLACE,maxh,op=mpi.MAX)
+            ids = self._sfd_dirty_nodes([fillH, elev], ngbOffsets, neighbours, globalIDs, sea)
+            fillH, elev = self.sfdInputs
+            base, receivers, maxh, maxdep, diff_flux = self._sfd_outputs(ids, len(elev),
+                                                                         [-1, -1, 1.e6, 0., 0.])
+            sfd.directions(fillH, elev, ngbOffsets, neighbours, edges, distances,
+                           globalIDs if ids is None else ids, sea, base, receivers, maxh,
+                           maxdep, diff_flux)
+
+            if self.gather:
+                self._ownedBase = base
+                self.receivers = receivers
+                self.maxh = maxh
+                self.maxdep = maxdep
+                self.diff_flux = diff_flux
+                return
+
+            # Nodes computed on other partitions should not take part in the reduction
+            self._mask_nonlocal(globalIDs, [base, receivers, maxh, maxdep, diff_flux])
+
+            # Send local network globally
+            self._reduce_network(base, receivers, [maxh, maxdep, diff_flux], [mpi.MAX]*3)
             self.maxh = maxh
-
-            # Send local maximum deposition globally
-            self._comm.Allreduce(mpi.IN_PLACE,maxdep,op=mpi.MAX)
             self.maxdep = maxdep
-
-            # Send local diffusion flux globally
-            self._comm.Allreduce(mpi.IN_PLACE,diff_flux,op=mpi.MAX)
             self.diff_flux = diff_flux
 
-    def SFD_nreceivers(self, Sc, fillH, elev, neighbours, edges, distances, globalIDs, sea):
+    def SFD_nreceivers(self, Sc, fillH, elev, ngbOffsets, neighbours, edges, distances, globalIDs, sea):
         """
         Single Flow Direction function computes downslope flow directions by inspecting the neighborhood
         elevations around each node. The SFD method assigns a unique flow direction towards the steepest
@@ -167,6 +512,9 @@ class flowNetwork:
         variable : elev
             Numpy arrays containing the elevation of the TIN nodes.
 
+        variable : ngbOffsets
+            Numpy integer-type array containing the offsets of each node neighbourhood.
+
         variable : neighbours
             Numpy integer-type array with the neighbourhood IDs.
 
@@ -183,104 +531,175 @@ class flowNetwork:
             Current elevation of sea level.
         """
 
+        # Only the owned nodes are computed when the network is gathered from the partitions
+        if self.gather:
+            globalIDs = self.ownedIDs
+
         # Call the SFD function from libUtils
         if self.depo == 0 or self.capacity or self.filter:
             base, receivers, diff_flux, diff_cfl = SFD.sfdcompute.directions_base_nl(elev, \
-                neighbours, edges, distances, globalIDs, sea, Sc)
+                ngbOffsets, neighbours, edges, distances, globalIDs, sea, Sc)
 
-            # Send local base level globally
-            self._comm.Allreduce(mpi.IN_PLACE,base,op=mpi.MAX)
+            # The diffusion CFL is reduced globally by the hillslope class
+            if self.gather:
+                self._ownedBase = base
+                self.receivers = receivers
+                self.diff_flux = diff_flux
+                self.diff_cfl = diff_cfl
+                return
 
-            bpos = numpy.where(base >= 0)[0]
-            self.base = base[bpos]
-            numpy.random.shuffle(self.base)
-            # Send local receivers globally
-            self._comm.Allreduce(mpi.IN_PLACE,receivers,op=mpi.MAX)
-            self.receivers = receivers
+            # Nodes computed on other partitions should not take part in the reduction
+            self._mask_nonlocal(globalIDs, [base, receivers, diff_flux])
 
-            # Send local diffusion flux globally
-            self._comm.Allreduce(mpi.IN_PLACE,diff_flux,op=mpi.MAX)
+            # Send local network globally
+            self._reduce_network(base, receivers, [diff_flux, diff_cfl], [mpi.MAX, mpi.MIN])
             self.diff_flux = diff_flux
-
-            # Send local diffusion CFL condition globally
-            self._comm.Allreduce(mpi.IN_PLACE,diff_cfl,op=mpi.MIN)
             self.diff_cfl = diff_cfl
         else:
             base, receivers, maxh, maxdep, diff_flux, diff_cfl = SFD.sfdcompute.directions_nl(fillH, \
-                elev, neighbours, edges, distances, globalIDs, sea, Sc)
+                elev, ngbOffsets, neighbours, edges, distances, globalIDs, sea, Sc)
+
+            # The diffusion CFL is reduced globally by the hillslope class
+            if self.gather:
+                self._ownedBase = base
+                self.receivers = receivers
+                self.maxh = maxh
+                self.maxdep = maxdep
+                self.diff_flux = diff_flux
+                self.diff_cfl = diff_cfl
+                return
+
+            # Nodes computed on other partitions should not take part in the reduction
+            self._mask_nonlocal(globalIDs, [base, receivers, maxh, maxdep, diff_flux])
+
+            # Send local network globally
+            self._reduce_network(base, receivers, [maxh, maxdep, diff_flux, diff_cfl],
+                                 [mpi.MAX]*3 + [mpi.MIN])
+            self.maxh = maxh
+            self.maxdep = maxdep
+            self.diff_flux = diff_flux
+            self.diff_cfl = diff_cfl
 
-            # Send local base level globally
-            self._comm.Allreduce(mpi.IN_PLACE,base,op=mpi.MAX)
-            bpos = numpy.where(base >= 0)[0]
-            self.base = base[bpos]
-            numpy.random.shuffle(self.base)
+    def distribute_basins(self):
+        """
+        Distribute the drainage basins to the processors. Basins are never split between
+        partitions and their cost is proportional to their number of nodes. The number of
+        nodes of each basin measured on the previous step stacks is used to balance the work
+        with a greedy longest-processing-time first algorithm: the basins are taken from the
+        largest to the smallest and each of them is given to the least loaded processor.
+
+        Basins which were not found on the previous step are given the mean size of the
+        known ones. On the first step the basins are split evenly by number.
+        """
 
-            # Send local receivers globally
-            self._comm.Allreduce(mpi.IN_PLACE,receivers,op=mpi.MAX)
-            self.receivers = receivers
+        self._complete_basins()
 
-            # Send local maximum height globally
-            self._comm.Allreduce(mpi.IN_PLACE,maxh,op=mpi.MAX)
-            self.maxh = maxh
+        if self._size == 1 or self.basinWork is None:
+            splits = numpy.array_split(self.base, self._size)
+            self.localbase = splits[self._rank]
+            self.basinCounts = numpy.array([len(s) for s in splits])
+            return
 
-            # Send local maximum deposition globally
-            self._comm.Allreduce(mpi.IN_PLACE,maxdep,op=mpi.MAX)
-            self.maxdep = maxdep
+        weights = self.basinWork[self.base]
+        known = weights > 0
+        if known.any():
+            weights[~known] = weights[known].mean()
+        else:
+            weights[:] = 1.
 
-            # Send local diffusion flux globally
-            self._comm.Allreduce(mpi.IN_PLACE,diff_flux,op=mpi.MAX)
-            self.diff_flux = diff_flux
+        # Ordering is identical on all processors so they all find the same distribution
+        order = numpy.lexsort((self.base, -weights))
+        owner = numpy.empty(len(self.base), dtype=int)
+        loads = [(0., p) for p in range(self._size)]
+        for b in order:
+            load, p = heapq.heappop(loads)
+            owner[b] = p
+            heapq.heappush(loads, (load + weights[b], p))
 
-            # Send local diffusion CFL condition globally
-            self._comm.Allreduce(mpi.IN_PLACE,diff_cfl,op=mpi.MIN)
-            self.diff_cfl = diff_cfl
+        self.localbase = self.base[owner == self._rank]
+        self.basinCounts = numpy.bincount(owner, minlength=self._size)
+
+        return
 
-    def _donors_number_array(self):
+    def record_basins(self):
         """
-        Creates an array containing the number of donors for each node.
+        Store the number of nodes of each drainage basin from the local stacks on all
+        processors. These sizes are used to balance the basins distribution of the next
+        step and to measure the work imbalance between processors (maximum over mean
+        number of stack nodes). Only the outlet and size of the local basins are gathered,
+        the number of basins of each processor being already known from their distribution.
+        The gather is only completed when the sizes are needed.
         """
 
-        self.arrdonor = None
-        numPts = len(self.receivers)
-        self.arrdonor = numpy.zeros(numPts, dtype=int)
-        maxID = numpy.max(self.receivers)
-        self.arrdonor[:(maxID+1)] = numpy.bincount(self.receivers)
-        self.maxdonors = self.arrdonor.max()
+        if self._size == 1:
+            return
+
+        sizes = numpy.diff(numpy.append(self.localbasins, len(self.localstack)))
+        pairs = numpy.column_stack((self.localbase, sizes)).astype(numpy.int32).ravel()
+        counts = 2 * numpy.asarray(self.basinCounts, dtype=int)
+        gathered = numpy.empty(counts.sum(), dtype=numpy.int32)
+        request = self._comm.Iallgatherv([pairs, mpi.INT], [gathered, (counts, None), mpi.INT])
+        self._pendingBasins = request, gathered, counts // 2, len(self.receivers)
 
         return
 
-    def _delta_array(self):
+    def _complete_basins(self):
         """
-        Creates the "delta" array, which is a list containing, for each
-        node, the array index where that node's donor list begins.
+        Complete the reduction of the drainage basins sizes started by record_basins.
         """
 
-        self.delta = None
-        nbdonors = len(self.arrdonor)
-        self.delta = numpy.zeros( nbdonors+1, dtype=int)
-        self.delta.fill(nbdonors)
-        self.delta[-2::-1] -= numpy.cumsum(self.arrdonor[::-1])
+        if self._pendingBasins is None:
+            return
 
-        return
+        request, gathered, nbasins, numPts = self._pendingBasins
+        request.Wait()
+        self._pendingBasins = None
+
+        # Sizes measured on a previous mesh are discarded
+        if self.receivers is None or numPts != len(self.receivers):
+            return
+
+        pairs = gathered.reshape(-1, 2)
+        self.basinWork = numpy.zeros(numPts)
+        self.basinWork[pairs[:,0]] = pairs[:,1]
+        owner = numpy.repeat(numpy.arange(self._size), nbasins)
+        loads = numpy.bincount(owner, weights=pairs[:,1], minlength=self._size)
+        if loads.sum() > 0:
+            self.imbalance = loads.max() / loads.mean()
+
+    def basins_imbalance(self):
+        """
+        Return the work imbalance between processors (maximum over mean number of stack
+        nodes) of the last computed flow network.
+        """
+
+        self._complete_basins()
+
+        return self.imbalance
 
     def ordered_node_array(self):
         """
         Creates an array of node IDs that is arranged in order from downstream
         to upstream.
-        """
-
-        # Build donors array for each node
-        self._donors_number_array()
 
-        # Create the delta array
-        self._delta_array()
+        The number of donors, the "delta" array (for each node the array index where
+        its donor list begins) and the donors array are built in a single call to
+        libUtils together with the local stack. The stack is a concatenation of the
+        local drainage basins and the position where each of them begins is kept
+        so that the flow accumulation kernels can process the basins concurrently, the
+        largest ones first.
+        """
 
         # Using libUtils stack create the ordered node array
-        self.donors,lstcks = FLWnetwork.fstack.build(self.localbase,self.receivers,self.delta)
+        self.delta, self.donors, lstcks, self.localbasins, stackNb, self.maxdonors = \
+            FLWnetwork.fstack.build(self.localbase, self.receivers)
 
         # Create local stack
-        stids = numpy.where(lstcks > -1 )[0]
-        self.localstack = lstcks[stids]
+        self.localstack = lstcks[:stackNb]
+
+        # Basins ordered by decreasing size to balance the threads
+        sizes = numpy.diff(numpy.append(self.localbasins, stackNb))
+        self.basinorder = numpy.argsort(-sizes, kind='mergesort').astype(numpy.int32)
 
         return
 
@@ -288,6 +707,10 @@ class flowNetwork:
         """
         Calculates the drainage area and water discharge at each node.
 
+        Each partition only accumulates the discharge of the drainage basins it owns
+        (defined by its local base levels). Basins are never split between processors,
+        so the values are only exact on the local stack nodes and are set to 0 elsewhere.
+
         Parameters
         ----------
         variable : Acell
@@ -300,11 +723,20 @@ class flowNetwork:
         numPts = len(Acell)
 
         self.discharge = numpy.zeros(numPts, dtype=float)
-        self.discharge[self.stack] = Acell[self.stack] * rain[self.stack]
+        self.discharge[self.localstack] = Acell[self.localstack] * rain[self.localstack]
 
         # Compute discharge using libUtils
-        self.discharge = FLOWalgo.flowcompute.discharge(self.localstack, self.receivers, self.discharge)
-        self._comm.Allreduce(mpi.IN_PLACE, self.discharge, op=mpi.MAX)
+        self.discharge = FLOWalgo.flowcompute.discharge(self.localstack, self.localbasins, self.basinorder, self.receivers, self.discharge)
+
+    def gather_discharge(self):
+        """
+        Combine the discharge computed on each partition drainage basins globally.
+        This is only required when the discharge is needed outside the local basins
+        (e.g. for output).
+        """
+
+        if self._size > 1:
+            self._comm.Allreduce(mpi.IN_PLACE, self.discharge, op=mpi.MAX)
 
     def compute_parameters(self):
         """
@@ -319,14 +751,13 @@ class flowNetwork:
         # Get basin starting IDs for each local partition
         cumbase = numpy.zeros(size+1)
         for i in range(size):
-            cumbase[i+1] = len(numpy.array_split(self.base, size)[i])+cumbase[i]+1
+            cumbase[i+1] = self.basinCounts[i]+cumbase[i]+1
 
         # Compute discharge using libUtils
         splexp = self.m / self.n
-        chi, basinID = FLOWalgo.flowcompute.parameters(self.localstack,self.receivers,
+        chi, basinID = FLOWalgo.flowcompute.parameters(self.localstack,self.localbasins,self.basinorder,self.receivers,
                                                self.discharge,self.xycoords,splexp,cumbase[rank])
-        comm.Allreduce(mpi.IN_PLACE,chi,op=mpi.MAX)
-        comm.Allreduce(mpi.IN_PLACE,basinID,op=mpi.MAX)
+        self._reduce([chi, basinID], [mpi.MAX, mpi.MAX])
 
         self.chi = chi
         self.basinID = basinID
@@ -376,35 +807,41 @@ class flowNetwork:
 
         # Parallel case
         if(size > 1):
+            # Purely erosive case solved implicitly
+            if self.spl and self.depo == 0 and self.implicit:
+                sedflux, newdt = FLOWalgo.flowcompute.sedflux_ero_implicit(self.localstack,self.localbasins,self.basinorder,self.receivers, \
+                                      self.xycoords,xymin,xymax,self.discharge,elev, \
+                                      diff_flux,self.erodibility,self.m,self.n,sealevel,dt)
+
             # Purely erosive case
-            if self.spl and self.depo == 0:
-                sedflux, newdt = FLOWalgo.flowcompute.sedflux_ero_only(self.localstack,self.receivers, \
+            elif self.spl and self.depo == 0:
+                sedflux, newdt = FLOWalgo.flowcompute.sedflux_ero_only(self.localstack,self.localbasins,self.basinorder,self.receivers, \
                                       self.xycoords,xymin,xymax,self.discharge,elev, \
                                       diff_flux,self.erodibility,self.m,self.n,sealevel,dt)
 
             # Stream power law and mass is not conserved
             elif self.spl and self.filter:
-                sedflux, newdt = FLOWalgo.flowcompute.sedflux_nocapacity_quick(self.localstack,self.receivers, \
+                sedflux, newdt = FLOWalgo.flowcompute.sedflux_nocapacity_quick(self.localstack,self.localbasins,self.basinorder,self.receivers, \
                          self.xycoords,Acell,xymin,xymax,self.discharge,elev,diff_flux,self.erodibility, \
                          self.m,self.n,sealevel,dt)
 
             # Stream power law
             elif self.spl:
-                sedflux, newdt = FLOWalgo.flowcompute.sedflux_nocapacity(self.localstack,self.receivers,self.xycoords, \
+                sedflux, newdt = FLOWalgo.flowcompute.sedflux_nocapacity(self.localstack,self.localbasins,self.basinorder,self.receivers,self.xycoords, \
                          Acell,xymin,xymax,self.maxh,self.maxdep,self.discharge,fillH,elev,diff_flux, \
                          self.erodibility,self.m,self.n,sealevel,dt)
 
             # River carrying capacity case
             else:
-                sedflux, newdt = FLOWalgo.flowcompute.sedflux_capacity(self.localstack,self.receivers,self.xycoords,\
+                sedflux, newdt = FLOWalgo.flowcompute.sedflux_capacity(self.localstack,self.localbasins,self.basinorder,self.receivers,self.xycoords,\
                          Acell,xymin,xymax,self.discharge,elev,diff_flux,cumdiff,self.erodibility, \
                          self.m,self.n,self.bedrock,self.alluvial,sealevel,dt)
 
+            # Time step and sediment flux are reduced together in a blocking call
             timestep = numpy.zeros(1)
             timestep[0] = newdt
-            comm.Allreduce(mpi.IN_PLACE,timestep,op=mpi.MIN)
+            self._reduce([sedflux, timestep], [mpi.MAX, mpi.MIN])
             newdt = timestep[0]
-            comm.Allreduce(mpi.IN_PLACE,sedflux,op=mpi.MAX)
             tempIDs = numpy.where(sedflux < -9.5e5)
             sedflux[tempIDs] = 0.
             newdt = max(self.mindt,newdt)
@@ -412,27 +849,33 @@ class flowNetwork:
 
         # Serial case
         else:
+            # Purely erosive case solved implicitly
+            if self.spl and self.depo == 0 and self.implicit:
+                sedflux, newdt = FLOWalgo.flowcompute.sedflux_ero_implicit(self.localstack,self.localbasins,self.basinorder,self.receivers, \
+                                      self.xycoords,xymin,xymax,self.discharge,elev, \
+                                      diff_flux,self.erodibility,self.m,self.n,sealevel,dt)
+
             # Purely erosive case
-            if self.spl and self.depo == 0:
-                sedflux, newdt = FLOWalgo.flowcompute.sedflux_ero_only(self.localstack,self.receivers, \
+            elif self.spl and self.depo == 0:
+                sedflux, newdt = FLOWalgo.flowcompute.sedflux_ero_only(self.localstack,self.localbasins,self.basinorder,self.receivers, \
                                       self.xycoords,xymin,xymax,self.discharge,elev, \
                                       diff_flux,self.erodibility,self.m,self.n,sealevel,dt)
 
             # Stream power law and mass is not conserved
             elif self.spl and self.filter:
-                sedflux, newdt = FLOWalgo.flowcompute.sedflux_nocapacity_quick(self.localstack,self.receivers, \
+                sedflux, newdt = FLOWalgo.flowcompute.sedflux_nocapacity_quick(self.localstack,self.localbasins,self.basinorder,self.receivers, \
                          self.xycoords,Acell,xymin,xymax,self.discharge,elev,diff_flux,self.erodibility, \
                          self.m,self.n,sealevel,dt)
 
             # Stream power law
             elif self.spl:
-                sedflux, newdt = FLOWalgo.flowcompute.sedflux_nocapacity(self.localstack,self.receivers,self.xycoords, \
+                sedflux, newdt = FLOWalgo.flowcompute.sedflux_nocapacity(self.localstack,self.localbasins,self.basinorder,self.receivers,self.xycoords, \
                          Acell,xymin,xymax,self.maxh,self.maxdep,self.discharge,fillH,elev,diff_flux, \
                          self.erodibility,self.m,self.n,sealevel,dt)
 
             # River carrying capacity case
             else:
-                sedflux, newdt = FLOWalgo.flowcompute.sedflux_capacity(self.localstack,self.receivers,self.xycoords,\
+                sedflux, newdt = FLOWalgo.flowcompute.sedflux_capacity(self.localstack,self.localbasins,self.basinorder,self.receivers,self.xycoords,\
                          Acell,xymin,xymax,self.discharge,elev,diff_flux,cumdiff,self.erodibility, \
                          self.m,self.n,self.bedrock,self.alluvial,sealevel,dt)
 
@@ -455,6 +898,37 @@ class flowNetwork:
             Numpy arrays containing the erosion and deposition thicknesses.
         """
 
+        if self.tin2grid is None:
+            self._build_filter_operators()
+
+        if len(diff.shape) > 1:
+            diff = diff[:,0]
+
+        depZ = numpy.copy(diff)
+        depZ = depZ.clip(0.)
+
+        eroZ = numpy.copy(diff)
+        eroZ = eroZ.clip(max=0.)
+
+        depzi = numpy.reshape(self.tin2grid.dot(depZ),(len(self.ygrid),len(self.xgrid)))
+        erozi = numpy.reshape(self.tin2grid.dot(eroZ),(len(self.ygrid),len(self.xgrid)))
+
+        smthDep = gaussian_filter(depzi, sigma=self.dsmooth)
+        smthEro = gaussian_filter(erozi, sigma=self.esmooth)
+
+        zdepsmth = self.grid2tin.dot(smthDep.ravel())
+        zerosmth = self.grid2tin.dot(smthEro.ravel())
+
+        return zdepsmth + zerosmth
+
+    def _build_filter_operators(self):
+        """
+        Build the sparse interpolation matrices used by the gaussian filter to map
+        values from the TIN nodes to the regular grid (inverse distance weighting of
+        the 3 closest nodes) and back (bilinear interpolation). The matrices only
+        depend on the nodes coordinates and are reset when the TIN is rebuilt.
+        """
+
         K = 3
 
         if self.xgrid is None:
@@ -472,12 +946,6 @@ class flowNetwork:
             self.localxyi = splits[self._rank]
             self.query_shape = (xyi.shape[0], K)
 
-        depZ = numpy.copy(diff)
-        depZ = depZ.clip(0.)
-
-        eroZ = numpy.copy(diff)
-        eroZ = eroZ.clip(max=0.)
-
         tree = cKDTree(self.xycoords[:,:2])
 
         # Querying the KDTree is rather slow, so we split it across MPI nodes
@@ -495,34 +963,35 @@ class flowNetwork:
         distances = distances_flat.reshape(self.query_shape)
         indices = indices_flat.reshape(self.query_shape)
 
-        if len(depZ[indices].shape) == 3:
-            zd_vals = depZ[indices][:,:,0]
-            ze_vals = eroZ[indices][:,:,0]
-        else:
-            zd_vals = depZ[indices]
-            ze_vals = eroZ[indices]
-        zdi = numpy.average(zd_vals,weights=(1./distances), axis=1)
-        zei = numpy.average(ze_vals,weights=(1./distances), axis=1)
-
+        # Inverse distance weights, grid points lying on a node (or on several duplicated
+        # nodes) take the value of the closest one
         onIDs = numpy.where(distances[:,0] == 0)[0]
-        if len(onIDs) > 0:
-            zdi[onIDs] = depZ[indices[onIDs,0]]
-            zei[onIDs] = eroZ[indices[onIDs,0]]
-
-        depzi = numpy.reshape(zdi,(len(self.ygrid),len(self.xgrid)))
-        erozi = numpy.reshape(zei,(len(self.ygrid),len(self.xgrid)))
-
-        smthDep = gaussian_filter(depzi, sigma=self.dsmooth)
-        smthEro = gaussian_filter(erozi, sigma=self.esmooth)
+        distances[onIDs] = 1.
+        weights = 1./distances
+        weights[onIDs,1:] = 0.
+        weights /= weights.sum(axis=1)[:,None]
+        nGrid = self.query_shape[0]
+        nPts = len(self.xycoords)
+        rows = numpy.repeat(numpy.arange(nGrid), K)
+        self.tin2grid = sparse.csr_matrix((weights.ravel(), (rows, indices.ravel())),
+                                          shape=(nGrid, nPts))
+
+        # Bilinear weights of the grid cell containing each node
+        nx = len(self.xgrid)
+        ny = len(self.ygrid)
+        ix = numpy.clip(numpy.searchsorted(self.xgrid, self.xycoords[:,0]) - 1, 0, nx - 2)
+        iy = numpy.clip(numpy.searchsorted(self.ygrid, self.xycoords[:,1]) - 1, 0, ny - 2)
+        wx = (self.xycoords[:,0] - self.xgrid[ix]) / (self.xgrid[ix+1] - self.xgrid[ix])
+        wy = (self.xycoords[:,1] - self.ygrid[iy]) / (self.ygrid[iy+1] - self.ygrid[iy])
+        cols = numpy.column_stack((iy*nx + ix, iy*nx + ix + 1, (iy+1)*nx + ix, (iy+1)*nx + ix + 1))
+        vals = numpy.column_stack(((1.-wy)*(1.-wx), (1.-wy)*wx, wy*(1.-wx), wy*wx))
+        rows = numpy.repeat(numpy.arange(nPts), 4)
+        self.grid2tin = sparse.csr_matrix((vals.ravel(), (rows, cols.ravel())),
+                                          shape=(nPts, nGrid))
 
-        rgi_dep = RegularGridInterpolator((self.ygrid, self.xgrid), smthDep)
-        zdepsmth = rgi_dep((self.xycoords[:,1],self.xycoords[:,0]))
-        rgi_ero = RegularGridInterpolator((self.ygrid, self.xgrid), smthEro)
-        zerosmth = rgi_ero((self.xycoords[:,1],self.xycoords[:,0]))
-
-        return zdepsmth + zerosmth
+        return
 
-    def dt_stability(self, elev, locIDs):
+    def dt_stability(self, elev, locIDs, globalmin=True):
         """
         This function computes the maximal timestep to ensure computation stability
         of the flow processes. This CFL-like condition is computed using erodibility
@@ -535,7 +1004,12 @@ class flowNetwork:
             Numpy arrays containing the elevation of the TIN nodes.
 
         variable: locIDs
-            Numpy integer-type array containing for local nodes their global IDs.
+            Numpy integer-type array containing the IDs of the nodes where the discharge is known
+            on the partition (i.e. the local stack).
+
+        variable : globalmin
+            Boolean set to False when the global minimum is taken by the caller together with
+            the other stability conditions.
         """
 
         # Initialise MPI communications
@@ -550,5 +1024,6 @@ class flowNetwork:
         # Global mimimum value for diffusion stability
         CFL = numpy.zeros(1)
         CFL[0] = dt
-        comm.Allreduce(mpi.IN_PLACE,CFL,op=mpi.MIN)
+        if globalmin:
+            comm.Allreduce(mpi.IN_PLACE,CFL,op=mpi.MIN)
         self.CFL = CFL[0]
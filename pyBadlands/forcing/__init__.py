@@ -12,5 +12,8 @@
 """
 
 import xmlParser
+import forceArchive
+import forcePrefetch
+import oroRain
 import forceSim
 import isoFlex
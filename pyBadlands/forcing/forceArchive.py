@@ -0,0 +1,291 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module defines the forcing archive: a single HDF5 file containing the rain and displacement
+maps of all the events as time-indexed stacks. For each kind of forcing (rain and disp) the file
+contains the following datasets:
+    - time: start and end times of the events,
+    - index: position of each event map in the stacks (-1 for events without map),
+    - grid: maps on the regular grid (map, column, node),
+    - tin: maps interpolated on the TIN nodes (map, column, node), optional.
+
+The archive is built from an XmL input file with:
+
+    python -m pyBadlands.forcing.forceArchive [--notin] input.xml archive.h5
+"""
+
+import sys
+import h5py
+import numpy
+import hashlib
+import argparse
+from pyBadlands.surface import gridFile
+from pyBadlands.surface import interpTIN
+
+# Number of nodes in each chunk of the stacks
+CHUNK_NODES = 262144
+
+def tin_hash(tXY):
+    """
+    This function computes the hash of the TIN nodes coordinates used to check that maps
+    interpolated on the TIN can be used by a simulation.
+
+    Parameters
+    ----------
+    variable : tXY
+        Numpy float-type array containing the coordinates of the TIN nodes.
+
+    Return
+    ----------
+    variable: hash
+        String containing the hash of the coordinates.
+    """
+
+    xy = numpy.ascontiguousarray(tXY[:,:2], dtype=numpy.float64)
+
+    return hashlib.sha1(xy.tobytes()).hexdigest()
+
+def _write_stack(group, name, maps, ncols):
+    """
+    Create a chunked stack of maps.
+
+    Parameters
+    ----------
+    variable : group
+        HDF5 group of the forcing.
+
+    string : name
+        Name of the dataset.
+
+    variable : maps
+        List of numpy arrays (column, node) containing the maps.
+
+    variable : ncols
+        Number of columns of each map.
+    """
+
+    nodes = maps[0].shape[1]
+    dset = group.create_dataset(name, (len(maps), ncols, nodes), dtype=numpy.float64,
+                                chunks=(1, 1, min(nodes, CHUNK_NODES)))
+    for m in range(len(maps)):
+        dset[m] = maps[m]
+
+    return
+
+def build_archive(xmlfile, archive, tin=True, verbose=False):
+    """
+    This function builds the forcing archive from the rain and displacement maps defined in an
+    XmL input file.
+
+    Parameters
+    ----------
+    string : xmlfile
+        The XmL input file name.
+
+    string : archive
+        The forcing archive file name.
+
+    variable : tin
+        Boolean defining if the maps are also interpolated on the TIN nodes.
+
+    variable : verbose
+        Boolean printing the archived maps.
+    """
+
+    from pyBadlands.forcing import xmlParser
+    from pyBadlands.surface import raster2TIN
+
+    input = xmlParser.xmlParser(xmlfile, makeUniqueOutputDir=False)
+    recGrid = raster2TIN.raster2TIN(input.demfile, areaDelFactor=input.Afactor,
+                                    reorder=input.reorder)
+    shape = (len(recGrid.regX), len(recGrid.regY))
+    tXY = recGrid.tinMesh['vertices']
+    bPts = recGrid.boundsPt
+    interp = interpTIN.interpTIN(recGrid.regX, recGrid.regY, tXY[bPts:,:2])
+
+    with h5py.File(archive, 'w') as f:
+        f.attrs['nx'] = shape[0]
+        f.attrs['ny'] = shape[1]
+        if tin:
+            f.attrs['tinhash'] = tin_hash(tXY)
+
+        for kind, times, files in [('rain', input.rainTime, input.rainMap),
+                                   ('disp', input.tectTime, input.tectFile)]:
+            group = f.create_group(kind)
+            if files is None:
+                files = [None] * len(times)
+            ncols = 3 if kind == 'disp' and input.disp3d else 1
+            index = numpy.zeros(len(times), dtype=numpy.int32)
+            index.fill(-1)
+            gmaps = []
+            tmaps = []
+            for event in range(len(times)):
+                if files[event] is None:
+                    continue
+                data = gridFile.read_grid(str(files[event]))
+                if data.shape[0] != shape[0]*shape[1] or data.shape[1] < ncols:
+                    raise ValueError('The map %s does not match the DEM regular grid.'%files[event])
+                index[event] = len(gmaps)
+                gmaps.append(numpy.array(data[:,:ncols].T))
+                if tin:
+                    tmap = numpy.zeros((ncols, len(tXY)))
+                    tmap[:,bPts:] = interp.apply(data[:,:ncols]).T
+                    tmaps.append(tmap)
+                if verbose:
+                    print kind, event, files[event]
+            group.create_dataset('time', data=numpy.array(times, dtype=numpy.float64))
+            group.create_dataset('index', data=index)
+            if len(gmaps) > 0:
+                _write_stack(group, 'grid', gmaps, ncols)
+                if tin:
+                    _write_stack(group, 'tin', tmaps, ncols)
+
+    return
+
+class forceArchive:
+    """
+    This class reads the forcing archive during the simulation. Only the map of the requested
+    event is read and, when the archive has been built for the simulation TIN, only the nodes
+    of the partition.
+
+    Parameters
+    ----------
+    string : filename
+        The forcing archive file name.
+
+    float : TimeRain
+        Numpy array containing the start and end times for each rain event in years.
+
+    string : MapRain
+        Numpy array containing the rain map file names.
+
+    float : TimeDisp
+        Numpy array containing the start and end times for each displacement period in years.
+
+    string : MapDisp
+        Numpy array containing the cumulative displacement map file names.
+    """
+
+    def __init__(self, filename, TimeRain, MapRain, TimeDisp, MapDisp):
+
+        self.filename = filename
+        self.file = h5py.File(filename, 'r')
+        self.tinhash = self.file.attrs.get('tinhash', None)
+
+        # The archive events need to match the XmL ones
+        for kind, times, files in [('rain', TimeRain, MapRain), ('disp', TimeDisp, MapDisp)]:
+            if files is None:
+                files = [None] * len(times)
+            atimes = self.file[kind+'/time'][...]
+            index = self.file[kind+'/index'][...]
+            maps = numpy.array([m is not None for m in files], dtype=bool)
+            if atimes.shape != times.shape or not numpy.allclose(atimes, times) \
+                    or not numpy.array_equal(index >= 0, maps):
+                raise ValueError('The forcing archive %s does not match the XmL %s events.'%(filename, kind))
+
+    def match_tin(self, tXY):
+        """
+        Check if the maps interpolated on the TIN can be used.
+
+        Parameters
+        ----------
+        variable : tXY
+            Numpy float-type array containing the coordinates of the TIN nodes.
+
+        Return
+        ----------
+        variable: match
+            Boolean set to True when the archive has been built for this TIN.
+        """
+
+        return self.tinhash is not None and self.tinhash == tin_hash(tXY)
+
+    def read_grid(self, kind, event):
+        """
+        Read the map of an event on the regular grid.
+
+        Parameters
+        ----------
+        string : kind
+            Forcing name (rain or disp).
+
+        variable : event
+            Event number.
+
+        Return
+        ----------
+        variable: data
+            Numpy array (node, column) containing the map.
+        """
+
+        row = self.file[kind+'/index'][event]
+
+        return self.file[kind+'/grid'][row].T
+
+    def read_tin(self, kind, event, ids):
+        """
+        Read the map of an event on a set of TIN nodes. The sorted nodes are grouped by chunk
+        of the stack and only the span of each group within its chunk is read, so that the
+        chunks between distant nodes are skipped.
+
+        Parameters
+        ----------
+        string : kind
+            Forcing name (rain or disp).
+
+        variable : event
+            Event number.
+
+        variable : ids
+            Numpy integer-type array containing the IDs of the TIN nodes.
+
+        Return
+        ----------
+        variable: data
+            Numpy array (node, column) containing the map.
+        """
+
+        row = self.file[kind+'/index'][event]
+        dset = self.file[kind+'/tin']
+        step = dset.chunks[2] if dset.chunks is not None else dset.shape[2]
+
+        order = numpy.argsort(ids, kind='mergesort')
+        sids = ids[order]
+        cuts = numpy.flatnonzero(numpy.diff(sids // step)) + 1
+        starts = numpy.append(0, cuts)
+        ends = numpy.append(cuts, len(sids))
+
+        data = numpy.empty((len(ids), dset.shape[1]), dtype=dset.dtype)
+        if len(ids) == 0:
+            return data
+        for s, e in zip(starts, ends):
+            lo = sids[s]
+            hi = sids[e-1] + 1
+            data[order[s:e]] = dset[row,:,lo:hi][:,sids[s:e]-lo].T
+
+        return data
+
+def main(args=None):
+    """
+    Command line interface building the forcing archive of an XmL input file.
+    """
+
+    parser = argparse.ArgumentParser(description='Build a Badlands forcing archive.')
+    parser.add_argument('xmlfile', help='XmL input file defining the forcing events')
+    parser.add_argument('archive', help='HDF5 forcing archive file')
+    parser.add_argument('--notin', action='store_true',
+                        help='only store the maps on the regular grid')
+    args = parser.parse_args(args)
+
+    build_archive(args.xmlfile, args.archive, not args.notin, True)
+
+    return
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
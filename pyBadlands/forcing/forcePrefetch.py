@@ -0,0 +1,145 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module loads the maps of the upcoming forcing events on a background thread while the
+current time interval is computed.
+"""
+
+import sys
+import Queue
+import threading
+
+class forcePrefetch:
+    """
+    This class holds the forcing maps loaded ahead of time. Each map is identified by a key
+    and loaded by a function run on the background thread. The number of maps held is bounded
+    by the caller which releases the maps no longer needed.
+
+    Parameters
+    ----------
+    variable : ahead
+        Number of upcoming events loaded ahead for each forcing.
+    """
+
+    def __init__(self, ahead):
+
+        self.ahead = ahead
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.tasks = Queue.Queue()
+
+        self.thread = threading.Thread(target=self._worker)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _worker(self):
+        """
+        Background thread loading the scheduled maps.
+        """
+
+        while True:
+            key, entry, func = self.tasks.get()
+            with self.lock:
+                cancelled = self.entries.get(key) is not entry
+            if not cancelled:
+                # Errors are raised again when the map is requested by the main thread
+                try:
+                    entry['result'] = func()
+                except Exception:
+                    entry['error'] = sys.exc_info()
+            entry['done'].set()
+
+    def schedule(self, key, func):
+        """
+        Schedule the loading of a map.
+
+        Parameters
+        ----------
+        variable : key
+            Map identifier.
+
+        variable : func
+            Function without argument returning the map.
+        """
+
+        with self.lock:
+            if key in self.entries:
+                return
+            entry = {'done': threading.Event(), 'result': None, 'error': None}
+            self.entries[key] = entry
+        self.tasks.put((key, entry, func))
+
+        return
+
+    def put(self, key, result):
+        """
+        Hold a map loaded by the main thread.
+
+        Parameters
+        ----------
+        variable : key
+            Map identifier.
+
+        variable : result
+            Map to hold.
+        """
+
+        entry = {'done': threading.Event(), 'result': result, 'error': None}
+        entry['done'].set()
+        with self.lock:
+            self.entries[key] = entry
+
+        return
+
+    def release(self, keep, kind):
+        """
+        Remove the maps of a forcing which are not in the keep list.
+
+        Parameters
+        ----------
+        variable : keep
+            List of the map identifiers to keep.
+
+        string : kind
+            Forcing name, first element of the map identifiers.
+        """
+
+        with self.lock:
+            for key in self.entries.keys():
+                if key[0] == kind and key not in keep:
+                    del self.entries[key]
+
+        return
+
+    def get(self, key):
+        """
+        Get a map, waiting for the background thread if it is still loading. The error raised
+        by the loading function, if any, is raised again.
+
+        Parameters
+        ----------
+        variable : key
+            Map identifier.
+
+        Return
+        ----------
+        variable: result
+            Map returned by the loading function or None when the map has not been scheduled.
+        """
+
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        entry['done'].wait()
+        if entry['error'] is not None:
+            etype, value, trace = entry['error']
+            raise etype, value, trace
+
+        return entry['result']
@@ -15,8 +15,12 @@ import numpy
 import pandas
 import triangle
 import mpi4py.MPI as mpi
-from pyBadlands.libUtils import ORmodel
-from scipy.ndimage.filters import gaussian_filter
+from pyBadlands.surface import reorderTIN
+from pyBadlands.surface import gridFile
+from pyBadlands.surface import interpTIN
+from pyBadlands.forcing import forceArchive
+from pyBadlands.forcing import forcePrefetch
+from pyBadlands.forcing import oroRain
 from scipy import interpolate
 from scipy.spatial import cKDTree
 
@@ -91,19 +95,28 @@ class forceSim:
 
     float : Tdisplay
         Display interval (in years).
+
+    string : archive
+        Path to the forcing archive containing the rain and displacement maps (if any).
+
+    integer : prefetch
+        Number of upcoming rain and displacement maps loaded ahead on a background thread.
+
+    integer : orfactor
+        Coarsening factor of the orographic rain grid relative to the regular input grid.
     """
 
     def __init__(self, seafile = None, sea0 = 0., MapRain = None, TimeRain = None, ValRain = None,
                  orographic = None, rbgd = None, rmin = None, rmax = None, windx = None, windy = None,
                  tauc = None, tauf = None, nm = None, cw = None, hw = None, ortime = None, MapDisp = None,
-                 TimeDisp = None, regX = None, regY = None, Tdisplay = 0.):
+                 TimeDisp = None, regX = None, regY = None, Tdisplay = 0., archive = None,
+                 prefetch = 0, orfactor = 1):
 
         self.regX = regX
         self.regY = regY
-        self.xi, self.yi = numpy.meshgrid(regX, regY, indexing='xy')
-        self.xyi = numpy.dstack([self.xi.flatten(), self.yi.flatten()])[0]
         self.tree = None
         self.dx = None
+        self.interp = None
 
         self.Map_rain = MapRain
         self.rainVal = ValRain
@@ -122,10 +135,26 @@ class forceSim:
         self.ortime = ortime
         self.next_rain = None
 
+        # Orographic precipitation model
+        self.oroRain = None
+        if orographic is not None and orographic.any():
+            self.oroRain = oroRain.oroRain(regX, regY, orfactor)
+
         self.Map_disp = MapDisp
         self.T_disp = TimeDisp
         self.next_disp = None
 
+        self.archive = None
+        self.onTIN = False
+        if archive is not None:
+            self.archive = forceArchive.forceArchive(archive, TimeRain, MapRain, TimeDisp, MapDisp)
+
+        # Background loading of the upcoming maps
+        self.prefetch = None
+        maps = [m for m in (MapRain, MapDisp) if m is not None]
+        if prefetch > 0 and any(f is not None for m in maps for f in m):
+            self.prefetch = forcePrefetch.forcePrefetch(prefetch)
+
         self.sea0 = sea0
         self.seafile = seafile
         self.sealevel = None
@@ -199,8 +228,181 @@ class forceSim:
         self.tree = cKDTree(self.tXY)
         self.dx = self.tXY[1,0] - self.tXY[0,0]
 
+        # Regular grid to TIN interpolation operator shared by the maps loaders
+        self.interp = interpTIN.interpTIN(self.regX, self.regY, self.tXY)
+        if self.oroRain is not None:
+            self.oroRain.update_mesh(self.tXY, self.tree, self.interp)
+
+        # Maps interpolated on the TIN are only valid before any 3D displacements
+        if self.archive is not None:
+            self.onTIN = self.archive.match_tin(self.tXY)
+
         return
 
+    def _read_map(self, kind, event, filename):
+        """
+        Read the map of an event on the regular grid either from the forcing archive or from its file.
+
+        Parameters
+        ----------
+        string : kind
+            Forcing name (rain or disp).
+
+        integer : event
+            Event number.
+
+        string : filename
+            Map file name.
+
+        Return
+        ----------
+        variable: data
+            Numpy 2D array containing the map columns.
+        """
+
+        if self.archive is not None:
+            return self.archive.read_grid(kind, event)
+
+        return gridFile.read_grid(str(filename))
+
+    def _load_event(self, kind, event, ncols, ids, interp, onTIN, sub=None):
+        """
+        Load the map of an event and interpolate it on the partition nodes. This function is also
+        run by the prefetching thread and only uses its arguments to define the TIN. The operator
+        restricted to the partition nodes is then given as the thread must not update the subset
+        cached by interp.
+
+        Parameters
+        ----------
+        string : kind
+            Forcing name (rain or disp).
+
+        integer : event
+            Event number.
+
+        integer : ncols
+            Number of map columns.
+
+        integer : ids
+            List of unstructured vertices contained in each partition.
+
+        variable : interp
+            Regular grid to TIN interpolation operator.
+
+        boolean : onTIN
+            Flag to read the map interpolated on the TIN from the forcing archive.
+
+        variable : sub
+            Interpolation operator restricted to the partition nodes or None to use the subset
+            cached by interp.
+
+        Return
+        ----------
+        variable: emap
+            Dictionary containing the map on the regular grid (None when read on the TIN) and on
+            the partition nodes, with the operator and the nodes used for the interpolation.
+        """
+
+        if onTIN:
+            data = None
+            tin = self.archive.read_tin(kind, event, ids)
+        else:
+            files = self.Map_rain if kind == 'rain' else self.Map_disp
+            data = self._read_map(kind, event, files[event])[:,:ncols]
+            if sub is None:
+                tin = interp.apply(data, ids)
+            else:
+                tin = sub.apply(data)
+
+        return {'interp': interp, 'ids': ids, 'data': data, 'tin': tin}
+
+    def _schedule_events(self, kind, event, ncols, ids):
+        """
+        Schedule the loading of the next events maps on the background thread and release the
+        maps of the past events.
+
+        Parameters
+        ----------
+        string : kind
+            Forcing name (rain or disp).
+
+        integer : event
+            Current event number.
+
+        integer : ncols
+            Number of map columns.
+
+        integer : ids
+            List of unstructured vertices contained in each partition.
+        """
+
+        files = self.Map_rain if kind == 'rain' else self.Map_disp
+        keep = [(kind, event)]
+        for e in range(event + 1, len(files)):
+            if len(keep) > self.prefetch.ahead:
+                break
+            if files[e] is not None and not (kind == 'rain' and self.orographic[e]):
+                keep.append((kind, e))
+        self.prefetch.release(keep, kind)
+
+        if len(keep) == 1:
+            return
+
+        # The background thread uses its own copy of the operator restricted to the partition
+        interp = self.interp
+        onTIN = self.onTIN
+        sub = None if onTIN else interp.subset(ids)
+        for key in keep[1:]:
+            self.prefetch.schedule(key, lambda e=key[1]: self._load_event(kind, e, ncols, ids,
+                                                                          interp, onTIN, sub))
+
+        return
+
+    def _event_map(self, kind, event, ncols, ids):
+        """
+        Get the map of an event on the partition nodes. Prefetched maps are used when available
+        and the loading of the next events maps is then scheduled.
+
+        Parameters
+        ----------
+        string : kind
+            Forcing name (rain or disp).
+
+        integer : event
+            Event number.
+
+        integer : ncols
+            Number of map columns.
+
+        integer : ids
+            List of unstructured vertices contained in each partition.
+
+        Return
+        ----------
+        variable: tin
+            Numpy 2D array containing the map columns on the partition nodes.
+        """
+
+        if self.prefetch is None:
+            return self._load_event(kind, event, ncols, ids, self.interp, self.onTIN)['tin']
+
+        emap = self.prefetch.get((kind, event))
+        if emap is not None and (emap['interp'] is not self.interp or emap['ids'] is not ids):
+            # The TIN has been rebuilt since the map has been loaded
+            if emap['data'] is not None and not self.onTIN:
+                emap = {'interp': self.interp, 'ids': ids, 'data': emap['data'],
+                        'tin': self.interp.apply(emap['data'], ids)}
+            else:
+                emap = None
+        if emap is None:
+            emap = self._load_event(kind, event, ncols, ids, self.interp, self.onTIN)
+
+        # The current map is held until the event is over
+        self.prefetch.put((kind, event), emap)
+        self._schedule_events(kind, event, ncols, ids)
+
+        return emap['tin']
+
     def get_Rain(self, time, elev, inIDs):
         """
         Get rain value for a given period and perform interpolation from regular grid to unstructured TIN one.
@@ -236,11 +438,7 @@ class forceSim:
             tinRain = self.rainVal[event]
             self.next_rain = self.T_rain[event,1]
         else:
-            rainMap = pandas.read_csv(str(self.Map_rain[event]), sep=r'\s+', engine='c',
-                               header=None, na_filter=False, dtype=numpy.float, low_memory=False)
-
-            rectRain = numpy.reshape(rainMap.values,(len(self.regX), len(self.regY)),order='F')
-            tinRain = interpolate.interpn( (self.regX, self.regY), rectRain, self.tXY[inIDs,:], method='linear')
+            tinRain = self._event_map('rain', event, 1, inIDs)[:,0]
             self.next_rain = self.T_rain[event,1]
 
         return tinRain
@@ -267,33 +465,15 @@ class forceSim:
             Numpy array containing the updated rainfall for the local domain.
         """
 
-        # Interpolate elevation on regular grid
-        distances, indices = self.tree.query(self.xyi, k=8)
-        if len(elev[indices].shape) == 3:
-            elev_vals = elev[indices][:,:,0]
-        else:
-            elev_vals = elev[indices]
-        oelev = numpy.average(elev_vals,weights=(1./distances), axis=1)
-        onIDs = numpy.where(distances[:,0] == 0)[0]
-        if len(onIDs) > 0:
-            oelev[onIDs] = elev[indices[onIDs,0]]
-        oelev -= self.sealevel
-        oelev = oelev.clip(0)
-        regZ = numpy.reshape(oelev,(len(self.regX), len(self.regY)),order='F')
-        # Use Smith & Barstad model
-        rectRain = ORmodel.orographicrain.compute(regZ, self.dx, self.windx[event], self.windy[event],
-            self.rmin[event], self.rmax[event], self.rbgd[event], self.nm[event], self.cw[event],
-            self.hw[event], self.tauc[event], self.tauf[event])
-
-        # Apply smoothing here
-        smthRain = gaussian_filter(rectRain, sigma=3)
-
-        # Interpolate
-        tinRain = interpolate.interpn( (self.regX, self.regY), smthRain, self.tXY[inIDs,:], method='linear')
+        # Use Smith & Barstad model on the rain grid
+        tinRain = self.oroRain.compute(elev, self.sealevel, inIDs, self.dx,
+            self.rmin[event], self.rmax[event], self.rbgd[event], self.windx[event],
+            self.windy[event], self.nm[event], self.cw[event], self.hw[event],
+            self.tauc[event], self.tauf[event])
 
         return tinRain
 
-    def disp_border(self, disp, neighbours, edge_length, boundPts):
+    def disp_border(self, disp, ngbOffsets, neighbours, edge_length, boundPts):
         """
         This function defines the displacement of the TIN edges.
 
@@ -302,6 +482,9 @@ class forceSim:
         variable : disp
             Numpy arrays containing the internal nodes displacement value.
 
+        variable : ngbOffsets
+            Numpy integer-type array containing the offsets of each node neighbourhood.
+
         variable : neighbours
             Numpy integer-type array containing for each nodes its neigbhours IDs.
 
@@ -320,12 +503,12 @@ class forceSim:
         disp[:boundPts] = 1.e7
         missedPts = []
         for id in range(boundPts):
-            ngbhs = neighbours[id,:]
+            ngbhs = neighbours[ngbOffsets[id]:ngbOffsets[id+1]]
             ids = numpy.where(ngbhs >= boundPts)[0]
             if len(ids) == 1:
                 disp[id] = disp[ngbhs[ids]]
             elif len(ids) > 1:
-                lselect = edge_length[id,ids]
+                lselect = edge_length[ngbOffsets[id]+ids]
                 picked = numpy.argmin(lselect)
                 disp[id] = disp[ngbhs[ids[picked]]]
             else:
@@ -334,11 +517,11 @@ class forceSim:
         if len(missedPts) > 0 :
             for p in range(len(missedPts)):
                 id = int(missedPts[p])
-                ngbhs = neighbours[id,:]
-                ids = numpy.where((disp[ngbhs] < 9.e6) & (ngbhs >= 0))[0]
+                ngbhs = neighbours[ngbOffsets[id]:ngbOffsets[id+1]]
+                ids = numpy.where(disp[ngbhs] < 9.e6)[0]
                 if len(ids) == 0:
                     raise ValueError('Error while getting boundary displacement for point ''%d''.' % id)
-                lselect = edge_length[id,ids]
+                lselect = edge_length[ngbOffsets[id]+ids]
                 picked = numpy.argmin(lselect)
                 disp[id] = disp[ngbhs[ids[picked]]]
 
@@ -371,11 +554,7 @@ class forceSim:
         self.next_disp = self.T_disp[event,1]
 
         if self.Map_disp[event] != None:
-            dispMap = pandas.read_csv(str(self.Map_disp[event]), sep=r'\s+', engine='c', header=None, na_filter=False, \
-                               dtype=numpy.float, low_memory=False)
-
-            rectDisp = numpy.reshape(dispMap.values,(len(self.regX), len(self.regY)),order='F')
-            tinDisp = interpolate.interpn( (self.regX, self.regY), rectDisp, self.tXY[inIDs,:], method='linear')
+            tinDisp = self._event_map('disp', event, 1, inIDs)[:,0]
             dt = (self.T_disp[event,1] - self.T_disp[event,0])
             if dt <= 0:
                 raise ValueError('Problem computing the displacements rate for event %d.'%event)
@@ -420,7 +599,6 @@ class forceSim:
         dispX = numpy.zeros(totPts, dtype=float)
         dispY = numpy.zeros(totPts, dtype=float)
         dispZ = numpy.zeros(totPts, dtype=float)
-        dpXY = tXY[inIDs,:]
 
         if strata:
             totsPts = len(sXY[:,0])
@@ -448,15 +626,10 @@ class forceSim:
             dispX.fill(-1.e6)
             dispY.fill(-1.e6)
             dispZ.fill(-1.e6)
-            disps = pandas.read_csv(str(self.Map_disp[event]), sep=r'\s+', engine='c', header=None, na_filter=False, \
-                               dtype=numpy.float, low_memory=False)
-
-            disprX = numpy.reshape(disps.values[:,0],(len(self.regX), len(self.regY)),order='F')
-            disprY = numpy.reshape(disps.values[:,1],(len(self.regX), len(self.regY)),order='F')
-            disprZ = numpy.reshape(disps.values[:,2],(len(self.regX), len(self.regY)),order='F')
-            dispX[inIDs] = interpolate.interpn( (self.regX, self.regY), disprX, dpXY, method='linear')
-            dispY[inIDs] = interpolate.interpn( (self.regX, self.regY), disprY, dpXY, method='linear')
-            dispZ[inIDs] = interpolate.interpn( (self.regX, self.regY), disprZ, dpXY, method='linear')
+            tinDisps = self._event_map('disp', event, 3, inIDs)
+            dispX[inIDs] = tinDisps[:,0]
+            dispY[inIDs] = tinDisps[:,1]
+            dispZ[inIDs] = tinDisps[:,2]
             comm.Allreduce(mpi.IN_PLACE, dispX, op=mpi.MAX)
             comm.Allreduce(mpi.IN_PLACE, dispY, op=mpi.MAX)
             comm.Allreduce(mpi.IN_PLACE, dispZ, op=mpi.MAX)
@@ -465,8 +638,10 @@ class forceSim:
             if strata:
                 sdispX.fill(-1.e6)
                 sdispY.fill(-1.e6)
-                sdispX[insIDs] = interpolate.interpn( (self.regX, self.regY), disprX, dpsXY, method='linear')
-                sdispY[insIDs] = interpolate.interpn( (self.regX, self.regY), disprY, dpsXY, method='linear')
+                disps = self._read_map('disp', event, self.Map_disp[event])
+                sdisps = interpTIN.interpTIN(self.regX, self.regY, dpsXY).apply(disps[:,:2])
+                sdispX[insIDs] = sdisps[:,0]
+                sdispY[insIDs] = sdisps[:,1]
                 comm.Allreduce(mpi.IN_PLACE, sdispX, op=mpi.MAX)
                 comm.Allreduce(mpi.IN_PLACE, sdispY, op=mpi.MAX)
 
@@ -489,7 +664,7 @@ class forceSim:
             return update
 
     def apply_XY_dispacements(self, area, fixIDs, telev, tcum, tflex=None, scum=None,
-                                      Te=None, Ke=None, flexure=0, strat=0, ero=0):
+                                      Te=None, Ke=None, flexure=0, strat=0, ero=0, reorder='none'):
         """
         Apply horizontal displacements and check if any points need to be merged.
 
@@ -528,6 +703,9 @@ class forceSim:
         integer : ero
             Integer flagging erosional mesh model.
 
+        string : reorder
+            Space-filling curve (hilbert or morton) used to renumber the new TIN vertices.
+
         Return
         ----------
         variable: tinMesh
@@ -583,7 +761,7 @@ class forceSim:
             if strat == 1:
                 stcum = numpy.delete(scum, tID, 0)
             if ero == 1:
-                lay = Ke.shape()[1]
+                lay = Ke.shape[1]
                 mKe = numpy.zeros((len(cum),lay))
                 mTe = numpy.zeros((len(cum),lay))
                 for k in range(lay):
@@ -598,7 +776,7 @@ class forceSim:
             if strat == 1:
                 stcum = scum
             if ero == 1:
-                lay = Ke.shape()[1]
+                lay = Ke.shape[1]
                 mKe = Ke
                 mTe = Te
 
@@ -650,7 +828,7 @@ class forceSim:
                         Te_vals = mTe[indices,k]
                         Ke_vals = mKe[indices,k]
                     Te_avg[:,k] = numpy.average(Te_vals, weights=weights,axis=1)
-                    Ke_avg[:,k] = Ke_vals[indices[0]]
+                    Ke_avg[:,k] = Ke_vals[:,0]
             # Delete points that have been merged
             newXY = numpy.delete(self.tXY, mergedIDs, 0)
             newelev = numpy.delete(elev, mergedIDs, 0)
@@ -690,6 +868,9 @@ class forceSim:
             if ero == 1:
                 nKe = mKe
                 nTe = mTe
+        if ero == 1:
+            newKe = nKe
+            newTe = nTe
 
         # Based on new points build the triangulation
         newTIN = triangle.triangulate( dict(vertices=newXY),'Da'+str(area))
@@ -714,27 +895,17 @@ class forceSim:
                 if strat == 1:
                     scumvals = stcum[ids]
             if ero == 1:
-                Tevals = numpy.zeros((len(zvals),lay))
-                Kevals = numpy.zeros((len(zvals),lay))
+                Teavg = numpy.zeros((len(zvals),lay))
+                Keavg = numpy.zeros((len(zvals),lay))
                 for k in range(lay):
-                    if len(mTe[ids,k].shape) == 3:
-                        Tevals[:,k] = mTe[ids,k][:,:,0]
-                        Kevals[:,k] = mKe[ids,k][:,:,0]
-                    else:
-                        Tevals[:,k] = mTe[ids,k]
-                        Kevals[:,k] = mKe[ids,k]
+                    Teavg[:,k] = numpy.average(mTe[ids,k], weights=weights,axis=1)
+                    Keavg[:,k] = mKe[ids[:,0],k]
             zavg = numpy.average(zvals, weights=weights,axis=1)
             cumavg = numpy.average(cumvals, weights=weights,axis=1)
             if flexure == 1:
                 cumfavg = numpy.average(cumfvals, weights=weights,axis=1)
             if strat == 1:
                 scumavg = numpy.average(scumvals, weights=weights,axis=1)
-            if ero == 1:
-                Teavg = numpy.zeros((len(zavg),lay))
-                Keavg = numpy.zeros((len(zavg),lay))
-                for k in range(lay):
-                    Teavg[:,k] = numpy.average(Tevals[:,k], weights=weights,axis=1)
-                    Keavg[:,k] = Kevals[indices[0],k]
             newelev = numpy.concatenate((newelev, zavg), axis=0)
             newcum = numpy.concatenate((newcum, cumavg), axis=0)
             if flexure == 1:
@@ -758,4 +929,18 @@ class forceSim:
             newKe = None
             newTe = None
 
+        # Renumber vertices for memory locality
+        if reorder != 'none':
+            perm = reorderTIN.curve_order(newTIN['vertices'], fixIDs, reorder)
+            newTIN = reorderTIN.renumber_mesh(newTIN, perm)
+            newelev = newelev[perm]
+            newcum = newcum[perm]
+            if flexure == 1:
+                newcumf = newcumf[perm]
+            if strat == 1:
+                newscum = newscum[perm]
+            if ero == 1:
+                newKe = newKe[perm,:]
+                newTe = newTe[perm,:]
+
         return newTIN, newelev, newcum, newcumf, newscum, newKe, newTe
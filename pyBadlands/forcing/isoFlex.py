@@ -15,10 +15,10 @@ import os
 import math
 import numpy
 import gflex
-import pandas
 from scipy import interpolate
 from scipy.spatial import cKDTree
 from scipy.interpolate import RegularGridInterpolator
+from pyBadlands.surface import gridFile
 
 class isoFlex:
     """
@@ -127,9 +127,8 @@ class isoFlex:
         self.rho_w = 1029.0
         # Elastic thickness [m]
         if isinstance(elasticT, basestring):
-            TeMap = pandas.read_csv(elasticT, sep=r'\s+', engine='c', header=None,
-                na_filter=False, dtype=numpy.float, low_memory=False)
-            self.Te = numpy.reshape(TeMap.values, (self.ny, self.nx))
+            TeMap = gridFile.read_grid(elasticT)
+            self.Te = numpy.reshape(numpy.array(TeMap), (self.ny, self.nx))
         else:
             self.Te = elasticT * numpy.ones((self.ny, self.nx))
 
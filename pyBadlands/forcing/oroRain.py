@@ -0,0 +1,327 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module computes the orographic precipitation using the linear model of Smith and Barstad
+(2004). The operators between the TIN and the rain grid are computed once, the spectral transfer
+function is kept while the model parameters do not change and the Fourier transforms use FFTW
+when pyFFTW is installed.
+"""
+
+import math
+import numpy
+import mpi4py.MPI as mpi
+from scipy.spatial import cKDTree
+from scipy.ndimage.filters import gaussian_filter
+from pyBadlands.surface import interpTIN
+
+try:
+    import pyfftw
+    import pyfftw.interfaces.numpy_fft as fft
+    pyfftw.interfaces.cache.enable()
+except ImportError:
+    import numpy.fft as fft
+
+# Number of TIN nodes used to define the elevation of each rain grid node
+NGB_NODES = 8
+
+# Smoothing of the precipitation field in regular grid cells
+SMOOTH_CELLS = 3.
+
+class oroRain:
+    """
+    This class defines the orographic precipitation model. The elevation averaging from the TIN
+    to the rain grid is split amongst the processors, the rain field is computed by the master
+    processor and broadcast to the others which interpolate it on their partition.
+
+    Parameters
+    ----------
+    float : regX
+        Numpy array containing the X-coordinates of the regular input grid.
+
+    float : regY
+        Numpy array containing the Y-coordinates of the regular input grid.
+
+    integer : factor
+        Coarsening factor of the rain grid resolution relative to the regular input grid.
+    """
+
+    def __init__(self, regX, regY, factor=1):
+
+        comm = mpi.COMM_WORLD
+        self.rank = comm.Get_rank()
+        self.size = comm.Get_size()
+
+        # Rain grid covering the regular input grid
+        self.factor = factor
+        if factor == 1:
+            self.orX = regX
+            self.orY = regY
+        else:
+            step = factor * (regX[1] - regX[0])
+            nx = int(math.ceil((regX[-1] - regX[0]) / step)) + 1
+            ny = int(math.ceil((regY[-1] - regY[0]) / step)) + 1
+            self.orX = regX[0] + step * numpy.arange(nx)
+            self.orY = regY[0] + step * numpy.arange(ny)
+        self.nx = len(self.orX)
+        self.ny = len(self.orY)
+        xi, yi = numpy.meshgrid(self.orX, self.orY, indexing='xy')
+        self.xyi = numpy.dstack([xi.flatten(), yi.flatten()])[0]
+
+        # Rain grid nodes averaged by each processor
+        nPts = len(self.xyi)
+        self.counts = numpy.array([nPts // self.size + (r < nPts % self.size)
+                                   for r in range(self.size)], dtype=numpy.int32)
+        self.offsets = numpy.zeros(self.size, dtype=numpy.int32)
+        self.offsets[1:] = numpy.cumsum(self.counts)[:-1]
+
+        # Computational grid padded by half of the rain grid size
+        self.cnx = int(self.nx/2.) + self.nx
+        self.cny = int(self.ny/2.) + self.ny
+        self.i1 = max(int(self.nx/4.) - 1, 0)
+        self.j1 = max(int(self.ny/4.) - 1, 0)
+
+        self.indices = None
+        self.weights = None
+        self.wsum = None
+        self.onIDs = None
+        self.onNodes = None
+        self.interp = None
+        self.transfer = None
+        self.transferKey = None
+
+    def update_mesh(self, tXY, tree=None, interp=None):
+        """
+        Define the operators between the TIN and the rain grid.
+
+        Parameters
+        ----------
+        float : tXY
+            Numpy float-type array containing the coordinates for each nodes in the TIN.
+
+        variable : tree
+            KD-tree of the TIN nodes (optional).
+
+        variable : interp
+            Regular input grid to TIN interpolation operator used when the rain grid is not
+            coarsened (optional).
+        """
+
+        if tree is None:
+            tree = cKDTree(tXY)
+
+        # Inverse distance weighting of the TIN nodes closest to the local rain grid nodes
+        lo = self.offsets[self.rank]
+        hi = lo + self.counts[self.rank]
+        distances, self.indices = tree.query(self.xyi[lo:hi], k=NGB_NODES)
+        with numpy.errstate(divide='ignore'):
+            self.weights = 1./distances
+        self.wsum = self.weights.sum(axis=1)
+        self.onIDs = numpy.where(distances[:,0] == 0)[0]
+        self.onNodes = self.indices[self.onIDs,0]
+
+        if self.factor == 1 and interp is not None:
+            self.interp = interp
+        else:
+            self.interp = interpTIN.interpTIN(self.orX, self.orY, tXY)
+
+        return
+
+    def _grid_elevation(self, elev):
+        """
+        Average the TIN elevations on the rain grid.
+
+        Parameters
+        ----------
+        float : elev
+            Unstructured grid (TIN) Z coordinates.
+
+        Return
+        ----------
+        variable: oelev
+            Numpy array containing the elevation of the rain grid nodes.
+        """
+
+        if len(elev.shape) == 2:
+            elev = elev[:,0]
+
+        with numpy.errstate(invalid='ignore'):
+            local = numpy.multiply(elev[self.indices], self.weights).sum(axis=1) / self.wsum
+        local[self.onIDs] = elev[self.onNodes]
+
+        if self.size == 1:
+            return local
+
+        oelev = numpy.empty(len(self.xyi), dtype=numpy.float64)
+        mpi.COMM_WORLD.Allgatherv(local, [oelev, (self.counts, self.offsets), mpi.DOUBLE])
+
+        return oelev
+
+    def _transfer_function(self, dx, windx, windy, nm, cw, hw, tauc, tauf):
+        """
+        Build the spectral transfer function from terrain to precipitation. Only the Hermitian
+        part is kept as the precipitation is defined by the real part of the inverse transform.
+
+        Parameters
+        ----------
+        float : dx
+            Rain grid resolution.
+
+        float : windx, windy
+            Wind velocity along X and Y.
+
+        float : nm
+            Moist stability frequency.
+
+        float : cw
+            Uplift sensitivity factor.
+
+        float : hw
+            Depth of the moist layer.
+
+        float : tauc, tauf
+            Time of conversion from cloud water to hydrometeors and of hydrometeor fallout.
+
+        Return
+        ----------
+        variable: transfer
+            Numpy complex array containing the transfer function for the real Fourier transform.
+        """
+
+        nx = self.cnx
+        ny = self.cny
+        i = numpy.arange(nx)
+        j = numpy.arange(ny)
+        wk = numpy.where(i <= nx//2, 2.*numpy.pi*i/(nx*dx), -2.*numpy.pi*(nx-i)/(nx*dx))
+        wl = numpy.where(j <= ny//2, 2.*numpy.pi*j/(ny*dx), -2.*numpy.pi*(ny-j)/(ny*dx))
+        k1 = wk[:,None]
+        k2 = wl[None,:]
+
+        sigma = windx*k1 + windy*k2
+        kk = k1*k1 + k2*k2
+        mr = numpy.zeros((nx,ny))
+        mi = numpy.zeros((nx,ny))
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ratio = nm*nm/(sigma*sigma) - 1.
+            prop = numpy.logical_and(sigma != 0., ratio >= 0.)
+            evan = numpy.logical_and(sigma != 0., ratio < 0.)
+        mr[prop] = numpy.sqrt(ratio[prop]*kk[prop])*numpy.sign(sigma[prop])
+        mi[evan] = numpy.sqrt(-ratio[evan]*kk[evan])
+
+        # Precipitation in mm/hr
+        s2 = sigma*sigma
+        moist = (1. + mi*hw) + 1j*mr*hw
+        cloud = sigma*(tauc + tauf) + 1j*(1. - s2*tauc*tauf)
+        den = numpy.abs(moist)**2 * (1. + s2*tauc*tauc) * (1. + s2*tauf*tauf)
+        transfer = 3600. * (1. + 1j) * cw * sigma * cloud * moist / den
+
+        # Hermitian part of the transfer function
+        rev = transfer[(-i) % nx,:][:,(-j) % ny]
+        transfer = 0.5 * (transfer + numpy.conj(rev))
+
+        return transfer[:,:ny//2+1]
+
+    def _rain_grid(self, oelev, dx, rmin, rmax, rbgd, windx, windy, nm, cw, hw, tauc, tauf):
+        """
+        Compute the precipitation on the rain grid. The transfer function is only rebuilt when
+        the rain grid resolution or the model parameters differ from the previous call.
+
+        Parameters
+        ----------
+        float : oelev
+            Numpy array containing the elevation of the rain grid nodes above sea level.
+
+        float : dx
+            Rain grid resolution.
+
+        float : rmin, rmax, rbgd
+            Minimal, maximal and background precipitation.
+
+        float : windx, windy, nm, cw, hw, tauc, tauf
+            Orographic model parameters.
+
+        Return
+        ----------
+        variable: rain
+            Numpy array (nx, ny) containing the precipitation in m/a.
+        """
+
+        key = (dx, windx, windy, nm, cw, hw, tauc, tauf)
+        if key != self.transferKey:
+            self.transfer = self._transfer_function(*key)
+            self.transferKey = key
+
+        # Terrain extrapolated on the computational grid borders
+        regZ = numpy.reshape(oelev, (self.nx, self.ny), order='F')
+        i2 = self.cnx - self.i1 - self.nx
+        j2 = self.cny - self.j1 - self.ny
+        elev = numpy.pad(regZ, ((self.i1, i2), (self.j1, j2)), mode='edge')
+
+        # Precipitation field in physical space (m/a)
+        prr = fft.irfft2(fft.rfft2(elev) * self.transfer, s=(self.cnx, self.cny))
+        prr *= self.cnx * self.cny * 24. * 365. / 1000.
+
+        # Precipitation scaled within the user range
+        rain = prr[self.i1:self.i1+self.nx, self.j1:self.j1+self.ny] + rbgd
+        minprr = min(rain.min(), 1000.)
+        maxprr = max(rain.max(), -1000.)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            aa = (rbgd - rmin) / (rbgd - minprr)
+            aa2 = (rmax - rbgd) / (maxprr - rbgd)
+        bb = rmin - aa * minprr
+        bb2 = rbgd - aa2 * rbgd
+
+        return numpy.where(rain <= rbgd, aa * rain + bb, aa2 * rain + bb2)
+
+    def compute(self, elev, sealevel, inIDs, dx, rmin, rmax, rbgd, windx, windy, nm, cw, hw,
+                tauc, tauf):
+        """
+        Compute the orographic precipitation on the partition nodes.
+
+        Parameters
+        ----------
+        float : elev
+            Unstructured grid (TIN) Z coordinates.
+
+        float : sealevel
+            Sea level elevation.
+
+        integer : inIDs
+            List of unstructured vertices contained in each partition.
+
+        float : dx
+            Regular input grid resolution.
+
+        float : rmin, rmax, rbgd
+            Minimal, maximal and background precipitation.
+
+        float : windx, windy, nm, cw, hw, tauc, tauf
+            Orographic model parameters.
+
+        Return
+        ----------
+        variable: tinRain
+            Numpy array containing the precipitation for the local domain.
+        """
+
+        oelev = self._grid_elevation(elev)
+        oelev -= sealevel
+        oelev = oelev.clip(0)
+
+        smthRain = None
+        if self.rank == 0:
+            rectRain = self._rain_grid(oelev, dx*self.factor, rmin, rmax, rbgd, windx, windy,
+                                       nm, cw, hw, tauc, tauf)
+            smthRain = numpy.ravel(gaussian_filter(rectRain, sigma=SMOOTH_CELLS/self.factor),
+                                   order='F')
+        if self.size > 1:
+            if self.rank > 0:
+                smthRain = numpy.empty(self.nx*self.ny, dtype=numpy.float64)
+            mpi.COMM_WORLD.Bcast(smthRain, root=0)
+
+        return self.interp.apply(smthRain, inIDs)
@@ -42,6 +42,15 @@ class xmlParser:
         self.fillmax = 1.
         self.Afactor = 1
         self.nopit = 0
+        self.pitfill = 'planchon'
+        self.pitrefill = 0
+        self.pittol = 0.01
+        self.pitsea = 1.
+        self.precision = 'double'
+        self.dtype = numpy.float64
+        self.reorder = 'none'
+        self.meshcache = None
+        self.forcearchive = None
 
         self.restart = False
         self.rForlder = None
@@ -72,6 +81,7 @@ class xmlParser:
         self.rainVal = None
         self.rainTime = None
         self.oroRain = False
+        self.orfactor = 1
         self.orographic = None
         self.ortime = None
         self.rbgd = None
@@ -98,12 +108,16 @@ class xmlParser:
         self.spl = False
         self.capacity = False
         self.filter = False
+        self.implicit = False
+        self.rcvtol = 0.
         self.Hillslope = False
         self.nHillslope = False
 
         self.CDa = 0.
         self.CDm = 0.
         self.Sc = 0.
+        self.CDimplicit = False
+        self.CDsubcycle = False
         self.makeUniqueOutputDir = makeUniqueOutputDir
 
         self.outDir = None
@@ -134,6 +148,10 @@ class xmlParser:
         self.thickMap = None
         self.thickVal = None
 
+        self.gather = False
+        self.threads = 1
+        self.prefetch = 0
+
         self._get_XmL_Data()
 
         return
@@ -185,6 +203,62 @@ class xmlParser:
                     self.nopit = 1
             else:
                 self.nopit = 0
+            element = None
+            element = grid.find('pitfill')
+            if element is not None:
+                self.pitfill = element.text.strip().lower()
+                if self.pitfill != 'planchon' and self.pitfill != 'priority':
+                    raise ValueError('Error in the XmL file: pitfill should be either planchon or priority!')
+            else:
+                self.pitfill = 'planchon'
+            element = None
+            element = grid.find('pitrefill')
+            if element is not None:
+                self.pitrefill = int(element.text)
+                if self.pitrefill < 0:
+                    self.pitrefill = 0
+            else:
+                self.pitrefill = 0
+            element = None
+            element = grid.find('pittol')
+            if element is not None:
+                self.pittol = float(element.text)
+                if self.pittol < 0.:
+                    self.pittol = 0.
+            else:
+                self.pittol = 0.01
+            element = None
+            element = grid.find('pitsea')
+            if element is not None:
+                self.pitsea = float(element.text)
+            else:
+                self.pitsea = 1.
+            element = None
+            element = grid.find('precision')
+            if element is not None:
+                self.precision = element.text.strip().lower()
+                if self.precision != 'double' and self.precision != 'single':
+                    raise ValueError('Error in the XmL file: precision should be either double or single!')
+            else:
+                self.precision = 'double'
+            if self.precision == 'single':
+                self.dtype = numpy.float32
+            else:
+                self.dtype = numpy.float64
+            element = None
+            element = grid.find('reorder')
+            if element is not None:
+                self.reorder = element.text.strip().lower()
+                if self.reorder not in ['none', 'hilbert', 'morton']:
+                    raise ValueError('Error in the XmL file: reorder should be either none, hilbert or morton!')
+            else:
+                self.reorder = 'none'
+            element = None
+            element = grid.find('meshcache')
+            if element is not None:
+                self.meshcache = element.text.strip()
+            else:
+                self.meshcache = None
         else:
             raise ValueError('Error in the XmL file: grid structure definition is required!')
 
@@ -316,6 +390,16 @@ class xmlParser:
             self.sealimit = 100.
             self.seafile = None
 
+        # Extract forcing archive information
+        element = None
+        element = root.find('forcearchive')
+        if element is not None:
+            self.forcearchive = element.text.strip()
+            if not os.path.isfile(self.forcearchive):
+                raise ValueError('Forcing archive file %s is missing or the given path is incorrect.'%self.forcearchive)
+        else:
+            self.forcearchive = None
+
         # Extract Tectonic structure information
         tecto = None
         tecto = root.find('tectonic')
@@ -373,7 +457,7 @@ class xmlParser:
                 element = disp.find('dfile')
                 if element is not None:
                     tmpFile[id] = element.text
-                    if not os.path.isfile(tmpFile[id]):
+                    if self.forcearchive is None and not os.path.isfile(tmpFile[id]):
                         raise ValueError('Displacement file %s is missing or the given path is incorrect.'%(tmpFile[id]))
                 else:
                     raise ValueError('Displacement event %d is missing file argument.'%id)
@@ -432,6 +516,14 @@ class xmlParser:
                 tmpNb = int(element.text)
             else:
                 raise ValueError('The number of climatic events needs to be defined.')
+            element = None
+            element = precip.find('orfactor')
+            if element is not None:
+                self.orfactor = int(element.text)
+                if self.orfactor < 1:
+                    raise ValueError('Error in the XmL file: orographic rain grid coarsening factor needs to be >= 1.')
+            else:
+                self.orfactor = 1
             tmpVal = numpy.empty(tmpNb)
             tmpMap = numpy.empty(tmpNb,dtype=object)
             tmpOro = numpy.empty(tmpNb,dtype=bool)
@@ -472,7 +564,7 @@ class xmlParser:
                 element = clim.find('map')
                 if element is not None:
                     tmpMap[id] = element.text
-                    if not os.path.isfile(tmpMap[id]):
+                    if self.forcearchive is None and not os.path.isfile(tmpMap[id]):
                         raise ValueError('Rain map file %s is missing or the given path is incorrect.'%(tmpMap[id]))
                 else:
                     tmpMap[id] = None
@@ -740,7 +832,28 @@ class xmlParser:
                 self.SPLero = float(element.text)
             else:
                 self.SPLero = 0.
+            element = None
+            element = spl.find('implicit')
+            if element is not None:
+                self.implicit = bool(int(element.text))
+            else:
+                self.implicit = False
+            if self.implicit and self.depo == 1:
+                raise ValueError('Error in the XmL file: the implicit stream power law is only available for purely erosive models (dep = 0)!')
             self.maxDT = None
+            if self.implicit:
+                element = None
+                element = spl.find('maxdt')
+                if element is not None:
+                    self.maxDT = float(element.text)
+            element = None
+            element = spl.find('rcvtol')
+            if element is not None:
+                self.rcvtol = float(element.text)
+            else:
+                self.rcvtol = 0.
+            if self.rcvtol < 0.:
+                raise ValueError('Error in the XmL file: the receivers update tolerance needs to be positive!')
             self.alluvial = 0.
             self.bedrock = 0.
             self.esmooth = 0.
@@ -795,6 +908,14 @@ class xmlParser:
                 self.bedrock = float(element.text)
             else:
                 self.bedrock = 0.
+            element = None
+            element = tc.find('rcvtol')
+            if element is not None:
+                self.rcvtol = float(element.text)
+            else:
+                self.rcvtol = 0.
+            if self.rcvtol < 0.:
+                raise ValueError('Error in the XmL file: the receivers update tolerance needs to be positive!')
         else:
             if not self.spl:
                 self.depo = 0
@@ -830,6 +951,24 @@ class xmlParser:
             else:
                 self.Sc = 0.
                 self.Hillslope = True
+            element = None
+            element = creep.find('implicit')
+            if element is not None:
+                self.CDimplicit = bool(int(element.text))
+            else:
+                self.CDimplicit = False
+            if self.CDimplicit and self.nHillslope:
+                raise ValueError('Error in the XmL file: the implicit diffusion solver is only available for linear creep!')
+            element = None
+            element = creep.find('subcycle')
+            if element is not None:
+                self.CDsubcycle = bool(int(element.text))
+            else:
+                self.CDsubcycle = False
+            if self.CDsubcycle and self.nHillslope:
+                raise ValueError('Error in the XmL file: diffusion sub-cycling is only available for linear creep!')
+            if self.CDsubcycle and self.CDimplicit:
+                raise ValueError('Error in the XmL file: implicit and subcycle creep options cannot be used together!')
         else:
             self.CDa = 0.
             self.CDm = 0.
@@ -1014,6 +1153,37 @@ class xmlParser:
             self.esmooth = None
             self.dsmooth = None
 
+        # Extract parallel communication parameters
+        parallel = None
+        parallel = root.find('parallel')
+        if parallel is not None:
+            element = None
+            element = parallel.find('gather')
+            if element is not None:
+                self.gather = (int(element.text) == 1)
+            else:
+                self.gather = False
+            element = None
+            element = parallel.find('threads')
+            if element is not None:
+                self.threads = int(element.text)
+            else:
+                self.threads = int(os.environ.get('OMP_NUM_THREADS', 1))
+            element = None
+            element = parallel.find('prefetch')
+            if element is not None:
+                self.prefetch = int(element.text)
+            else:
+                self.prefetch = 0
+        else:
+            self.gather = False
+            self.threads = int(os.environ.get('OMP_NUM_THREADS', 1))
+            self.prefetch = 0
+        if self.threads < 1:
+            raise ValueError('Error in the XmL file: the number of threads should be at least 1!')
+        if self.prefetch < 0:
+            raise ValueError('Error in the XmL file: the number of prefetched forcing maps should be positive!')
+
         # Get output directory
         out = None
         out = root.find('outfolder')
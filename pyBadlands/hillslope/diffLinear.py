@@ -14,7 +14,10 @@ based on linear diffusion.
 import math
 import numpy
 import warnings
+from scipy import sparse
+from scipy.sparse.linalg import splu, bicgstab, LinearOperator
 from pyBadlands.libUtils import FLOWalgo
+import pyBadlands.libUtils.sfd as sfd
 import mpi4py.MPI as MPI
 
 class diffLinear:
@@ -29,10 +32,23 @@ class diffLinear:
         self.CDaerial = None
         self.CDmarine = None
         self.CFL = None
+        self.implicit = False
+        self.subcycle = False
+        self.maxiter = 10
+        self.dttol = 0.1
+
+        self._laplacian = None
+        self._areacoeff = None
+        self._mesh = None
+        self._fixed = None
+        self._outside = None
+        self._solver = None
+        self._dt = None
+        self._wet = None
 
         return
 
-    def dt_stability(self, edgelen):
+    def dt_stability(self, edgelen, globalmin=True):
         """
         This function computes the maximal timestep to ensure computation stability
         of the hillslope processes. This CFL-like condition is computed using diffusion
@@ -45,6 +61,10 @@ class diffLinear:
         ----------
         variable : edgelen
             Numpy arrays containing the edges of the TIN surface for the considered partition.
+
+        variable : globalmin
+            Boolean set to False when the global minimum is taken by the caller together with
+            the other stability conditions.
         """
 
         # Initialise MPI communications
@@ -62,7 +82,8 @@ class diffLinear:
         CFL[0] = 0.05*numpy.amin(edgedist[distIDs]**2)/maxCD
 
         # Global mimimum value for diffusion stability
-        comm.Allreduce(MPI.IN_PLACE,CFL,op=MPI.MIN)
+        if globalmin:
+            comm.Allreduce(MPI.IN_PLACE,CFL,op=MPI.MIN)
         self.CFL = CFL[0]
 
     def sedflux_old(self, diff_flux, sea, elevation, area):
@@ -131,3 +152,187 @@ class diffLinear:
         coeff = numpy.where(elevation >= sea, self.CDaerial, self.CDmarine)
         return numpy.nan_to_num(diff_flux * areacoeff * coeff)
 
+    def build_operator(self, xycoords, xymin, xymax, ngbOffsets, neighbours, edge_length,
+                       vor_edges, area, globalIDs):
+        """
+        This function records the TIN neighbourhood used by the sub-cycled linear diffusion and
+        assembles, on the master processor, the sparse finite volume Laplacian used by the
+        implicit solver. It only needs to be called again when the TIN changes.
+
+        Parameters
+        ----------
+        variable : xycoords
+            Numpy float-type array containing the X and Y coordinates of the TIN nodes.
+
+        variable : xymin, xymax
+            Numpy arrays containing the minimal and maximal XY coordinates of TIN grid
+            (excluding border cells).
+
+        variable : ngbOffsets
+            Numpy integer-type array containing the offsets of each node neighbourhood.
+
+        variable : neighbours
+            Numpy integer-type array containing for each nodes its neigbhours IDs.
+
+        variable : edge_length
+            Numpy float-type array containing the lengths of the edges connecting each node
+            with its neighbours.
+
+        variable : vor_edges
+            Numpy float-type array containing the voronoi edges length for each connection.
+
+        variable : area
+            Numpy arrays containing the area of the voronoi polygon for each TIN nodes.
+
+        variable: globalIDs
+            Numpy integer-type array containing for local nodes their global IDs.
+        """
+
+        comm = MPI.COMM_WORLD
+        totPts = len(area)
+
+        # Border nodes keep their elevations
+        fixed = (xycoords[:,0] < xymin[0]) | (xycoords[:,1] < xymin[1]) | \
+            (xycoords[:,0] > xymax[0]) | (xycoords[:,1] > xymax[1])
+
+        self._mesh = (ngbOffsets, neighbours, vor_edges, edge_length, globalIDs)
+        self._fixed = fixed
+        self._outside = None
+        if comm.Get_size() > 1:
+            self._outside = numpy.ones(totPts, dtype=bool)
+            self._outside[globalIDs] = False
+
+        self._solver = None
+        self._dt = None
+        self._wet = None
+
+        if not self.implicit or comm.Get_rank() > 0:
+            return
+
+        rows = numpy.repeat(numpy.arange(totPts), numpy.diff(ngbOffsets))
+        weights = numpy.zeros(len(neighbours))
+        tmpIDs = numpy.where((edge_length > 0.) & ~fixed[rows])[0]
+        weights[tmpIDs] = vor_edges[tmpIDs] / edge_length[tmpIDs]
+
+        lap = sparse.csr_matrix((weights, neighbours, ngbOffsets), shape=(totPts, totPts))
+        self._laplacian = lap - sparse.diags(numpy.asarray(lap.sum(axis=1)).ravel())
+        self._areacoeff = numpy.where(area > 0, 1. / numpy.where(area > 0, area, 1.), 0.)
+        self._areacoeff[fixed] = 0.
+
+        return
+
+    def sub_cycling(self, elevation, sea, area, dt):
+        """
+        This function computes the elevation change induced by linear diffusion over a fluvial
+        time step by sub-cycling the explicit scheme at the hillslope stability time step.
+        At each sub-step the diffusion flux of the local nodes is computed by the same kernel
+        as the flow network, without the flow directions, and the elevation change is reduced
+        over the processors.
+
+        Parameters
+        ----------
+        variable : elevation
+            Numpy arrays containing the elevation of the nodes.
+
+        variable : sea
+            Real value giving the sea-level height at considered time step.
+
+        variable : area
+            Numpy arrays containing the area of the voronoi polygon for each TIN nodes.
+
+        variable : dt
+            Real value corresponding to the fluvial time step.
+
+        Return
+        ----------
+        variable: dh
+            Numpy float-type array containing the elevation change due to hillslope processes.
+        """
+
+        comm = MPI.COMM_WORLD
+        ngbOffsets, neighbours, vor_edges, edge_length, globalIDs = self._mesh
+
+        z = numpy.array(elevation, dtype=numpy.float64)
+        diff_flux = numpy.zeros(len(z))
+        tStep = 0.
+        while tStep < dt:
+            subdt = min(self.CFL, dt - tStep)
+            sfd.diffusion(z, ngbOffsets, neighbours, vor_edges, edge_length, globalIDs, diff_flux)
+            rate = self.sedflux(diff_flux, sea, z, area)
+            rate[self._fixed] = 0.
+
+            # Nodes computed on other partitions should not take part in the reduction
+            if self._outside is not None:
+                rate[self._outside] = -numpy.inf
+                comm.Allreduce(MPI.IN_PLACE, rate, op=MPI.MAX)
+            z += rate * subdt
+            tStep += subdt
+
+        return z - elevation
+
+    def implicit_diffusion(self, elevation, sea, dt):
+        """
+        This function computes the elevation change induced by linear diffusion over a time step
+        using a backward Euler scheme. The scheme is unconditionally stable. The system is
+        factorised and solved on the master processor and the elevation change is broadcast
+        to the other ones. The factorised matrix is reused as long as the time step and the
+        shoreline position remain the same. When the shoreline moves or the time step varies
+        by less than the relative tolerance dttol it is used as a preconditioner, the matrix
+        is only factorised again when the iterative solver does not converge within maxiter
+        iterations or when the time step varies by more than the tolerance.
+
+        Parameters
+        ----------
+        variable : elevation
+            Numpy arrays containing the elevation of the nodes.
+
+        variable : sea
+            Real value giving the sea-level height at considered time step.
+
+        variable : dt
+            Real value corresponding to the time step.
+
+        Return
+        ----------
+        variable: dh
+            Numpy float-type array containing the elevation change due to hillslope processes.
+        """
+
+        comm = MPI.COMM_WORLD
+
+        dh = numpy.empty(len(elevation))
+        if comm.Get_rank() == 0:
+            dh[:] = self._solve_implicit(elevation, sea, dt)
+        if comm.Get_size() > 1:
+            comm.Bcast(dh, root=0)
+
+        return dh
+
+    def _solve_implicit(self, elevation, sea, dt):
+        """
+        Solve the backward Euler system of the implicit linear diffusion on the current
+        processor, reusing the factorised matrix of the previous time steps.
+        """
+
+        z = numpy.asarray(elevation, dtype=numpy.float64)
+        wet = z < sea
+        coeff = dt * numpy.where(wet, self.CDmarine, self.CDaerial) * self._areacoeff
+
+        # Solve for the elevation change: (I - dt K L) dh = dt K L z
+        rhs = coeff * self._laplacian.dot(z)
+        if self._solver is not None and dt == self._dt and numpy.array_equal(wet, self._wet):
+            return self._solver.solve(rhs)
+
+        mat = sparse.identity(len(z), format='csr') - sparse.diags(coeff).dot(self._laplacian)
+        if self._solver is not None and abs(dt - self._dt) <= self.dttol * self._dt:
+            precond = LinearOperator(mat.shape, matvec=self._solver.solve)
+            dh, info = bicgstab(mat, rhs, tol=1.e-8, maxiter=self.maxiter, M=precond)
+            if info == 0:
+                return dh
+
+        self._solver = splu(mat.tocsc())
+        self._dt = dt
+        self._wet = wet
+
+        return self._solver.solve(rhs)
+
@@ -33,7 +33,7 @@ class diffnLinear:
 
         return
 
-    def dt_stability(self, diffcfl):
+    def dt_stability(self, diffcfl, globalmin=True):
         """
         This function computes the maximal timestep to ensure computation stability
         of the non-linear hillslope processes.
@@ -42,6 +42,10 @@ class diffnLinear:
         ----------
         variable : diffcfl
             Numpy arrays containing the cfl-like condition at each nodes of the considered partition.
+
+        variable : globalmin
+            Boolean set to False when the global minimum is taken by the caller together with
+            the other stability conditions.
         """
 
         # Initialise MPI communications
@@ -59,7 +63,8 @@ class diffnLinear:
         CFL[0] = 0.1*numpy.amin(diffcfl[cflIDs])/maxCD
 
         # Global mimimum value for diffusion stability
-        comm.Allreduce(MPI.IN_PLACE,CFL,op=MPI.MIN)
+        if globalmin:
+            comm.Allreduce(MPI.IN_PLACE,CFL,op=MPI.MIN)
         self.CFL = CFL[0]
 
     def sedflux(self, diff_flux, sea, elevation, area):
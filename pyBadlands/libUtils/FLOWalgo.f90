@@ -14,40 +14,58 @@ module flowcompute
 
 contains
 
-  subroutine discharge(pyStack, pyRcv, pyDischarge, pyDis, pylNodesNb, pygNodesNb)
+  subroutine discharge(pyStack, pyBasins, pyOrder, pyRcv, pyDischarge, pyDis, pyBasinNb, pylNodesNb, pygNodesNb)
 
       integer :: pygNodesNb
+      integer :: pyBasinNb
       integer :: pylNodesNb
       integer,dimension(pylNodesNb),intent(in) :: pyStack
+      integer,dimension(pyBasinNb),intent(in) :: pyBasins
+      integer,dimension(pyBasinNb),intent(in) :: pyOrder
       integer,dimension(pygNodesNb),intent(in) :: pyRcv
       real(kind=8),dimension(pygNodesNb),intent(in) :: pyDischarge
 
       real(kind=8),dimension(pygNodesNb),intent(out) :: pyDis
 
-      integer :: n, donor, recvr
+      integer :: i, b, nstart, nend, n, donor, recvr
 
       pyDis = pyDischarge
 
-      do n = pylNodesNb, 1, -1
-        donor = pyStack(n) + 1
-        recvr = pyRcv(donor) + 1
-        if( donor /= recvr )then
-            pyDis(recvr) = pyDis(recvr) + pyDis(donor)
-        endif
+      ! Drainage basins are independent and are processed concurrently,
+      ! the largest ones first
+      !$omp parallel private(i, b, n, nstart, nend, donor, recvr)
+      !$omp do schedule(dynamic,1)
+      do i = 1, pyBasinNb
+        b = pyOrder(i) + 1
+        nstart = pyBasins(b) + 1
+        nend = pylNodesNb
+        if(b < pyBasinNb) nend = pyBasins(b+1)
+        do n = nend, nstart, -1
+          donor = pyStack(n) + 1
+          recvr = pyRcv(donor) + 1
+          if( donor /= recvr )then
+              pyDis(recvr) = pyDis(recvr) + pyDis(donor)
+          endif
+        enddo
       enddo
+      !$omp end do
+      !$omp end parallel
 
       return
 
   end subroutine discharge
 
-  subroutine parameters(pyStack, pyRcv, pyDischarge, pyXY, &
-      spl_part, pyBid0, pyChi, pyBasinID, pylNodesNb, pygNodesNb)
+  subroutine parameters(pyStack, pyBasins, pyOrder, pyRcv, pyDischarge, pyXY, &
+      spl_part, pyBid0, pyChi, pyBasinID, pyBasinNb, pylNodesNb, pygNodesNb)
 
       integer :: pygNodesNb
+      integer :: pyBasinNb
       integer :: pylNodesNb
       integer,intent(in) :: pyBid0
       real(kind=8),intent(in) :: spl_part
       integer,dimension(pylNodesNb),intent(in) :: pyStack
+      integer,dimension(pyBasinNb),intent(in) :: pyBasins
+      integer,dimension(pyBasinNb),intent(in) :: pyOrder
       integer,dimension(pygNodesNb),intent(in) :: pyRcv
       real(kind=8),dimension(pygNodesNb),intent(in) :: pyDischarge
       real(kind=8),dimension(pygNodesNb,2),intent(in) :: pyXY
@@ -55,50 +73,60 @@ contains
       integer,dimension(pygNodesNb),intent(out) :: pyBasinID
       real(kind=8),dimension(pygNodesNb),intent(out) :: pyChi
 
-      integer :: n, donor, recvr, bID
+      integer :: i, b, nstart, nend, n, donor, recvr, bID
       real(kind=8) :: disch1, disch2, dist
 
       pyChi = 0.
       pyBasinID = -1
-      bID = pyBid0
-      do n = 1, pylNodesNb
-        donor = pyStack(n) + 1
-        recvr = pyRcv(donor) + 1
-        if(donor == recvr) bID = bID + 1
-        pyBasinID(donor) = bID
-        disch1 = pyDischarge(donor)
-        disch2 = pyDischarge(recvr)
-        if( donor /= recvr .and. disch1 > 0. .and. disch2 > 0.)then
-            dist = sqrt( (pyXY(donor,1) - pyXY(recvr,1))**2.0 + &
-                (pyXY(donor,2) - pyXY(recvr,2))**2.0 )
-            pyChi(donor) = pyChi(recvr) + 0.5*((1./disch2)**spl_part + &
-                (1./(disch1))**spl_part) * dist
-        endif
+      ! Drainage basins are independent and are processed concurrently,
+      ! the largest ones first
+      !$omp parallel private(i, b, n, nstart, nend, donor, recvr, bID, disch1, disch2, dist)
+      !$omp do schedule(dynamic,1)
+      do i = 1, pyBasinNb
+        b = pyOrder(i) + 1
+        nstart = pyBasins(b) + 1
+        nend = pylNodesNb
+        if(b < pyBasinNb) nend = pyBasins(b+1)
+        bID = pyBid0 + b - 1
+        do n = nstart, nend
+          donor = pyStack(n) + 1
+          recvr = pyRcv(donor) + 1
+          if(donor == recvr) bID = bID + 1
+          pyBasinID(donor) = bID
+          disch1 = pyDischarge(donor)
+          disch2 = pyDischarge(recvr)
+          if( donor /= recvr .and. disch1 > 0. .and. disch2 > 0.)then
+              dist = sqrt( (pyXY(donor,1) - pyXY(recvr,1))**2.0 + &
+                  (pyXY(donor,2) - pyXY(recvr,2))**2.0 )
+              pyChi(donor) = pyChi(recvr) + 0.5*((1./disch2)**spl_part + &
+                  (1./(disch1))**spl_part) * dist
+          endif
+        enddo
       enddo
+      !$omp end do
+      !$omp end parallel
 
       return
 
   end subroutine parameters
 
-  subroutine diffcfl(pyEdges, Cdiff, cfl_dt, pyNodesNb)
+  subroutine diffcfl(pyEdges, Cdiff, cfl_dt, pyNgbsNb)
 
-      integer :: pyNodesNb
+      integer :: pyNgbsNb
       real(kind=8),intent(in) :: Cdiff
-      real(kind=8),dimension(pyNodesNb,20),intent(in) :: pyEdges
+      real(kind=8),dimension(pyNgbsNb),intent(in) :: pyEdges
 
       real(kind=8),intent(out) :: cfl_dt
 
-      integer :: p, n
+      integer :: p
       real(kind=8) :: tmp
 
       cfl_dt = 1.e6
-      do p = 1, pyNodesNb
-        n = 1
-        do while(pyEdges(p,n) > 0.)
-           tmp = 0.05 * pyEdges(p,n)**2. / Cdiff
+      do p = 1, pyNgbsNb
+        if(pyEdges(p) > 0.)then
+           tmp = 0.05 * pyEdges(p)**2. / Cdiff
            cfl_dt = min(tmp,cfl_dt)
-           n = n + 1
-        enddo
+        endif
       enddo
 
       return
@@ -140,9 +168,10 @@ contains
 
   end subroutine flowcfl
 
-  subroutine sedflux_ero_only(pyStack, pyRcv, pyXY, pyXYmin, pyXYmax, pyDischarge, &
-      pyElev, pyDiff, Cero, spl_m, spl_n, sea, dt, pyChange, newdt, pylNodesNb, pygNodesNb)
+  subroutine sedflux_ero_only(pyStack, pyBasins, pyOrder, pyRcv, pyXY, pyXYmin, pyXYmax, pyDischarge, &
+      pyElev, pyDiff, Cero, spl_m, spl_n, sea, dt, pyChange, newdt, pyBasinNb, pylNodesNb, pygNodesNb)
 
+      integer :: pyBasinNb
       integer :: pylNodesNb
       integer :: pygNodesNb
       real(kind=8),intent(in) :: dt
@@ -152,6 +181,8 @@ contains
       real(kind=8),dimension(2),intent(in) :: pyXYmin
       real(kind=8),dimension(2),intent(in) :: pyXYmax
       integer,dimension(pylNodesNb),intent(in) :: pyStack
+      integer,dimension(pyBasinNb),intent(in) :: pyBasins
+      integer,dimension(pyBasinNb),intent(in) :: pyOrder
       integer,dimension(pygNodesNb),intent(in) :: pyRcv
       real(kind=8),dimension(pygNodesNb,2),intent(in) :: pyXY
       real(kind=8),dimension(pygNodesNb),intent(in) :: pyDischarge
@@ -162,55 +193,159 @@ contains
       real(kind=8),intent(out) :: newdt
       real(kind=8),dimension(pygNodesNb),intent(out) :: pyChange
 
-      integer :: n, donor, recvr
+      integer :: i, b, nstart, nend, n, donor, recvr
       real(kind=8) :: SPL, dh, dist
 
       newdt = dt
       pyChange = -1.e6
 
-      do n = pylNodesNb, 1, -1
-        SPL = 0.
-        donor = pyStack(n) + 1
-        recvr = pyRcv(donor) + 1
-        dh = 0.95*(pyElev(donor) - pyElev(recvr))
-        if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
-          dh = pyElev(donor) - sea
-        if(dh < 0.001) dh = 0.
-
-        ! Compute stream power law
-        if(recvr /= donor .and. dh > 0.)then
-          if(pyElev(donor) >= sea)then
-            dist = sqrt( (pyXY(donor,1)-pyXY(recvr,1))**2.0 + (pyXY(donor,2)-pyXY(recvr,2))**2.0 )
-            if(dist > 0.) SPL = -Cero(donor) * (pyDischarge(donor))**spl_m * (dh/dist)**spl_n
+      ! Drainage basins are independent and are processed concurrently,
+      ! the largest ones first. Fluxes are computed with the incoming time
+      ! step and the stable time step is a separate minimum reduction so
+      ! that the results do not depend on the number of threads
+      !$omp parallel private(i, b, n, nstart, nend, donor, recvr, SPL, dh, dist)
+      !$omp do schedule(dynamic,1) reduction(min:newdt)
+      do i = 1, pyBasinNb
+        b = pyOrder(i) + 1
+        nstart = pyBasins(b) + 1
+        nend = pylNodesNb
+        if(b < pyBasinNb) nend = pyBasins(b+1)
+        do n = nend, nstart, -1
+          SPL = 0.
+          donor = pyStack(n) + 1
+          recvr = pyRcv(donor) + 1
+          dh = 0.95*(pyElev(donor) - pyElev(recvr))
+          if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
+            dh = pyElev(donor) - sea
+          if(dh < 0.001) dh = 0.
+
+          ! Compute stream power law
+          if(recvr /= donor .and. dh > 0.)then
+            if(pyElev(donor) >= sea)then
+              dist = sqrt( (pyXY(donor,1)-pyXY(recvr,1))**2.0 + (pyXY(donor,2)-pyXY(recvr,2))**2.0 )
+              if(dist > 0.) SPL = -Cero(donor) * (pyDischarge(donor))**spl_m * (dh/dist)**spl_n
+            endif
           endif
-        endif
 
-        ! Erosion case
-        if(SPL < 0.)then
-            if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
-                newdt = min( newdt,-0.99*(pyElev(donor)-sea)/SPL)
-            if(-SPL * newdt > pyElev(donor) - pyElev(recvr)) &
-                newdt = min( newdt,-0.99*(pyElev(donor)-pyElev(recvr))/SPL)
-        endif
+          ! Erosion case
+          if(SPL < 0.)then
+              if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
+                  newdt = min( newdt,-0.99*(pyElev(donor)-sea)/SPL)
+              if(-SPL * dt > pyElev(donor) - pyElev(recvr)) &
+                  newdt = min( newdt,-0.99*(pyElev(donor)-pyElev(recvr))/SPL)
+          endif
 
-        ! Update sediment flux in receiver node
-        pyChange(donor) = SPL + pyDiff(donor)
+          ! Update sediment flux in receiver node
+          pyChange(donor) = SPL + pyDiff(donor)
 
-        ! Update borders
-        if(pyXY(donor,1) < pyXYmin(1) .or. pyXY(donor,2) < pyXYmin(2) .or. &
-            pyXY(donor,1) > pyXYmax(1) .or. pyXY(donor,2) > pyXYmax(2) ) &
-            pyChange(donor) = 0.
+          ! Update borders
+          if(pyXY(donor,1) < pyXYmin(1) .or. pyXY(donor,2) < pyXYmin(2) .or. &
+              pyXY(donor,1) > pyXYmax(1) .or. pyXY(donor,2) > pyXYmax(2) ) &
+              pyChange(donor) = 0.
 
+        enddo
       enddo
+      !$omp end do
+      !$omp end parallel
 
       return
 
   end subroutine sedflux_ero_only
 
-  subroutine sedflux_nocapacity_quick(pyStack, pyRcv, pyXY, pyArea, pyXYmin, pyXYmax, &
+  subroutine sedflux_ero_implicit(pyStack, pyBasins, pyOrder, pyRcv, pyXY, pyXYmin, pyXYmax, pyDischarge, &
+      pyElev, pyDiff, Cero, spl_m, spl_n, sea, dt, pyChange, newdt, pyBasinNb, pylNodesNb, pygNodesNb)
+
+      integer :: pyBasinNb
+      integer :: pylNodesNb
+      integer :: pygNodesNb
+      real(kind=8),intent(in) :: dt
+      real(kind=8),intent(in) :: sea
+      real(kind=8),intent(in) :: spl_n
+      real(kind=8),intent(in) :: spl_m
+      real(kind=8),dimension(2),intent(in) :: pyXYmin
+      real(kind=8),dimension(2),intent(in) :: pyXYmax
+      integer,dimension(pylNodesNb),intent(in) :: pyStack
+      integer,dimension(pyBasinNb),intent(in) :: pyBasins
+      integer,dimension(pyBasinNb),intent(in) :: pyOrder
+      integer,dimension(pygNodesNb),intent(in) :: pyRcv
+      real(kind=8),dimension(pygNodesNb,2),intent(in) :: pyXY
+      real(kind=8),dimension(pygNodesNb),intent(in) :: pyDischarge
+      real(kind=8),dimension(pygNodesNb),intent(in) :: Cero
+      real(kind=8),dimension(pygNodesNb),intent(in) :: pyElev
+      real(kind=8),dimension(pygNodesNb),intent(in) :: pyDiff
+
+      real(kind=8),intent(out) :: newdt
+      real(kind=8),dimension(pygNodesNb),intent(out) :: pyChange
+
+      integer :: i, b, nstart, nend, n, k, donor, recvr
+      real(kind=8) :: F, base, dist, h, dh, fx, dfx
+      real(kind=8),dimension(pygNodesNb) :: newElev
+
+      ! Implicit stream power law solved from the base level upstream following
+      ! Braun & Willett (2013). The receiver elevation at the end of the time step
+      ! is known when a donor is visited so the scheme is unconditionally stable.
+      newdt = dt
+      pyChange = -1.e6
+      newElev = pyElev
+
+      ! Drainage basins are independent and are processed concurrently,
+      ! the largest ones first
+      !$omp parallel private(i, b, n, nstart, nend, k, donor, recvr, F, base, dist, h, dh, fx, dfx)
+      !$omp do schedule(dynamic,1)
+      do i = 1, pyBasinNb
+        b = pyOrder(i) + 1
+        nstart = pyBasins(b) + 1
+        nend = pylNodesNb
+        if(b < pyBasinNb) nend = pyBasins(b+1)
+        do n = nstart, nend
+          donor = pyStack(n) + 1
+          recvr = pyRcv(donor) + 1
+
+          if(recvr /= donor .and. pyElev(donor) >= sea)then
+            base = newElev(recvr)
+            if(pyElev(donor) > sea .and. base < sea) base = sea
+            dist = sqrt( (pyXY(donor,1)-pyXY(recvr,1))**2.0 + (pyXY(donor,2)-pyXY(recvr,2))**2.0 )
+            if(pyElev(donor) - base >= 0.001 .and. dist > 0.)then
+              F = dt * Cero(donor) * (pyDischarge(donor))**spl_m / dist**spl_n
+              if(spl_n == 1.)then
+                newElev(donor) = (pyElev(donor) + F * base) / (1. + F)
+              else
+                ! Newton-Raphson iterations on the non-linear slope dependency
+                h = pyElev(donor)
+                do k = 1, 50
+                  dh = max(h - base, 0.)
+                  fx = h - pyElev(donor) + F * dh**spl_n
+                  dfx = 1. + spl_n * F * dh**(spl_n-1.)
+                  h = max(h - fx / dfx, base)
+                  if(abs(fx / dfx) < 1.e-6) exit
+                enddo
+                newElev(donor) = h
+              endif
+            endif
+          endif
+
+          ! Update sediment flux in receiver node
+          pyChange(donor) = (newElev(donor) - pyElev(donor)) / dt + pyDiff(donor)
+
+          ! Update borders
+          if(pyXY(donor,1) < pyXYmin(1) .or. pyXY(donor,2) < pyXYmin(2) .or. &
+              pyXY(donor,1) > pyXYmax(1) .or. pyXY(donor,2) > pyXYmax(2) ) &
+              pyChange(donor) = 0.
+
+        enddo
+      enddo
+      !$omp end do
+      !$omp end parallel
+
+      return
+
+  end subroutine sedflux_ero_implicit
+
+  subroutine sedflux_nocapacity_quick(pyStack, pyBasins, pyOrder, pyRcv, pyXY, pyArea, pyXYmin, pyXYmax, &
       pyDischarge, pyElev, pyDiff, Cero, spl_m, spl_n, sea, dt, pyChange, newdt, &
-      pylNodesNb, pygNodesNb)
+      pyBasinNb, pylNodesNb, pygNodesNb)
 
+      integer :: pyBasinNb
       integer :: pylNodesNb
       integer :: pygNodesNb
       real(kind=8),intent(in) :: dt
@@ -220,6 +355,8 @@ contains
       real(kind=8),dimension(2),intent(in) :: pyXYmin
       real(kind=8),dimension(2),intent(in) :: pyXYmax
       integer,dimension(pylNodesNb),intent(in) :: pyStack
+      integer,dimension(pyBasinNb),intent(in) :: pyBasins
+      integer,dimension(pyBasinNb),intent(in) :: pyOrder
       integer,dimension(pygNodesNb),intent(in) :: pyRcv
       real(kind=8),dimension(pygNodesNb,2),intent(in) :: pyXY
       real(kind=8),dimension(pygNodesNb),intent(in) :: pyArea
@@ -231,7 +368,7 @@ contains
       real(kind=8),intent(out) :: newdt
       real(kind=8),dimension(pygNodesNb),intent(out) :: pyChange
 
-      integer :: n, donor, recvr
+      integer :: i, b, nstart, nend, n, donor, recvr
       real(kind=8) :: SPL, Qs, dh, dist
       real(kind=8),dimension(pygNodesNb) :: sedFluxes
 
@@ -239,73 +376,86 @@ contains
       pyChange = -1.e6
       sedFluxes = 0.
 
-      do n = pylNodesNb, 1, -1
-        SPL = 0.
-        donor = pyStack(n) + 1
-        recvr = pyRcv(donor) + 1
-        dh = 0.95*(pyElev(donor) - pyElev(recvr))
-        if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
-          dh = pyElev(donor) - sea
-        if( dh < 0.001 ) dh = 0.
-
-        ! Compute stream power law
-        if( recvr /= donor .and. dh > 0.)then
-          if(pyElev(donor) >= sea)then
-            dist = sqrt( (pyXY(donor,1)-pyXY(recvr,1))**2.0 + (pyXY(donor,2)-pyXY(recvr,2))**2.0 )
-            if(dist > 0.) SPL = -Cero(donor) * (pyDischarge(donor))**spl_m * (dh/dist)**spl_n
+      ! Drainage basins are independent and are processed concurrently,
+      ! the largest ones first
+      !$omp parallel private(i, b, n, nstart, nend, donor, recvr, SPL, Qs, dh, dist)
+      !$omp do schedule(dynamic,1)
+      do i = 1, pyBasinNb
+        b = pyOrder(i) + 1
+        nstart = pyBasins(b) + 1
+        nend = pylNodesNb
+        if(b < pyBasinNb) nend = pyBasins(b+1)
+        do n = nend, nstart, -1
+          SPL = 0.
+          donor = pyStack(n) + 1
+          recvr = pyRcv(donor) + 1
+          dh = 0.95*(pyElev(donor) - pyElev(recvr))
+          if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
+            dh = pyElev(donor) - sea
+          if( dh < 0.001 ) dh = 0.
+
+          ! Compute stream power law
+          if( recvr /= donor .and. dh > 0.)then
+            if(pyElev(donor) >= sea)then
+              dist = sqrt( (pyXY(donor,1)-pyXY(recvr,1))**2.0 + (pyXY(donor,2)-pyXY(recvr,2))**2.0 )
+              if(dist > 0.) SPL = -Cero(donor) * (pyDischarge(donor))**spl_m * (dh/dist)**spl_n
+            endif
           endif
-        endif
 
-        Qs = 0.
+          Qs = 0.
 
-        ! Deposition case
-        if( SPL == 0. .and. pyArea(donor) > 0.)then
-          if(pyElev(donor) < sea)then
-              if(sedFluxes(donor)*newdt/pyArea(donor) < sea - pyElev(donor))then
-                SPL = sedFluxes(donor)/pyArea(donor)
-                Qs = 0.
-              else
-                SPL = (sea - pyElev(donor)) / newdt
-                Qs = sedFluxes(donor) - SPL*pyArea(donor)
-              endif
-          ! Base-level (sink)
-          elseif(donor == recvr .and. pyArea(donor) > 0.)then
-            SPL = sedFluxes(donor) / pyArea(donor)
-            Qs = 0.
-          else
-            Qs = sedFluxes(donor)
-          endif
+          ! Deposition case
+          if( SPL == 0. .and. pyArea(donor) > 0.)then
+            if(pyElev(donor) < sea)then
+                if(sedFluxes(donor)*dt/pyArea(donor) < sea - pyElev(donor))then
+                  SPL = sedFluxes(donor)/pyArea(donor)
+                  Qs = 0.
+                else
+                  SPL = (sea - pyElev(donor)) / dt
+                  Qs = sedFluxes(donor) - SPL*pyArea(donor)
+                endif
+            ! Base-level (sink)
+            elseif(donor == recvr .and. pyArea(donor) > 0.)then
+              SPL = sedFluxes(donor) / pyArea(donor)
+              Qs = 0.
+            else
+              Qs = sedFluxes(donor)
+            endif
 
-        ! Erosion case
-        elseif(SPL < 0.)then
+          ! Erosion case
+          elseif(SPL < 0.)then
 
-            if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
-                SPL = max(SPL,-0.99*(pyElev(donor)-sea)/newdt)
+              if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
+                  SPL = max(SPL,-0.99*(pyElev(donor)-sea)/dt)
 
-            if(-SPL * newdt > pyElev(donor) - pyElev(recvr)) &
-                SPL = max(SPL,-0.99*(pyElev(donor)-pyElev(recvr))/newdt)
+              if(-SPL * dt > pyElev(donor) - pyElev(recvr)) &
+                  SPL = max(SPL,-0.99*(pyElev(donor)-pyElev(recvr))/dt)
 
-            Qs = -SPL * pyArea(donor) + sedFluxes(donor)
-        endif
+              Qs = -SPL * pyArea(donor) + sedFluxes(donor)
+          endif
 
-        ! Update sediment flux in receiver node
-        sedFluxes(recvr) = sedFluxes(recvr) + Qs
-        pyChange(donor) = SPL + pyDiff(donor)
+          ! Update sediment flux in receiver node
+          sedFluxes(recvr) = sedFluxes(recvr) + Qs
+          pyChange(donor) = SPL + pyDiff(donor)
 
-        ! Update borders
-        if(pyXY(donor,1) < pyXYmin(1) .or. pyXY(donor,2) < pyXYmin(2) .or. &
-            pyXY(donor,1) > pyXYmax(1) .or. pyXY(donor,2) > pyXYmax(2) ) &
-            pyChange(donor) = 0.
+          ! Update borders
+          if(pyXY(donor,1) < pyXYmin(1) .or. pyXY(donor,2) < pyXYmin(2) .or. &
+              pyXY(donor,1) > pyXYmax(1) .or. pyXY(donor,2) > pyXYmax(2) ) &
+              pyChange(donor) = 0.
+        enddo
       enddo
+      !$omp end do
+      !$omp end parallel
 
       return
 
   end subroutine sedflux_nocapacity_quick
 
-  subroutine sedflux_nocapacity(pyStack, pyRcv, pyXY, pyArea, pyXYmin, pyXYmax, &
+  subroutine sedflux_nocapacity(pyStack, pyBasins, pyOrder, pyRcv, pyXY, pyArea, pyXYmin, pyXYmax, &
       pyMaxH, pyMaxD, pyDischarge, pyFillH, pyElev, pyDiff, Cero, &
-      spl_m, spl_n, sea, dt, pyChange, newdt, pylNodesNb, pygNodesNb)
+      spl_m, spl_n, sea, dt, pyChange, newdt, pyBasinNb, pylNodesNb, pygNodesNb)
 
+      integer :: pyBasinNb
       integer :: pylNodesNb
       integer :: pygNodesNb
       real(kind=8),intent(in) :: dt
@@ -315,6 +465,8 @@ contains
       real(kind=8),dimension(2),intent(in) :: pyXYmin
       real(kind=8),dimension(2),intent(in) :: pyXYmax
       integer,dimension(pylNodesNb),intent(in) :: pyStack
+      integer,dimension(pyBasinNb),intent(in) :: pyBasins
+      integer,dimension(pyBasinNb),intent(in) :: pyOrder
       integer,dimension(pygNodesNb),intent(in) :: pyRcv
       real(kind=8),dimension(pygNodesNb,2),intent(in) :: pyXY
       real(kind=8),dimension(pygNodesNb),intent(in) :: pyArea
@@ -329,7 +481,7 @@ contains
       real(kind=8),intent(out) :: newdt
       real(kind=8),dimension(pygNodesNb),intent(out) :: pyChange
 
-      integer :: n, donor, recvr
+      integer :: i, b, nstart, nend, n, donor, recvr
       real(kind=8) :: maxh, SPL, Qs, dh, mtime, waterH, dist
       real(kind=8),dimension(pygNodesNb) :: sedFluxes
 
@@ -337,100 +489,115 @@ contains
       pyChange = -1.e6
       sedFluxes = 0.
 
-      do n = pylNodesNb, 1, -1
-        SPL = 0.
-        donor = pyStack(n) + 1
-        recvr = pyRcv(donor) + 1
-        dh = 0.95*(pyElev(donor) - pyElev(recvr))
-        if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
-          dh = pyElev(donor) - sea
-        if( dh < 0.001 ) dh = 0.
-        waterH = pyFillH(donor)-pyElev(donor)
-
-        ! Compute stream power law
-        if( recvr /= donor .and. dh > 0.)then
-          if(waterH == 0. .and. pyElev(donor) >= sea)then
-            dist = sqrt( (pyXY(donor,1)-pyXY(recvr,1))**2.0 + (pyXY(donor,2)-pyXY(recvr,2))**2.0 )
-            if(dist > 0.) SPL = -Cero(donor) * (pyDischarge(donor))**spl_m * (dh/dist)**spl_n
+      ! Drainage basins are independent and are processed concurrently,
+      ! the largest ones first. Fluxes are computed with the incoming time
+      ! step and the stable time step is a separate minimum reduction so
+      ! that the results do not depend on the number of threads
+      !$omp parallel private(i, b, n, nstart, nend, donor, recvr, maxh, SPL, Qs, dh, mtime, waterH, dist)
+      !$omp do schedule(dynamic,1) reduction(min:newdt)
+      do i = 1, pyBasinNb
+        b = pyOrder(i) + 1
+        nstart = pyBasins(b) + 1
+        nend = pylNodesNb
+        if(b < pyBasinNb) nend = pyBasins(b+1)
+        do n = nend, nstart, -1
+          SPL = 0.
+          donor = pyStack(n) + 1
+          recvr = pyRcv(donor) + 1
+          dh = 0.95*(pyElev(donor) - pyElev(recvr))
+          if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
+            dh = pyElev(donor) - sea
+          if( dh < 0.001 ) dh = 0.
+          waterH = pyFillH(donor)-pyElev(donor)
+
+          ! Compute stream power law
+          if( recvr /= donor .and. dh > 0.)then
+            if(waterH == 0. .and. pyElev(donor) >= sea)then
+              dist = sqrt( (pyXY(donor,1)-pyXY(recvr,1))**2.0 + (pyXY(donor,2)-pyXY(recvr,2))**2.0 )
+              if(dist > 0.) SPL = -Cero(donor) * (pyDischarge(donor))**spl_m * (dh/dist)**spl_n
+            endif
           endif
-        endif
 
-        maxh = pyMaxH(donor)
-        if(pyElev(donor) < sea)then
-          maxh = sea - pyElev(donor)
-        elseif(waterH > 0.)then
-          maxh = min( waterH,maxh )
-        endif
-        maxh = 0.95*maxh
-        Qs = 0.
-
-        ! Deposition case
-        if( SPL == 0. .and. pyArea(donor) > 0.)then
-          if(maxh > 0. .and. pyElev(donor) < sea)then
-              if(sedFluxes(donor)*newdt/pyArea(donor) < maxh)then
-                SPL = sedFluxes(donor)/pyArea(donor)
-                Qs = 0.
-              else
-                SPL = maxh / newdt
-                Qs = sedFluxes(donor) - SPL*pyArea(donor)
-              endif
-          ! Fill depression
-          elseif(waterH > 0.0001 .and. donor /= recvr)then
-              dh = 0.95*waterH
-              if(sedFluxes(donor)*newdt/pyArea(donor) < dh)then
+          maxh = pyMaxH(donor)
+          if(pyElev(donor) < sea)then
+            maxh = sea - pyElev(donor)
+          elseif(waterH > 0.)then
+            maxh = min( waterH,maxh )
+          endif
+          maxh = 0.95*maxh
+          Qs = 0.
+
+          ! Deposition case
+          if( SPL == 0. .and. pyArea(donor) > 0.)then
+            if(maxh > 0. .and. pyElev(donor) < sea)then
+                if(sedFluxes(donor)*dt/pyArea(donor) < maxh)then
                   SPL = sedFluxes(donor)/pyArea(donor)
                   Qs = 0.
-              else
-                  SPL = dh / newdt
+                else
+                  SPL = maxh / dt
                   Qs = sedFluxes(donor) - SPL*pyArea(donor)
-              endif
-          ! Base-level (sink)
-          elseif(donor == recvr .and. pyArea(donor) > 0.)then
-            SPL = sedFluxes(donor) / pyArea(donor)
-            Qs = 0.
-          else
-            Qs = sedFluxes(donor)
-          endif
-        ! Erosion case
-        elseif(SPL < 0.)then
-            if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
-                newdt = min( newdt,-0.99*(pyElev(donor)-sea)/SPL)
+                endif
+            ! Fill depression
+            elseif(waterH > 0.0001 .and. donor /= recvr)then
+                dh = 0.95*waterH
+                if(sedFluxes(donor)*dt/pyArea(donor) < dh)then
+                    SPL = sedFluxes(donor)/pyArea(donor)
+                    Qs = 0.
+                else
+                    SPL = dh / dt
+                    Qs = sedFluxes(donor) - SPL*pyArea(donor)
+                endif
+            ! Base-level (sink)
+            elseif(donor == recvr .and. pyArea(donor) > 0.)then
+              SPL = sedFluxes(donor) / pyArea(donor)
+              Qs = 0.
+            else
+              Qs = sedFluxes(donor)
+            endif
+          ! Erosion case
+          elseif(SPL < 0.)then
+              if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
+                  newdt = min( newdt,-0.99*(pyElev(donor)-sea)/SPL)
 
-            if(-SPL * newdt > pyElev(donor) - pyElev(recvr)) &
-                newdt = min( newdt,-0.99*(pyElev(donor)-pyElev(recvr))/SPL)
+              if(-SPL * dt > pyElev(donor) - pyElev(recvr)) &
+                  newdt = min( newdt,-0.99*(pyElev(donor)-pyElev(recvr))/SPL)
 
-            Qs = -SPL * pyArea(donor) + sedFluxes(donor)
-        endif
+              Qs = -SPL * pyArea(donor) + sedFluxes(donor)
+          endif
 
-        ! Update sediment flux in receiver node
-        sedFluxes(recvr) = sedFluxes(recvr) + Qs
-        pyChange(donor) = SPL + pyDiff(donor)
+          ! Update sediment flux in receiver node
+          sedFluxes(recvr) = sedFluxes(recvr) + Qs
+          pyChange(donor) = SPL + pyDiff(donor)
 
-        ! Update borders
-        if(pyXY(donor,1) < pyXYmin(1) .or. pyXY(donor,2) < pyXYmin(2) .or. &
-            pyXY(donor,1) > pyXYmax(1) .or. pyXY(donor,2) > pyXYmax(2) ) &
-            pyChange(donor) = 0.
+          ! Update borders
+          if(pyXY(donor,1) < pyXYmin(1) .or. pyXY(donor,2) < pyXYmin(2) .or. &
+              pyXY(donor,1) > pyXYmax(1) .or. pyXY(donor,2) > pyXYmax(2) ) &
+              pyChange(donor) = 0.
 
-        ! Update base levels
-        if(donor == recvr .and. pyChange(donor) > 0.)then
-            if(waterH == 0.)then
-                mtime = pyMaxD(donor) / pyChange(donor)
-                newdt = min(newdt, mtime)
-            else
-                mtime = waterH / pyChange(donor)
-                newdt = min(newdt, mtime)
-            endif
-        endif
+          ! Update base levels
+          if(donor == recvr .and. pyChange(donor) > 0.)then
+              if(waterH == 0.)then
+                  mtime = pyMaxD(donor) / pyChange(donor)
+                  newdt = min( newdt, mtime)
+              else
+                  mtime = waterH / pyChange(donor)
+                  newdt = min( newdt, mtime)
+              endif
+          endif
+        enddo
       enddo
+      !$omp end do
+      !$omp end parallel
 
       return
 
   end subroutine sedflux_nocapacity
 
-  subroutine sedflux_capacity(pyStack, pyRcv, pyXY, pyArea, pyXYmin, pyXYmax, &
+  subroutine sedflux_capacity(pyStack, pyBasins, pyOrder, pyRcv, pyXY, pyArea, pyXYmin, pyXYmax, &
       pyDischarge, pyElev, pyDiff, pyCum, Cero, spl_m, spl_n, Lb, La, sea, dt, &
-      pyChange, newdt, pylNodesNb, pygNodesNb)
+      pyChange, newdt, pyBasinNb, pylNodesNb, pygNodesNb)
 
+      integer :: pyBasinNb
       integer :: pylNodesNb
       integer :: pygNodesNb
       real(kind=8),intent(in) :: dt
@@ -442,6 +609,8 @@ contains
       real(kind=8),dimension(2),intent(in) :: pyXYmin
       real(kind=8),dimension(2),intent(in) :: pyXYmax
       integer,dimension(pylNodesNb),intent(in) :: pyStack
+      integer,dimension(pyBasinNb),intent(in) :: pyBasins
+      integer,dimension(pyBasinNb),intent(in) :: pyOrder
       integer,dimension(pygNodesNb),intent(in) :: pyRcv
       real(kind=8),dimension(pygNodesNb,2),intent(in) :: pyXY
       real(kind=8),dimension(pygNodesNb),intent(in) :: pyArea
@@ -454,7 +623,7 @@ contains
       real(kind=8),intent(out) :: newdt
       real(kind=8),dimension(pygNodesNb),intent(out) :: pyChange
 
-      integer :: n, donor, recvr
+      integer :: i, b, nstart, nend, n, donor, recvr
       real(kind=8) :: maxh, SPL, SQL, Qs, dh, dist
       real(kind=8),dimension(pygNodesNb) :: sedFluxes
 
@@ -462,72 +631,84 @@ contains
       pyChange = -1.e6
       sedFluxes = 0.
 
-      do n = pylNodesNb, 1, -1
-        SPL = 0.
-        SQL = 0.
-        donor = pyStack(n) + 1
-        recvr = pyRcv(donor) + 1
-        dh = 0.95*(pyElev(donor) - pyElev(recvr))
-        if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
-          dh = pyElev(donor) - sea
-        if( dh < 0.001 ) dh = 0.
-
-        ! Compute stream power law
-        dist = sqrt( (pyXY(donor,1)-pyXY(recvr,1))**2.0 + &
-                     (pyXY(donor,2)-pyXY(recvr,2))**2.0 )
-        if(dist > 0.) SPL = Cero(donor) * (pyDischarge(donor))**spl_m * (dh/dist)**spl_n
-
-        Qs = 0.
-
-        if( pyArea(donor) > 0. )then
-          SQL = ( sedFluxes(donor) - SPL ) / pyArea(donor)
-          if( pyCum(donor) > 0.1 )then
-            SQL = SQL * dist / La
-          else
-            SQL = SQL * dist / Lb
-          endif
-
-          if( pyElev(donor) < sea .and. sedFluxes(donor) > 0. &
-           .and. donor /= recvr)then
-            maxh = 0.98 * ( sea - pyElev(donor) )
-            if( sedFluxes(donor)*newdt / pyArea(donor) < maxh )then
-              SQL = sedFluxes(donor) / pyArea(donor)
-              Qs = 0.
+      ! Drainage basins are independent and are processed concurrently,
+      ! the largest ones first
+      !$omp parallel private(i, b, n, nstart, nend, donor, recvr, maxh, SPL, SQL, Qs, dh, dist)
+      !$omp do schedule(dynamic,1)
+      do i = 1, pyBasinNb
+        b = pyOrder(i) + 1
+        nstart = pyBasins(b) + 1
+        nend = pylNodesNb
+        if(b < pyBasinNb) nend = pyBasins(b+1)
+        do n = nend, nstart, -1
+          SPL = 0.
+          SQL = 0.
+          donor = pyStack(n) + 1
+          recvr = pyRcv(donor) + 1
+          dh = 0.95*(pyElev(donor) - pyElev(recvr))
+          if(pyElev(donor) > sea .and. pyElev(recvr) < sea) &
+            dh = pyElev(donor) - sea
+          if( dh < 0.001 ) dh = 0.
+
+          ! Compute stream power law
+          dist = sqrt( (pyXY(donor,1)-pyXY(recvr,1))**2.0 + &
+                       (pyXY(donor,2)-pyXY(recvr,2))**2.0 )
+          if(dist > 0.) SPL = Cero(donor) * (pyDischarge(donor))**spl_m * (dh/dist)**spl_n
+
+          Qs = 0.
+
+          if( pyArea(donor) > 0. )then
+            SQL = ( sedFluxes(donor) - SPL ) / pyArea(donor)
+            if( pyCum(donor) > 0.1 )then
+              SQL = SQL * dist / La
             else
-              SQL = maxh / newdt
-              Qs = sedFluxes(donor) - SQL * pyArea(donor)
+              SQL = SQL * dist / Lb
             endif
 
-          elseif( SQL < 0. .and. donor /= recvr)then
-            if( -SQL * newdt > dh )then
-              SQL = -dh / newdt
-            endif
-            Qs = sedFluxes(donor) - SQL * pyArea(donor)
+            if( pyElev(donor) < sea .and. sedFluxes(donor) > 0. &
+             .and. donor /= recvr)then
+              maxh = 0.98 * ( sea - pyElev(donor) )
+              if( sedFluxes(donor)*dt / pyArea(donor) < maxh )then
+                SQL = sedFluxes(donor) / pyArea(donor)
+                Qs = 0.
+              else
+                SQL = maxh / dt
+                Qs = sedFluxes(donor) - SQL * pyArea(donor)
+              endif
 
-          elseif( SQL > 0. .and. donor /= recvr)then
-            Qs = sedFluxes(donor) - SQL * pyArea(donor)
+            elseif( SQL < 0. .and. donor /= recvr)then
+              if( -SQL * dt > dh )then
+                SQL = -dh / dt
+              endif
+              Qs = sedFluxes(donor) - SQL * pyArea(donor)
 
-          elseif( SQL == 0. .and. donor /= recvr)then
-            Qs = sedFluxes(donor)
+            elseif( SQL > 0. .and. donor /= recvr)then
+              Qs = sedFluxes(donor) - SQL * pyArea(donor)
 
-          ! Base-level
-          else
-            SQL = sedFluxes(donor) / pyArea(donor)
-            Qs = 0.
-          endif
+            elseif( SQL == 0. .and. donor /= recvr)then
+              Qs = sedFluxes(donor)
 
-        endif
+            ! Base-level
+            else
+              SQL = sedFluxes(donor) / pyArea(donor)
+              Qs = 0.
+            endif
 
-        ! Update sediment flux in receiver node
-        sedFluxes(recvr) = sedFluxes(recvr) + Qs
-        pyChange(donor) = SQL + pyDiff(donor)
+          endif
+
+          ! Update sediment flux in receiver node
+          sedFluxes(recvr) = sedFluxes(recvr) + Qs
+          pyChange(donor) = SQL + pyDiff(donor)
 
-        ! Update borders
-        if(pyXY(donor,1) < pyXYmin(1) .or. pyXY(donor,2) < pyXYmin(2) .or. &
-            pyXY(donor,1) > pyXYmax(1) .or. pyXY(donor,2) > pyXYmax(2) ) &
-            pyChange(donor) = 0.
+          ! Update borders
+          if(pyXY(donor,1) < pyXYmin(1) .or. pyXY(donor,2) < pyXYmin(2) .or. &
+              pyXY(donor,1) > pyXYmax(1) .or. pyXY(donor,2) > pyXYmax(2) ) &
+              pyChange(donor) = 0.
 
+        enddo
       enddo
+      !$omp end do
+      !$omp end parallel
 
       return
 
@@ -561,14 +742,16 @@ contains
   end subroutine base_ids
 
   ! THIS IS NOT USED
-  subroutine basin_edges(pyGIDs, pyNgbs, pyBasinID, pyEdgesID, &
-      pylNodesNb, pygNodesNb)
+  subroutine basin_edges(pyGIDs, pyBasinID, pyOffsets, pyNgbs, pyEdgesID, &
+      pylNodesNb, pygNodesNb, pyNgbsNb)
 
       integer :: pylNodesNb
       integer :: pygNodesNb
+      integer :: pyNgbsNb
       integer,dimension(pylNodesNb),intent(in) :: pyGIDs
       integer,dimension(pygNodesNb),intent(in) :: pyBasinID
-      integer,dimension(pylNodesNb,20),intent(in) :: pyNgbs
+      integer,dimension(pygNodesNb+1),intent(in) :: pyOffsets
+      integer,dimension(pyNgbsNb),intent(in) :: pyNgbs
 
       integer,dimension(pylNodesNb),intent(out) :: pyEdgesID
 
@@ -578,14 +761,12 @@ contains
       k = 0
       do n = 1, pylNodesNb
         gid = pyGIDs(n)+1
-        p = 1
-        lp: do while(pyNgbs(n,p) >=0 )
-          if(pyBasinID(pyNgbs(n,p)+1) /= pyBasinID(gid))then
+        lp: do p = pyOffsets(gid)+1, pyOffsets(gid+1)
+          if(pyBasinID(pyNgbs(p)+1) /= pyBasinID(gid))then
             k = k+1
             pyEdgesID(k) = gid-1
             exit lp
           endif
-          p = p+1
         enddo lp
       enddo
 
@@ -18,25 +18,38 @@ module flwstack
   integer,dimension(:),allocatable :: Donors
   integer,dimension(:),allocatable :: Delta
   integer,dimension(:),allocatable :: stackOrder
-  
+  integer,dimension(:),allocatable :: walkNodes
+  integer,dimension(:),allocatable :: walkDonors
+
 contains
 
-  recursive function addtostack(base,donor,stackID) result(success)
-  
-      integer :: base,donor,stackID,n,success
-
-      success = 1
-      do n = Delta(donor),Delta(donor+1)-1
-          if((allocs(Donors(n)) /= base))then
-              donor = Donors(n)
-              stackID = stackID+1
-              stackOrder(stackID) = donor
-              allocs(donor) = base
-              success = addtostack(base,donor,stackID)
+  subroutine addtostack(base,donor,stackID)
+
+      ! Depth-first walk of the donors tree using an explicit stack: each level
+      ! stores the visited node and the position of its next donor to process.
+      integer :: base,donor,stackID,top,node,n
+
+      top = 1
+      walkNodes(top) = donor
+      walkDonors(top) = Delta(donor)
+      do while(top > 0)
+          node = walkNodes(top)
+          if(walkDonors(top) < Delta(node+1))then
+              n = Donors(walkDonors(top))
+              walkDonors(top) = walkDonors(top)+1
+              if(allocs(n) /= base)then
+                  stackID = stackID+1
+                  stackOrder(stackID) = n
+                  allocs(n) = base
+                  top = top+1
+                  walkNodes(top) = n
+                  walkDonors(top) = Delta(n)
+              endif
+          else
+              top = top-1
           endif
       enddo
-      success = 0
 
-  end function addtostack
+  end subroutine addtostack
 
-end module flwstack
\ No newline at end of file
+end module flwstack
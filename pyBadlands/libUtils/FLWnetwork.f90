@@ -18,54 +18,79 @@ module fstack
   
 contains
 
-  subroutine build(pyBase,pyRcv,pyDelta,pyDonors,pyStackOrder,pyBaseNb,pyDeltaNb,pyNodesNb)
-  
+  subroutine build(pyBase,pyRcv,pyDelta,pyDonors,pyStackOrder,pyBasins,pyStackNb,pyMaxDonors,pyBaseNb,pyNodesNb)
+
       integer :: pyBaseNb
-      integer :: pyDeltaNb
       integer :: pyNodesNb
       integer,dimension(pyBaseNb),intent(in) :: pyBase
       integer,dimension(pyNodesNb),intent(in) :: pyRcv
-      integer,dimension(pyDeltaNb),intent(in) :: pyDelta
-      
+
+      integer,intent(out) :: pyStackNb
+      integer,intent(out) :: pyMaxDonors
+      integer,dimension(pyNodesNb+1),intent(out) :: pyDelta
       integer,dimension(pyNodesNb),intent(out) :: pyDonors
       integer,dimension(pyNodesNb),intent(out) :: pyStackOrder
+      integer,dimension(pyBaseNb),intent(out) :: pyBasins
+
+      integer :: p,j,k,r
+      integer,dimension(:),allocatable :: intArray
 
-      integer :: p,j,k,success
-      integer,dimension(pyNodesNb) :: intArray
-      
       j = 0
-      
+
       if(allocated(stackOrder)) deallocate(stackOrder)
       if(allocated(allocs)) deallocate(allocs)
       if(allocated(Donors)) deallocate(Donors)
       if(allocated(Delta)) deallocate(Delta)
+      if(allocated(walkNodes)) deallocate(walkNodes)
+      if(allocated(walkDonors)) deallocate(walkDonors)
       allocate(stackOrder(pyNodesNb))
       allocate(allocs(pyNodesNb))
       allocate(Donors(pyNodesNb))
-      allocate(Delta(pyDeltaNb))
-      
+      allocate(Delta(pyNodesNb+1))
+      allocate(walkNodes(pyNodesNb))
+      allocate(walkDonors(pyNodesNb))
+      allocate(intArray(pyNodesNb))
+
+      ! Number of donors for each node
       intArray = 0
-      
-      stackOrder = 0
-      Delta = pyDelta+1
-      
       do k = 1, pyNodesNb
-          Donors(Delta(pyRcv(k)+1) + intArray(pyRcv(k)+1)) = k
-          intArray(pyRcv(k)+1) = intArray(pyRcv(k)+1)+1
+          r = pyRcv(k)+1
+          intArray(r) = intArray(r)+1
+      enddo
+      pyMaxDonors = maxval(intArray)
+
+      ! Delta array: index where each node donors list begins
+      Delta(1) = 1
+      do k = 1, pyNodesNb
+          Delta(k+1) = Delta(k)+intArray(k)
       enddo
-      
+
+      ! Donors list
+      intArray = 0
+      do k = 1, pyNodesNb
+          r = pyRcv(k)+1
+          Donors(Delta(r) + intArray(r)) = k
+          intArray(r) = intArray(r)+1
+      enddo
+
+      stackOrder = 0
       allocs = -1
       do p = 1, pyBaseNb
           k = pyBase(p)+1
+          ! Drainage basins are stored one after the other in the stack
+          pyBasins(p) = j
           j = j+1
           stackOrder(j) = k
           allocs(k) = p
-          success = addtostack(p,k,j)
+          call addtostack(p,k,j)
       enddo
-  
+      deallocate(intArray)
+
+      pyStackNb = j
+      pyDelta = Delta-1
       pyDonors = Donors-1
       pyStackOrder = stackOrder-1
-  
+
       return
 
   end subroutine build
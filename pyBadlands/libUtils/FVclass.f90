@@ -480,6 +480,7 @@ module fvclass
 
   real(kind=8)::dminX,dminY,dmaxX,dmaxY
 
+  integer :: maxngb
   integer :: onodes
   integer :: gnodes
   integer :: dnodes
@@ -523,9 +524,9 @@ contains
     if(allocated(tri_distance)) deallocate(tri_distance)
     if(allocated(tri_voronoi_edge)) deallocate(tri_voronoi_edge)
     allocate(tri_ngbNb(dnodes))
-    allocate(tri_ngbID(dnodes,20))
-    allocate(tri_distance(dnodes,20))
-    allocate(tri_voronoi_edge(dnodes,20))
+    allocate(tri_ngbID(dnodes,maxngb))
+    allocate(tri_distance(dnodes,maxngb))
+    allocate(tri_voronoi_edge(dnodes,maxngb))
     if(allocated(mask)) deallocate(mask)
     allocate(mask(vnodes))
     dminX = 1.e8
@@ -551,14 +552,14 @@ contains
 
   end subroutine get_data
   ! =====================================================================================
-  subroutine build_export_arrays_o(pyVarea,pyNgbs,pyVlenght,pyDlenght,pymaxNgbh)
+  subroutine build_export_arrays_o(pyVarea,pyNgbs,pyVlenght,pyDlenght,pymaxNgbh,pyngbNb)
 
     integer :: cell,c,o,idd
-    integer :: pymaxNgbh
+    integer :: pymaxNgbh,pyngbNb
     real(kind=8),dimension(dnodes) :: pyVarea
-    integer,dimension(dnodes,20) :: pyNgbs
-    real(kind=8),dimension(dnodes,20) :: pyVlenght
-    real(kind=8),dimension(dnodes,20) :: pyDlenght
+    integer,dimension(dnodes,pyngbNb) :: pyNgbs
+    real(kind=8),dimension(dnodes,pyngbNb) :: pyVlenght
+    real(kind=8),dimension(dnodes,pyngbNb) :: pyDlenght
 
     pyVarea = 0.
     pyNgbs = -2
@@ -586,11 +587,11 @@ contains
 
     logical::rec,rec2,overOn
     integer::cell,n,id,id1,id2,id3,p,k,nvert,pt(2),c,k1,k2,pp
-    integer,dimension(20)::vsort,sortedID
+    integer,dimension(maxngb)::vsort,sortedID
     integer,dimension(dedges)::ed1,ed2,rk1,rk2
     real(kind=8)::dist,area,s1,s2
     real(kind=8),dimension(2)::pt1,pt2,pt3,pt4
-    real(kind=8),dimension(20)::vnx,vny
+    real(kind=8),dimension(maxngb)::vnx,vny
 
     if(allocated(voronoi_area)) deallocate(voronoi_area)
     if(allocated(voronoi_border)) deallocate(voronoi_border)
@@ -599,7 +600,7 @@ contains
     allocate(voronoi_area(dnodes))
     allocate(voronoi_border(dnodes))
     allocate(voronoi_vertexNb(dnodes))
-    allocate(voronoi_vertexID(dnodes,20))
+    allocate(voronoi_vertexID(dnodes,maxngb))
     ed1(:)=tEdge(:,1)
     ed2(:)=tEdge(:,2)
     call mrgrnk(ed1,rk1)
@@ -627,9 +628,10 @@ contains
          endif
        enddo lp_ed0
        tri_ngbNb(cell)=0
-       tri_ngbID(cell,1:20)=-1
-       tri_voronoi_edge(cell,1:20)=0.0
-       voronoi_vertexID(cell,1:20)=-1
+       tri_ngbID(cell,1:maxngb)=-1
+       tri_voronoi_edge(cell,1:maxngb)=0.0
+       tri_distance(cell,1:maxngb)=0.0
+       voronoi_vertexID(cell,1:maxngb)=-1
        voronoi_vertexNb(cell)=0
        voronoi_border(cell)=0
        voronoi_area(cell)=0.0
@@ -832,7 +834,7 @@ contains
   subroutine envelope(x,y,n,vertex,nvert)
 
     integer :: n,vertex(n),nvert,iwk(n)
-    integer :: next(20),i,i1,i2,j,jp1,jp2,i2save,i3,i2next
+    integer :: next(n+1),i,i1,i2,j,jp1,jp2,i2save,i3,i2next
 
     real(kind=8) :: x(n),y(n),xmax,xmin,ymax,ymin,dist,dmax,dmin,x1,y1
     real(kind=8) :: dx,dy,x2,y2,dx1,dx2,dmax1,dmax2,dy1,dy2,temp,zero
@@ -17,9 +17,10 @@ module discretisation
 
 contains
 
-    subroutine build(pyOids,pyGids,pytX,pytY,pytEdge,pytElmt,pyvX,pyvY,pyvEdge,pyVarea,pyNgbs, &
+    subroutine build(pyOids,pyGids,pytX,pytY,pytEdge,pytElmt,pyvX,pyvY,pyvEdge,pyngbNb,pyVarea,pyNgbs, &
       pyVlenght,pyDlenght,pymaxNgbh,pygnodes,pyonodes,pydnodes,pydedges,pydelems,pyvnodes,pyvedges) 
      
+      integer :: pyngbNb
       integer :: pyonodes
       integer :: pygnodes
       integer :: pydnodes
@@ -39,9 +40,9 @@ contains
       integer,intent(in) :: pyvEdge(pyvedges,2)
       ! To compute within the module
       real(kind=8),intent(out) :: pyVarea(pydnodes)
-      integer,intent(out) :: pyNgbs(pydnodes,20)
-      real(kind=8),intent(out) :: pyVlenght(pydnodes,20)
-      real(kind=8),intent(out) :: pyDlenght(pydnodes,20)
+      integer,intent(out) :: pyNgbs(pydnodes,pyngbNb)
+      real(kind=8),intent(out) :: pyVlenght(pydnodes,pyngbNb)
+      real(kind=8),intent(out) :: pyDlenght(pydnodes,pyngbNb)
       integer,intent(out) :: pymaxNgbh
       
       onodes = pyonodes
@@ -52,6 +53,9 @@ contains
       dedges = pydedges
       vedges = pyvedges
       pymaxNgbh = 0
+      ! Voronoi vertices of a cell are bounded by its number of edges, keep
+      ! one extra slot for the closing vertex of the convex hull
+      maxngb = pyngbNb + 1
       
       if(allocated(gIDs)) deallocate(gIDs)
       allocate(gIDs(gnodes))
@@ -80,7 +84,7 @@ contains
       
       call get_data
       call delaunay_voronoi_duality(.true.)
-      call build_export_arrays_o(pyVarea,pyNgbs,pyVlenght,pyDlenght,pymaxNgbh) 
+      call build_export_arrays_o(pyVarea,pyNgbs,pyVlenght,pyDlenght,pymaxNgbh,pyngbNb) 
       
     end subroutine build
     
@@ -15,15 +15,17 @@ module pdcompute
 
 contains
 
-  subroutine filling(elevation,pyNgbs,fillTH,epsilon,pybounds,sealimit,demH,pydnodes)
+  subroutine filling(elevation,pyOffsets,pyNgbs,fillTH,epsilon,pybounds,sealimit,demH,pydnodes,pyngbsnb)
 
       integer :: pydnodes
+      integer :: pyngbsnb
       integer,intent(in) :: pybounds
       real(kind=8),intent(in) :: sealimit
       real(kind=8),intent(in) :: fillTH
       real(kind=8),intent(in) :: epsilon
       real(kind=8),intent(in) :: elevation(pydnodes)
-      integer,intent(in) :: pyNgbs(pydnodes,20)
+      integer,intent(in) :: pyOffsets(pydnodes+1)
+      integer,intent(in) :: pyNgbs(pyngbsnb)
       real(kind=8),intent(out) :: demH(pydnodes)
 
       logical :: flag
@@ -44,13 +46,12 @@ contains
         flag=.false.
         do k=1,pydnodes
           if( demH(k) > elevation(k) )then
-            loop: do p = 1, 20
-                if( pyNgbs(k,p) < 0) exit loop
-                if( elevation(k) >= demH(pyNgbs(k,p)+1) + epsilon )then
+            loop: do p = pyOffsets(k)+1, pyOffsets(k+1)
+                if( elevation(k) >= demH(pyNgbs(p)+1) + epsilon )then
                     demH(k) = elevation(k)
                 else
-                    if( demH(k) > demH(pyNgbs(k,p)+1) + epsilon )then
-                        demH(k) = demH(pyNgbs(k,p)+1) + epsilon
+                    if( demH(k) > demH(pyNgbs(p)+1) + epsilon )then
+                        demH(k) = demH(pyNgbs(p)+1) + epsilon
                         if(demH(k) - elevation(k) > fillTH)then
                             demH(k) = elevation(k) + fillTH
                         else
@@ -82,14 +83,182 @@ module pdstack
   ! Set the size of allocated memory blocks
   integer :: block_size
 
-  ! Set neighbourhood array
-  integer,allocatable, dimension(:,:) :: neighbours
+  ! Set neighbourhood arrays in compressed sparse row form
+  integer,allocatable, dimension(:) :: ngbOff
+  integer,allocatable, dimension(:) :: ngbIDs
 
   integer :: bds
   real(kind=8) :: eps, fill_TH
 
+  ! Define the binary heap and queue used by the priority-flood algorithm
+  integer :: hsize = 0
+  integer, allocatable, dimension(:) :: heapID
+  real(kind=8), allocatable, dimension(:) :: heapH
+  integer, allocatable, dimension(:) :: fqueue
+
+  ! Define the filled surface kept between incremental updates
+  logical :: incfill = .false.
+  integer :: incAll, incStep
+  real(kind=8) :: incSea
+  integer :: fvisit = 0
+  integer, allocatable, dimension(:) :: fparent, fchild, fnext, fprev
+  integer, allocatable, dimension(:) :: fstamp, flist, fwalk
+  logical, allocatable, dimension(:) :: fseed, fflood
+  real(kind=8), allocatable, dimension(:) :: refZ, incH
+
+  ! Define the nodes flooded by the local partition and its ghost nodes
+  logical, allocatable, dimension(:) :: fowned
+  integer, allocatable, dimension(:) :: fghosts
+
 contains
 
+  subroutine heappush(k, h)
+
+    integer :: k, n, p, tmpID
+    real(kind=8) :: h, tmpH
+    integer, allocatable, dimension(:) :: growID
+    real(kind=8), allocatable, dimension(:) :: growH
+
+    ! Increase heap capacity when required
+    if( hsize == size(heapID) )then
+      allocate(growID(2*hsize),growH(2*hsize))
+      growID(1:hsize) = heapID(1:hsize)
+      growH(1:hsize) = heapH(1:hsize)
+      call move_alloc(growID,heapID)
+      call move_alloc(growH,heapH)
+    endif
+
+    hsize = hsize + 1
+    heapID(hsize) = k
+    heapH(hsize) = h
+
+    ! Sift up
+    n = hsize
+    do while( n > 1 )
+      p = n / 2
+      if( heapH(p) <= heapH(n) ) exit
+      tmpID = heapID(p)
+      tmpH = heapH(p)
+      heapID(p) = heapID(n)
+      heapH(p) = heapH(n)
+      heapID(n) = tmpID
+      heapH(n) = tmpH
+      n = p
+    enddo
+
+  end subroutine heappush
+
+  subroutine heappop(k, h)
+
+    integer :: k, n, c, tmpID
+    real(kind=8) :: h, tmpH
+
+    k = heapID(1)
+    h = heapH(1)
+    heapID(1) = heapID(hsize)
+    heapH(1) = heapH(hsize)
+    hsize = hsize - 1
+
+    ! Sift down
+    n = 1
+    do while( 2*n <= hsize )
+      c = 2*n
+      if( c < hsize )then
+        if( heapH(c+1) < heapH(c) ) c = c + 1
+      endif
+      if( heapH(n) <= heapH(c) ) exit
+      tmpID = heapID(c)
+      tmpH = heapH(c)
+      heapID(c) = heapID(n)
+      heapH(c) = heapH(n)
+      heapID(n) = tmpID
+      heapH(n) = tmpH
+      n = c
+    enddo
+
+  end subroutine heappop
+
+  subroutine priorityPD(elevation, demH, allfill, qtail, pydnodes)
+
+    integer :: pydnodes, allfill, n, k, p, qhead, qtail
+    real(kind=8) :: h, hnew
+    real(kind=8),intent(in) :: elevation(pydnodes)
+    real(kind=8),intent(inout) :: demH(pydnodes)
+
+    ! A node standing at its own elevation is final and goes through the
+    ! plain queue, only nodes raised by the filling need the priority queue.
+    ! Each neighbour gets the Planchon & Darboux value: at least eps above
+    ! the node it spills to and at most fill_TH above its own elevation.
+    qhead = 1
+    do while( qhead <= qtail .or. hsize > 0 )
+      if( qhead <= qtail )then
+        k = fqueue(qhead)
+        qhead = qhead + 1
+        h = demH(k)
+      else
+        call heappop(k,h)
+        if( h > demH(k) ) cycle
+      endif
+      loop: do p = ngbOff(k)+1, ngbOff(k+1)
+        n = ngbIDs(p)+1
+        if( .not. fowned(n) ) cycle
+        hnew = h + eps
+        if( allfill == 0 .and. hnew - elevation(n) > fill_TH ) hnew = elevation(n) + fill_TH
+        if( hnew < elevation(n) ) hnew = elevation(n)
+        if( hnew < demH(n) )then
+          demH(n) = hnew
+          if( allfill == 0 .and. hnew == elevation(n) + fill_TH )then
+            call setparent(n,-1)
+          else
+            call setparent(n,k)
+          endif
+          if( hnew == elevation(n) )then
+            qtail = qtail + 1
+            fqueue(qtail) = n
+          else
+            call heappush(n,hnew)
+          endif
+        endif
+      enddo loop
+    enddo
+
+    return
+
+  end subroutine priorityPD
+
+  subroutine setparent(n, k)
+
+    integer :: n, k, p
+
+    ! Spill tree stored as linked lists of the children of each node, capped
+    ! nodes (-1) do not depend on the node they spill to and seeds (0) have
+    ! no parent
+    p = fparent(n)
+    if( p > 0 )then
+      if( fprev(n) > 0 )then
+        fnext(fprev(n)) = fnext(n)
+      else
+        fchild(p) = fnext(n)
+      endif
+      if( fnext(n) > 0 ) fprev(fnext(n)) = fprev(n)
+    endif
+    fparent(n) = k
+    if( k > 0 )then
+      fprev(n) = 0
+      fnext(n) = fchild(k)
+      if( fchild(k) > 0 ) fprev(fchild(k)) = n
+      fchild(k) = n
+    endif
+
+  end subroutine setparent
+
+  subroutine resettree()
+
+    fparent = 0
+    fchild = 0
+
+  end subroutine resettree
+
   subroutine initialisePD(elevation, demH, sealimit, pydnodes)
 
     integer :: pydnodes, k
@@ -129,20 +298,19 @@ contains
         if( demH(k) > elevation(k) )then
           ! Get minimum value
           hmin = 2.e6
-          loop: do p = 1, 20
-            if( neighbours(k,p) < 0 ) exit loop
-            hmin = min(hmin,demH(neighbours(k,p)+1))
+          loop: do p = ngbOff(k)+1, ngbOff(k+1)
+            hmin = min(hmin,demH(ngbIDs(p)+1))
           enddo loop
           if( elevation(k) >= hmin + eps )then
             demH(k) = elevation(k)
+            change = .true.
           else
             if( demH(k) > hmin + eps )then
               demH(k) = hmin + eps
               if( demH(k) - elevation(k) > fill_TH )then
                 demH(k) = elevation(k) + fill_TH
-              else
-                change = .true.
               endif
+              change = .true.
             endif
             s2 = s2 + 1
             data2(s2) = k
@@ -176,12 +344,12 @@ contains
         if( demH(k) > elevation(k) )then
           ! Get minimum value
           hmin = 2.e6
-          loop: do p = 1, 20
-            if( neighbours(k,p) < 0 ) exit loop
-            hmin = min(hmin,demH(neighbours(k,p)+1))
+          loop: do p = ngbOff(k)+1, ngbOff(k+1)
+            hmin = min(hmin,demH(ngbIDs(p)+1))
           enddo loop
           if( elevation(k) >= hmin + eps )then
             demH(k) = elevation(k)
+            change = .true.
           else
             if( demH(k) > hmin + eps )then
               demH(k) = hmin + eps
@@ -203,17 +371,46 @@ contains
 
   end subroutine allfillPD
 
-  subroutine pitparams(pyNgbs,fillTH,epsilon,pybounds,pydnodes)
+  subroutine pitparams(pyOffsets,pyNgbs,fillTH,epsilon,pybounds,pydnodes,pyngbsnb)
 
     integer :: pydnodes
+    integer :: pyngbsnb
     integer,intent(in) :: pybounds
     real(kind=8),intent(in) :: fillTH
     real(kind=8),intent(in) :: epsilon
-    integer,intent(in) :: pyNgbs(pydnodes,20)
-
-    if(allocated(neighbours)) deallocate(neighbours)
-    allocate(neighbours(pydnodes,20))
-    neighbours = pyNgbs
+    integer,intent(in) :: pyOffsets(pydnodes+1)
+    integer,intent(in) :: pyNgbs(pyngbsnb)
+
+    if(allocated(ngbOff)) deallocate(ngbOff)
+    if(allocated(ngbIDs)) deallocate(ngbIDs)
+    allocate(ngbOff(pydnodes+1),ngbIDs(pyngbsnb))
+    ngbOff = pyOffsets
+    ngbIDs = pyNgbs
+    if(allocated(fqueue)) deallocate(fqueue)
+    if(allocated(fparent)) deallocate(fparent)
+    if(allocated(fchild)) deallocate(fchild)
+    if(allocated(fnext)) deallocate(fnext)
+    if(allocated(fprev)) deallocate(fprev)
+    if(allocated(fstamp)) deallocate(fstamp)
+    if(allocated(flist)) deallocate(flist)
+    if(allocated(fwalk)) deallocate(fwalk)
+    if(allocated(fseed)) deallocate(fseed)
+    if(allocated(fflood)) deallocate(fflood)
+    if(allocated(refZ)) deallocate(refZ)
+    if(allocated(incH)) deallocate(incH)
+    allocate(fqueue(pydnodes),fparent(pydnodes),fseed(pydnodes))
+    allocate(fchild(pydnodes),fnext(pydnodes),fprev(pydnodes))
+    allocate(fstamp(pydnodes),flist(pydnodes),fwalk(pydnodes))
+    allocate(refZ(pydnodes),incH(pydnodes),fflood(pydnodes))
+    fparent = 0
+    fchild = 0
+    fstamp = 0
+    fvisit = 0
+    incfill = .false.
+    if(allocated(fowned)) deallocate(fowned)
+    if(allocated(fghosts)) deallocate(fghosts)
+    allocate(fowned(pydnodes),fghosts(0))
+    fowned = .true.
     bds = pybounds
     block_size = pydnodes - bds
     eps = epsilon
@@ -249,4 +446,294 @@ contains
 
   end subroutine pitfilling
 
+  subroutine pitpriority(elevation,sealimit,allfill,demH,pydnodes)
+
+    integer :: pydnodes, k, qtail
+    integer,intent(in) :: allfill
+    real(kind=8),intent(in) :: sealimit
+    real(kind=8),intent(in) :: elevation(pydnodes)
+    real(kind=8),intent(out) :: demH(pydnodes)
+
+    ! Initialisation phase
+    call initialisePD(elevation,demH,sealimit,pydnodes)
+
+    ! Borders and submarine nodes are the flood seeds
+    qtail = 0
+    do k = 1, pydnodes
+      fseed(k) = demH(k) < 1.e6
+      if( fseed(k) )then
+        qtail = qtail + 1
+        fqueue(qtail) = k
+      endif
+    enddo
+    call resettree()
+    if(allocated(heapID)) deallocate(heapID)
+    if(allocated(heapH)) deallocate(heapH)
+    allocate(heapID(1024),heapH(1024))
+    hsize = 0
+
+    ! Filling phase
+    call priorityPD(elevation,demH,allfill,qtail,pydnodes)
+    deallocate(heapID,heapH)
+
+    ! Store the filled surface for subsequent incremental updates
+    refZ = elevation
+    incH = demH
+    fflood = demH > elevation
+    incAll = allfill
+    incSea = sealimit
+    incStep = 0
+    incfill = .true.
+
+    return
+
+  end subroutine pitpriority
+
+  subroutine spillpath(root,elevation,demH,sealimit,allfill,nbupdate,pydnodes)
+
+    integer :: pydnodes, root, allfill, nbupdate, k, n, c, ntop
+    logical :: seed
+    real(kind=8) :: hnew, sealimit
+    real(kind=8),intent(in) :: elevation(pydnodes)
+    real(kind=8),intent(inout) :: demH(pydnodes)
+
+    ! Root node is either a seed, a capped node, a node not yet flooded or a
+    ! node spilling to its parent
+    seed = root <= bds .or. elevation(root) <= sealimit
+    fseed(root) = seed
+    if( seed )then
+      call setparent(root,0)
+      demH(root) = elevation(root)
+    elseif( fparent(root) < 0 )then
+      demH(root) = elevation(root) + fill_TH
+    elseif( fparent(root) == 0 )then
+      demH(root) = 1.e6
+    else
+      hnew = demH(fparent(root)) + eps
+      if( allfill == 0 .and. hnew - elevation(root) > fill_TH ) hnew = elevation(root) + fill_TH
+      if( hnew < elevation(root) ) hnew = elevation(root)
+      demH(root) = hnew
+      if( allfill == 0 .and. hnew == elevation(root) + fill_TH ) call setparent(root,-1)
+    endif
+    ntop = 1
+    fwalk(ntop) = root
+
+    ! Nodes downstream of the root are evaluated from their parent value, the
+    ! walk stops on the nodes whose value does not change
+    do while( ntop > 0 )
+      k = fwalk(ntop)
+      ntop = ntop - 1
+      n = fchild(k)
+      do while( n > 0 )
+        c = fnext(n)
+        seed = n <= bds .or. elevation(n) <= sealimit
+        fseed(n) = seed
+        if( seed )then
+          hnew = elevation(n)
+          call setparent(n,0)
+        else
+          hnew = demH(k) + eps
+          if( allfill == 0 .and. hnew - elevation(n) > fill_TH ) hnew = elevation(n) + fill_TH
+          if( hnew < elevation(n) ) hnew = elevation(n)
+        endif
+        if( hnew /= demH(n) )then
+          demH(n) = hnew
+          if( allfill == 0 .and. hnew == elevation(n) + fill_TH ) call setparent(n,-1)
+          if( fstamp(n) /= fvisit )then
+            fstamp(n) = fvisit
+            nbupdate = nbupdate + 1
+            flist(nbupdate) = n
+          endif
+          ntop = ntop + 1
+          fwalk(ntop) = n
+        endif
+        n = c
+      enddo
+    enddo
+
+    return
+
+  end subroutine spillpath
+
+  subroutine pitupdate(elevation,sealimit,allfill,tolerance,nrefill,searefill,demH,nbupdate,pydnodes)
+
+    integer :: pydnodes, k, n, p, c, qtail, nbroot
+    logical :: seed
+    integer,intent(in) :: allfill, nrefill
+    real(kind=8),intent(in) :: sealimit, tolerance, searefill
+    real(kind=8),intent(in) :: elevation(pydnodes)
+    real(kind=8),intent(out) :: demH(pydnodes)
+    integer,intent(out) :: nbupdate
+
+    ! Complete filling when no previous surface is available or when the
+    ! refilling period or the sea-level variation have been reached
+    if( .not. incfill .or. allfill /= incAll .or. incStep >= nrefill .or. &
+        abs(sealimit - incSea) > searefill )then
+      call pitpriority(elevation,sealimit,allfill,demH,pydnodes)
+      nbupdate = pydnodes
+      return
+    endif
+    incStep = incStep + 1
+
+    ! Previous surface on the new elevations: the nodes which were not flooded
+    ! stand at their elevation and the depressions keep their filling. Nodes
+    ! which moved by more than the tolerance since they were last evaluated
+    ! or whose seed state changed are the roots of the update.
+    fvisit = fvisit + 1
+    nbroot = 0
+    do k = 1, pydnodes
+      if( fflood(k) )then
+        demH(k) = max(incH(k),elevation(k))
+      else
+        demH(k) = elevation(k)
+      endif
+      seed = k <= bds .or. elevation(k) <= sealimit
+      if( (seed .neqv. fseed(k)) .or. abs(elevation(k) - refZ(k)) > tolerance )then
+        nbroot = nbroot + 1
+        flist(nbroot) = k
+        fstamp(k) = fvisit
+        refZ(k) = elevation(k)
+      endif
+    enddo
+
+    ! Evaluate the spill pathways of the depressions draining through these
+    ! nodes on the new elevations
+    nbupdate = nbroot
+    do c = 1, nbroot
+      call spillpath(flist(c),elevation,demH,sealimit,allfill,nbupdate,pydnodes)
+    enddo
+
+    if(allocated(heapID)) deallocate(heapID)
+    if(allocated(heapH)) deallocate(heapH)
+    allocate(heapID(1024),heapH(1024))
+    hsize = 0
+
+    ! Evaluated nodes might offer a lower pathway to their neighbours: flood
+    ! again from these nodes and their neighbours
+    fvisit = fvisit + 1
+    qtail = 0
+    do c = 1, nbupdate
+      k = flist(c)
+      do p = ngbOff(k), ngbOff(k+1)
+        if( p == ngbOff(k) )then
+          n = k
+        else
+          n = ngbIDs(p)+1
+        endif
+        if( fstamp(n) /= fvisit )then
+          fstamp(n) = fvisit
+          if( demH(n) == elevation(n) )then
+            qtail = qtail + 1
+            fqueue(qtail) = n
+          elseif( demH(n) < 1.e6 )then
+            call heappush(n,demH(n))
+          endif
+        endif
+      enddo
+    enddo
+    call priorityPD(elevation,demH,allfill,qtail,pydnodes)
+    deallocate(heapID,heapH)
+
+    ! Store the filled surface for the next update
+    incH = demH
+    fflood = demH > elevation
+
+    return
+
+  end subroutine pitupdate
+
+  subroutine pitpartition(pyOwned,pyGhosts,pydnodes,pyghostnb)
+
+    integer :: pydnodes, pyghostnb
+    integer,intent(in) :: pyOwned(pydnodes)
+    integer,intent(in) :: pyGhosts(pyghostnb)
+
+    fowned = pyOwned == 1
+    if(allocated(fghosts)) deallocate(fghosts)
+    allocate(fghosts(pyghostnb))
+    fghosts = pyGhosts
+
+    return
+
+  end subroutine pitpartition
+
+  subroutine pitlocal(elevation,sealimit,allfill,demH,pydnodes)
+
+    integer :: pydnodes, k, n, qtail
+    integer,intent(in) :: allfill
+    real(kind=8),intent(in) :: sealimit
+    real(kind=8),intent(in) :: elevation(pydnodes)
+    real(kind=8),intent(out) :: demH(pydnodes)
+
+    ! Initialisation phase
+    call initialisePD(elevation,demH,sealimit,pydnodes)
+    call resettree()
+
+    ! Flood seeds of the partition and of its ghost nodes
+    qtail = 0
+    do k = 1, pydnodes
+      if( fowned(k) .and. demH(k) < 1.e6 )then
+        qtail = qtail + 1
+        fqueue(qtail) = k
+      endif
+    enddo
+    do n = 1, size(fghosts)
+      k = fghosts(n)
+      if( demH(k) < 1.e6 )then
+        qtail = qtail + 1
+        fqueue(qtail) = k
+      endif
+    enddo
+    if(allocated(heapID)) deallocate(heapID)
+    if(allocated(heapH)) deallocate(heapH)
+    allocate(heapID(1024),heapH(1024))
+    hsize = 0
+
+    ! Filling phase restricted to the partition
+    call priorityPD(elevation,demH,allfill,qtail,pydnodes)
+    deallocate(heapID,heapH)
+
+    return
+
+  end subroutine pitlocal
+
+  subroutine pitghosts(elevation,allfill,demH,pyIDs,pyH,nbupdate,pydnodes,pyghostnb)
+
+    integer :: pydnodes, pyghostnb, k, n, qtail
+    integer,intent(in) :: allfill
+    real(kind=8),intent(in) :: elevation(pydnodes)
+    real(kind=8),intent(inout) :: demH(pydnodes)
+    integer,intent(in) :: pyIDs(pyghostnb)
+    real(kind=8),intent(in) :: pyH(pyghostnb)
+    integer,intent(out) :: nbupdate
+
+    if(allocated(heapID)) deallocate(heapID)
+    if(allocated(heapH)) deallocate(heapH)
+    allocate(heapID(1024),heapH(1024))
+    hsize = 0
+
+    ! Ghost nodes lowered by neighbouring partitions flood the partition again
+    qtail = 0
+    nbupdate = 0
+    do n = 1, pyghostnb
+      k = pyIDs(n)
+      if( pyH(n) < demH(k) )then
+        nbupdate = nbupdate + 1
+        demH(k) = pyH(n)
+        call setparent(k,0)
+        if( demH(k) == elevation(k) )then
+          qtail = qtail + 1
+          fqueue(qtail) = k
+        else
+          call heappush(k,demH(k))
+        endif
+      endif
+    enddo
+    call priorityPD(elevation,demH,allfill,qtail,pydnodes)
+    deallocate(heapID,heapH)
+
+    return
+
+  end subroutine pitghosts
+
 end module pdstack
@@ -15,19 +15,21 @@ module sfdcompute
 
 contains
 
-    subroutine directions_nl(pyElev,pyZ,pyNgbs,pyEdge,pyDist,pyGIDs,sealimit,slpcritic, &
-        pyBase,pyRcv,pyMaxh,pyMaxDep,pyDiff,pyDiffCFL,pylocalNb,pyglobalNb)
+    subroutine directions_nl(pyElev,pyZ,pyOffsets,pyNgbs,pyEdge,pyDist,pyGIDs,sealimit,slpcritic, &
+        pyBase,pyRcv,pyMaxh,pyMaxDep,pyDiff,pyDiffCFL,pylocalNb,pyglobalNb,pyNgbsNb)
 
         integer :: pylocalNb
         integer :: pyglobalNb
+        integer :: pyNgbsNb
         real(kind=8),intent(in) :: sealimit
         real(kind=8),intent(in) :: slpcritic
         integer,dimension(pylocalNb),intent(in) :: pyGIDs
-        integer,dimension(pyglobalNb,20),intent(in) :: pyNgbs
+        integer,dimension(pyglobalNb+1),intent(in) :: pyOffsets
+        integer,dimension(pyNgbsNb),intent(in) :: pyNgbs
         real(kind=8),dimension(pyglobalNb),intent(in) :: pyZ
         real(kind=8),dimension(pyglobalNb),intent(in) :: pyElev
-        real(kind=8),dimension(pyglobalNb,20),intent(in) :: pyEdge
-        real(kind=8),dimension(pyglobalNb,20),intent(in) :: pyDist
+        real(kind=8),dimension(pyNgbsNb),intent(in) :: pyEdge
+        real(kind=8),dimension(pyNgbsNb),intent(in) :: pyDist
 
         integer,intent(out) :: pyBase(pyglobalNb)
         integer,intent(out) :: pyRcv(pyglobalNb)
@@ -45,25 +47,24 @@ contains
         pyDiffCFL = 1.e6
         pyMaxDep = 0.
         pyDiff = 0.
+        !$omp parallel do schedule(static) private(p,lowestID,gid,diffH,diffD,dh,tmp,cfl)
         do k = 1, pylocalNb
             gid = pyGIDs(k)+1
             lowestID = gid
             diffH = 1.e6
             diffD = 0.
             cfl = 1.e6
-            p = 1
-            do while(pyNgbs(gid,p) >=0 )
-                if(pyElev(pyNgbs(gid,p)+1) < pyElev(lowestID))then
-                    lowestID = pyNgbs(gid,p)+1
+            do p = pyOffsets(gid)+1, pyOffsets(gid+1)
+                if(pyElev(pyNgbs(p)+1) < pyElev(lowestID))then
+                    lowestID = pyNgbs(p)+1
                 endif
-                dh = pyZ(pyNgbs(gid,p)+1)-pyZ(gid)
+                dh = pyZ(pyNgbs(p)+1)-pyZ(gid)
                 if(dh >= 0.) diffH = min(dh, diffH)
                 diffD = max(dh, diffD)
-                if(pyDist(gid,p) > 0.) tmp = abs(dh)/pyDist(gid,p)/slpcritic
-                if(pyDist(gid,p) > 0.) pyDiff(gid) = pyDiff(gid) + (pyEdge(gid,p)*dh/pyDist(gid,p)) / (1.-tmp**2)
-                tmp = pyDist(gid,p)**2 - (abs(dh) / slpcritic**2)
+                if(pyDist(p) > 0.) tmp = abs(dh)/pyDist(p)/slpcritic
+                if(pyDist(p) > 0.) pyDiff(gid) = pyDiff(gid) + (pyEdge(p)*dh/pyDist(p)) / (1.-tmp**2)
+                tmp = pyDist(p)**2 - (abs(dh) / slpcritic**2)
                 if( tmp > 0.) cfl = min(tmp, cfl)
-                p = p+1
             enddo
             pyRcv(gid) = lowestID-1
             if( pyZ(gid) < sealimit ) pyRcv(gid) = gid-1
@@ -73,23 +74,26 @@ contains
             pyMaxDep(gid) = diffD
             pyDiffCFL(gid) = cfl * 0.5
         enddo
+        !$omp end parallel do
 
         return
 
     end subroutine directions_nl
 
-    subroutine directions_base_nl(pyZ,pyNgbs,pyEdge,pyDist,pyGIDs,sealimit,slpcritic, &
-        pyBase,pyRcv,pyDiff,pyDiffCFL,pylocalNb,pyglobalNb)
+    subroutine directions_base_nl(pyZ,pyOffsets,pyNgbs,pyEdge,pyDist,pyGIDs,sealimit,slpcritic, &
+        pyBase,pyRcv,pyDiff,pyDiffCFL,pylocalNb,pyglobalNb,pyNgbsNb)
 
         integer :: pylocalNb
         integer :: pyglobalNb
+        integer :: pyNgbsNb
         real(kind=8),intent(in) :: sealimit
         real(kind=8),intent(in) :: slpcritic
         integer,dimension(pylocalNb),intent(in) :: pyGIDs
-        integer,dimension(pyglobalNb,20),intent(in) :: pyNgbs
+        integer,dimension(pyglobalNb+1),intent(in) :: pyOffsets
+        integer,dimension(pyNgbsNb),intent(in) :: pyNgbs
         real(kind=8),dimension(pyglobalNb),intent(in) :: pyZ
-        real(kind=8),dimension(pyglobalNb,20),intent(in) :: pyEdge
-        real(kind=8),dimension(pyglobalNb,20),intent(in) :: pyDist
+        real(kind=8),dimension(pyNgbsNb),intent(in) :: pyEdge
+        real(kind=8),dimension(pyNgbsNb),intent(in) :: pyDist
 
         integer,intent(out) :: pyBase(pyglobalNb)
         integer,intent(out) :: pyRcv(pyglobalNb)
@@ -102,29 +106,29 @@ contains
         pyBase = -1
         pyRcv = -1
         pyDiff = 0.
+        !$omp parallel do schedule(static) private(p,lowestID,gid,diffD,dh,tmp,cfl)
         do k = 1, pylocalNb
             gid = pyGIDs(k)+1
             lowestID = gid
             diffD = 0.
             cfl = 1.e6
-            p = 1
-            do while(pyNgbs(gid,p) >=0 )
-                if(pyZ(pyNgbs(gid,p)+1) < pyZ(lowestID))then
-                    lowestID = pyNgbs(gid,p)+1
+            do p = pyOffsets(gid)+1, pyOffsets(gid+1)
+                if(pyZ(pyNgbs(p)+1) < pyZ(lowestID))then
+                    lowestID = pyNgbs(p)+1
                 endif
-                dh = pyZ(pyNgbs(gid,p)+1)-pyZ(gid)
+                dh = pyZ(pyNgbs(p)+1)-pyZ(gid)
                 diffD = max(dh, diffD)
-                if(pyDist(gid,p) > 0.) tmp = abs(dh/pyDist(gid,p)) / slpcritic
-                if(pyDist(gid,p) > 0.) pyDiff(gid) = pyDiff(gid) + (pyEdge(gid,p)*dh/pyDist(gid,p)) / (1.-tmp**2)
-                tmp = pyDist(gid,p)**2 - abs(dh) / slpcritic**2
+                if(pyDist(p) > 0.) tmp = abs(dh/pyDist(p)) / slpcritic
+                if(pyDist(p) > 0.) pyDiff(gid) = pyDiff(gid) + (pyEdge(p)*dh/pyDist(p)) / (1.-tmp**2)
+                tmp = pyDist(p)**2 - abs(dh) / slpcritic**2
                 if( tmp > 0.) cfl = min(tmp, cfl)
-                p = p+1
             enddo
             pyDiffCFL(gid) = cfl * 0.5
             pyRcv(gid) = lowestID-1
             if( pyZ(gid) < sealimit ) pyRcv(gid) = gid-1
             if( gid == pyRcv(gid)+1 .and. pyZ(gid)+diffD > sealimit) pyBase(gid) = gid-1
         enddo
+        !$omp end parallel do
 
         return
 
@@ -7,40 +7,45 @@
 //                                                                                   //
 //~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~//
 
-// This module computes the Single Flow Direction for any given surface.
+// This module computes the Single Flow Direction and the linear diffusion flux for any
+// given surface.
+
+// Neighbourhoods are stored in compressed sparse row form: the neighbours of node i
+// are found between positions pyOffsets[i] and pyOffsets[i+1] of pyNgbs, pyEdge
+// and pyDist.
+
+// The outputs are updated in place for the nodes listed in pyGIDs only, the values
+// of the other nodes are left unchanged.
 
 #include <stdio.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 
-#define MAX_NEIGHBOURS 20
+void set_threads(int nthreads)
+{
+#ifdef _OPENMP
+    omp_set_num_threads(nthreads);
+#endif
+}
 
-void directions(double pyElev[], double pyZ[], int pyNgbs[][MAX_NEIGHBOURS], double pyEdge[][MAX_NEIGHBOURS],
-    double pyDist[][MAX_NEIGHBOURS], int pyGIDs[], double sealimit, int pyBase[],
+void directions(double pyElev[], double pyZ[], int pyOffsets[], int pyNgbs[], double pyEdge[],
+    double pyDist[], int pyGIDs[], double sealimit, int pyBase[],
     int pyRcv[], double pyMaxh[], double pyMaxDep[], double pyDiff[],
-    int pylocalNb, int pyglobalNb)
+    int pylocalNb, int pyglobalNb, int pyNgbsNb)
 {
-    int i;
-
-    for (i = 0; i < pyglobalNb; i++) {
-        pyBase[i] = -1;
-        pyRcv[i] = -1;
-        pyMaxh[i] = 1.e6;
-        pyMaxDep[i] = 0.;
-        pyDiff[i] = 0.;
-    }
-
     int k;
+    #pragma omp parallel for schedule(static)
     for (k = 0; k < pylocalNb; k++) {
         int gid = pyGIDs[k];
         int lowestID = gid;
         double diffH = 1.e6;
         double diffD = 0.;
+        double diff = 0.;
         int p;
 
-        for (p = 0; p < MAX_NEIGHBOURS; p++) {
-            int ngbid = pyNgbs[gid][p];
-            if (ngbid < 0) {
-                break;
-            }
+        for (p = pyOffsets[gid]; p < pyOffsets[gid + 1]; p++) {
+            int ngbid = pyNgbs[p];
 
             if (pyElev[ngbid] < pyElev[lowestID]) {
                 lowestID = ngbid;
@@ -55,14 +60,16 @@ void directions(double pyElev[], double pyZ[], int pyNgbs[][MAX_NEIGHBOURS], dou
             if (dh > diffD) {
                 diffD = dh;
             }
-            pyDiff[gid] += pyEdge[gid][p] * dh / pyDist[gid][p];
+            diff += pyEdge[p] * dh / pyDist[p];
         }
 
+        pyDiff[gid] = diff;
         pyRcv[gid] = lowestID;
         if (pyZ[gid] < sealimit) {
             pyRcv[gid] = gid;
         }
 
+        pyBase[gid] = -1;
         if (gid == pyRcv[gid] && pyZ[gid] + diffD > sealimit) {
             pyBase[gid] = gid;
         }
@@ -76,31 +83,42 @@ void directions(double pyElev[], double pyZ[], int pyNgbs[][MAX_NEIGHBOURS], dou
     }
 }
 
-void directions_base(double pyZ[], int pyNgbs[][MAX_NEIGHBOURS], double pyEdge[][MAX_NEIGHBOURS],
-    double pyDist[][MAX_NEIGHBOURS], int pyGIDs[], double sealimit, int pyBase[],
-    int pyRcv[], double pyDiff[],
-    int pylocalNb, int pyglobalNb)
+void diffusion(double pyZ[], int pyOffsets[], int pyNgbs[], double pyEdge[],
+    double pyDist[], int pyGIDs[], double pyDiff[],
+    int pylocalNb, int pyglobalNb, int pyNgbsNb)
 {
-    int i;
+    int k;
+    #pragma omp parallel for schedule(static)
+    for (k = 0; k < pylocalNb; k++) {
+        int gid = pyGIDs[k];
+        double diff = 0.;
+        int p;
+
+        for (p = pyOffsets[gid]; p < pyOffsets[gid + 1]; p++) {
+            double dh = pyZ[pyNgbs[p]] - pyZ[gid];
+            diff += pyEdge[p] * dh / pyDist[p];
+        }
 
-    for (i = 0; i < pyglobalNb; i++) {
-        pyBase[i] = -1;
-        pyRcv[i] = -1;
-        pyDiff[i] = 0.;
+        pyDiff[gid] = diff;
     }
+}
 
+void directions_base(double pyZ[], int pyOffsets[], int pyNgbs[], double pyEdge[],
+    double pyDist[], int pyGIDs[], double sealimit, int pyBase[],
+    int pyRcv[], double pyDiff[],
+    int pylocalNb, int pyglobalNb, int pyNgbsNb)
+{
     int k;
+    #pragma omp parallel for schedule(static)
     for (k = 0; k < pylocalNb; k++) {
         int gid = pyGIDs[k];
         int lowestID = gid;
         double diffD = 0.;
+        double diff = 0.;
         int p;
 
-        for (p = 0; p < MAX_NEIGHBOURS; p++) {
-            int ngbid = pyNgbs[gid][p];
-            if (ngbid < 0) {
-                break;
-            }
+        for (p = pyOffsets[gid]; p < pyOffsets[gid + 1]; p++) {
+            int ngbid = pyNgbs[p];
 
             if (pyZ[ngbid] < pyZ[lowestID]) {
                 lowestID = ngbid;
@@ -111,14 +129,16 @@ void directions_base(double pyZ[], int pyNgbs[][MAX_NEIGHBOURS], double pyEdge[]
             if (dh > diffD) {
                 diffD = dh;
             }
-            pyDiff[gid] += pyEdge[gid][p] * dh / pyDist[gid][p];
+            diff += pyEdge[p] * dh / pyDist[p];
         }
 
+        pyDiff[gid] = diff;
         pyRcv[gid] = lowestID;
         if (pyZ[gid] < sealimit) {
             pyRcv[gid] = gid;
         }
 
+        pyBase[gid] = -1;
         if (gid == pyRcv[gid] && pyZ[gid] + diffD > sealimit) {
             pyBase[gid] = gid;
         }
@@ -4,6 +4,7 @@ import mpi4py.MPI as mpi
 
 from pyBadlands import (diffLinear, diffnLinear, flowNetwork, buildMesh,
                         checkPoints, buildFlux, xmlParser)
+from pyBadlands.libUtils import sfd
 
 # profiling support
 import cProfile
@@ -71,6 +72,17 @@ class Model(object):
             self.hillslope = diffLinear()
             self.hillslope.CDaerial = self.input.CDa
             self.hillslope.CDmarine = self.input.CDm
+            self.hillslope.implicit = self.input.CDimplicit
+            self.hillslope.subcycle = self.input.CDsubcycle
+            if self.hillslope.implicit or self.hillslope.subcycle:
+                self.hillslope.build_operator(self.FVmesh.node_coords[:,:2],
+                    [self.recGrid.regX.min(), self.recGrid.regY.min()],
+                    [self.recGrid.regX.max(), self.recGrid.regY.max()],
+                    self.FVmesh.ngbOffsets, self.FVmesh.neighbours, self.FVmesh.edge_length,
+                    self.FVmesh.vor_edges, self.FVmesh.control_volumes, self.lGIDs)
+
+        # Define the number of threads used by the flow kernels on each processor
+        sfd.set_threads(self.input.threads)
 
         # Define flow parameters
         self.flow = flowNetwork()
@@ -89,7 +101,11 @@ class Model(object):
         self.flow.spl = self.input.spl
         self.flow.capacity = self.input.capacity
         self.flow.filter = self.input.filter
+        self.flow.implicit = self.input.implicit
         self.flow.depo = self.input.depo
+        self.flow.rcvtol = self.input.rcvtol
+        if self.input.gather and self._size > 1:
+            self.flow.set_owned(self.inGIDs)
 
     def rebuild_mesh(self, verbose=False):
         """
@@ -124,9 +140,25 @@ class Model(object):
         if self.input.erolays is None:
             self.flow.erodibility = np.full(self.totPts, self.input.SPLero)
         else:
+            self.mapero.getErodibility(np.zeros(self.totPts, dtype=float))
             self.flow.erodibility = self.mapero.erodibility
 
         self.flow.xycoords = self.FVmesh.node_coords[:, :2]
+        self.flow.tin2grid = None
+        self.flow.grid2tin = None
+        self.flow.basinWork = None
+        self.flow.sfdInputs = None
+        self.flow.adjacency = None
+
+        # Update implicit and sub-cycled diffusion operator
+        if self.input.Hillslope and (self.hillslope.implicit or self.hillslope.subcycle):
+            self.hillslope.build_operator(self.FVmesh.node_coords[:,:2],
+                [self.recGrid.regX.min(), self.recGrid.regY.min()],
+                [self.recGrid.regX.max(), self.recGrid.regY.max()],
+                self.FVmesh.ngbOffsets, self.FVmesh.neighbours, self.FVmesh.edge_length,
+                self.FVmesh.vor_edges, self.FVmesh.control_volumes, self.lGIDs)
+        if self.input.gather and self._size > 1:
+            self.flow.set_owned(self.inGIDs)
 
     def run_to_time(self, tEnd, profile=False, verbose=False):
         """
@@ -186,8 +218,9 @@ class Model(object):
                     ldisp.fill(-1.e6)
                     ldisp[self.inIDs] = self.force.load_Tecto_map(self.tNow,self.inIDs)
                     self._comm.Allreduce(mpi.IN_PLACE, ldisp, op=mpi.MAX)
-                    self.disp = self.force.disp_border(ldisp, self.FVmesh.neighbours,
-                                                       self.FVmesh.edge_length, self.recGrid.boundsPt)
+                    self.disp = self.force.disp_border(ldisp, self.FVmesh.ngbOffsets,
+                                                       self.FVmesh.neighbours, self.FVmesh.edge_length,
+                                                       self.recGrid.boundsPt)
                     self.applyDisp = True
             else:
                 # 3D displacements
@@ -209,8 +242,9 @@ class Model(object):
                                                                     True, self.strata[rid].xyi, self.strata[rid].ids)
                     # Update mesh when a 3D displacements field has been loaded
                     if updateMesh:
-                        self.force.dispZ = self.force.disp_border(self.force.dispZ, self.FVmesh.neighbours,
-                                           self.FVmesh.edge_length, self.recGrid.boundsPt)
+                        self.force.dispZ = self.force.disp_border(self.force.dispZ, self.FVmesh.ngbOffsets,
+                                           self.FVmesh.neighbours, self.FVmesh.edge_length,
+                                           self.recGrid.boundsPt)
                         # Define flexural flags
                         fflex = 0
                         flexiso = None
@@ -234,7 +268,7 @@ class Model(object):
                         # Apply horizontal displacements
                         self.recGrid.tinMesh, self.elevation, self.cumdiff, fcum, scum, Ke, Th = self.force.apply_XY_dispacements(
                             self.recGrid.areaDel, self.fixIDs, self.elevation, self.cumdiff, tflex=flexiso, scum=sload, Te=vTh,
-                            Ke=vKe, flexure=fflex, strat=fstrat, ero=fero)
+                            Ke=vKe, flexure=fflex, strat=fstrat, ero=fero, reorder=self.input.reorder)
                         # Update relevant parameters in deformed TIN
                         if fflex == 1:
                             self.cumflex = fcum
@@ -262,8 +296,9 @@ class Model(object):
                 self.tinFlex = self.flex.get_flexure(self.elevation, self.cumdiff,
                             self.force.sealevel,self.recGrid.boundsPt, initFlex=False)
                 # Get border values
-                self.tinFlex = self.force.disp_border(self.tinFlex, self.FVmesh.neighbours,
-                                                      self.FVmesh.edge_length, self.recGrid.boundsPt)
+                self.tinFlex = self.force.disp_border(self.tinFlex, self.FVmesh.ngbOffsets,
+                                                      self.FVmesh.neighbours, self.FVmesh.edge_length,
+                                                      self.recGrid.boundsPt)
                 # Update flexural parameters
                 self.elevation += self.tinFlex
                 self.cumflex += self.tinFlex
@@ -317,8 +352,9 @@ class Model(object):
             self.tinFlex = self.flex.get_flexure(self.elevation, self.cumdiff,
                         self.force.sealevel,self.recGrid.boundsPt,initFlex=False)
             # Get border values
-            self.tinFlex = self.force.disp_border(self.tinFlex, self.FVmesh.neighbours,
-                                                  self.FVmesh.edge_length, self.recGrid.boundsPt)
+            self.tinFlex = self.force.disp_border(self.tinFlex, self.FVmesh.ngbOffsets,
+                                                  self.FVmesh.neighbours, self.FVmesh.edge_length,
+                                                  self.recGrid.boundsPt)
             # Update flexural parameters
             self.elevation += self.tinFlex
             self.cumflex += self.tinFlex
@@ -33,6 +33,16 @@ def streamflow(input, FVmesh, recGrid, force, hillslope, flow, elevation, \
     force.getSea(tNow)
     fillH = None
 
+    # Select depression filling algorithm
+    if input.pitfill == 'priority' and FVmesh.pitSend is not None:
+        def pit_filling(elev, sea, allFill):
+            return elevationTIN.pit_parallel_flood(elev, sea, allFill,
+                                                   FVmesh.pitSend, FVmesh.pitRecv)
+    elif input.pitfill == 'priority':
+        pit_filling = elevationTIN.pit_priority_flood
+    else:
+        pit_filling = elevationTIN.pit_stack_PD
+
     if input.depo == 0 or input.capacity or input.filter:
         flow.maxdep = 0.
         flow.maxh = 0.
@@ -43,55 +53,56 @@ def streamflow(input, FVmesh, recGrid, force, hillslope, flow, elevation, \
         # Build an initial depression-less surface at start time if required
         if input.tStart == tNow and input.nopit == 1:
             sea_lvl =  force.sealevel - input.sealimit
-            elevation = elevationTIN.pit_stack_PD(elevation,sea_lvl,input.nopit)
+            elevation = pit_filling(elevation,sea_lvl,input.nopit)
             fillH = elevation
     else:
-        # fillH = elevationTIN.pit_filling_PD(elevation, FVmesh.neighbours,
+        # fillH = elevationTIN.pit_filling_PD(elevation, FVmesh.ngbOffsets, FVmesh.neighbours,
         #                            recGrid.boundsPt, force.sealevel-input.sealimit
         #                            input.fillmax)
         sea_lvl =  force.sealevel - input.sealimit
         #fillH = elevationTIN.pit_stack_PD(elevation,sea_lvl)
         # Build an initial depression-less surface at start time if required
         if input.tStart == tNow and input.nopit == 1 :
-            fillH = elevationTIN.pit_stack_PD(elevation,sea_lvl,input.nopit)
+            fillH = pit_filling(elevation,sea_lvl,input.nopit)
             elevation = fillH
+        elif input.pitrefill > 0 and input.pitfill == 'priority':
+            fillH = elevationTIN.pit_update(elevation,sea_lvl,0,input.pittol,
+                                            input.pitrefill,input.pitsea)
         else:
-            fillH = elevationTIN.pit_stack_PD(elevation,sea_lvl,0)
+            fillH = pit_filling(elevation,sea_lvl,0)
 
     if rank == 0 and verbose and input.spl and not input.filter:
-        print " -   depression-less algorithm PD with stack", time.clock() - walltime
+        print " -   depression-less algorithm", input.pitfill, time.clock() - walltime
 
     # Compute stream network
     walltime = time.clock()
     if input.nHillslope:
-        flow.SFD_nreceivers(hillslope.Sc, fillH, elevation, FVmesh.neighbours,
-                            FVmesh.vor_edges, FVmesh.edge_length,
+        flow.SFD_nreceivers(hillslope.Sc, fillH, elevation, FVmesh.ngbOffsets,
+                            FVmesh.neighbours, FVmesh.vor_edges, FVmesh.edge_length,
                             lGIDs, force.sealevel-input.sealimit)
     else:
-        flow.SFD_receivers(fillH, elevation, FVmesh.neighbours,
+        flow.SFD_receivers(fillH, elevation, FVmesh.ngbOffsets, FVmesh.neighbours,
                            FVmesh.vor_edges, FVmesh.edge_length,
                            lGIDs, force.sealevel-input.sealimit)
 
+    # Drainage basins cross partitions: all-gather the owned nodes network on all processors
+    if flow.gather:
+        flow.gather_network()
+
     if rank == 0 and verbose:
         print " -   compute receivers parallel ", time.clock() - walltime
 
-    # Distribute evenly local minimas to processors
+    # Distribute local minimas to processors balancing the basins sizes
     walltime = time.clock()
-    flow.localbase = np.array_split(flow.base, size)[rank]
+    flow.distribute_basins()
     flow.ordered_node_array()
+    flow.record_basins()
     if rank == 0 and verbose:
         print " -   compute stack order locally ", time.clock() - walltime
+        if size > 1:
+            print " -   basins work imbalance (max/mean nodes) ", flow.basins_imbalance()
 
-    walltime = time.clock()
-    stackNbs = comm.allgather(len(flow.localstack))
-    globalstack = np.zeros(sum(stackNbs), dtype=flow.localstack.dtype)
-    comm.Allgatherv(sendbuf=[flow.localstack, mpi.INT],
-                    recvbuf=[globalstack, (stackNbs, None), mpi.INT])
-    flow.stack = globalstack
-    if rank == 0 and verbose:
-        print " -   send stack order globally ", time.clock() - walltime
-
-    # Compute discharge
+    # Compute discharge on the local drainage basins
     walltime = time.clock()
     flow.compute_flow(FVmesh.control_volumes, rain)
     if rank == 0 and verbose:
@@ -109,12 +120,19 @@ def sediment_flux(input, recGrid, hillslope, FVmesh, tMesh, flow, force, applyDi
     size = mpi.COMM_WORLD.size
     comm = mpi.COMM_WORLD
 
+    # The flow network arrays reduced while the stack and discharge were computed are needed from here
+    flow.complete_network()
+
     # Compute CFL condition
     walltime = time.clock()
-    if input.Hillslope:
-        hillslope.dt_stability(FVmesh.edge_length[inGIDs,:tMesh.maxNgbh])
+    if input.Hillslope and input.CDimplicit:
+        # Implicit linear diffusion is unconditionally stable
+        hillslope.CFL = tEnd-tNow
+    elif input.Hillslope:
+        inEdges = np.repeat(FVmesh.partIDs == rank, np.diff(FVmesh.ngbOffsets))
+        hillslope.dt_stability(FVmesh.edge_length[inEdges], globalmin=False)
     elif input.nHillslope:
-        hillslope.dt_stability(flow.diff_cfl)
+        hillslope.dt_stability(flow.diff_cfl, globalmin=False)
     else:
         hillslope.CFL = tEnd-tNow
 
@@ -122,16 +140,31 @@ def sediment_flux(input, recGrid, hillslope, FVmesh, tMesh, flow, force, applyDi
         if input.filter:
             flow.CFL = input.maxDT
         elif input.spl:
-            flow.dt_stability(fillH, inGIDs)
+            flow.dt_stability(fillH, flow.localstack, globalmin=False)
         else:
-            flow.dt_stability(elevation, inGIDs)
+            flow.dt_stability(elevation, flow.localstack, globalmin=False)
     else:
         if input.filter:
             flow.CFL = input.maxDT
+        elif input.spl and input.implicit:
+            # Implicit stream power law is unconditionally stable
+            flow.CFL = tEnd-tNow
+            if input.maxDT is not None:
+                flow.CFL = min(input.maxDT, flow.CFL)
         else:
-            flow.dt_stability(elevation, inGIDs)
+            flow.dt_stability(elevation, flow.localstack, globalmin=False)
+
+    # Global minimum of the flow and hillslope stability conditions in a single reduction
+    if size > 1:
+        cfl = np.array([flow.CFL, hillslope.CFL], dtype=float)
+        comm.Allreduce(mpi.IN_PLACE, cfl, op=mpi.MIN)
+        flow.CFL, hillslope.CFL = cfl
 
-    CFLtime = min(flow.CFL, hillslope.CFL)
+    # Sub-cycled diffusion does not constrain the fluvial time step
+    if input.Hillslope and input.CDsubcycle:
+        CFLtime = min(flow.CFL, tEnd-tNow)
+    else:
+        CFLtime = min(flow.CFL, hillslope.CFL)
     CFLtime = max(input.minDT, CFLtime)
     if rank == 0 and verbose:
         print " -   Get CFL time step ", time.clock() - walltime
@@ -139,14 +172,21 @@ def sediment_flux(input, recGrid, hillslope, FVmesh, tMesh, flow, force, applyDi
     # Compute sediment fluxes
     # Initial cumulative elevation change
     walltime = time.clock()
-    diff_flux = hillslope.sedflux(flow.diff_flux, force.sealevel, elevation, FVmesh.control_volumes)
+    if input.Hillslope and (input.CDimplicit or input.CDsubcycle):
+        diff_flux = np.zeros(len(elevation))
+    else:
+        diff_flux = hillslope.sedflux(flow.diff_flux, force.sealevel, elevation, FVmesh.control_volumes)
     if rank == 0 and verbose:
         print " -   Get hillslope fluxes ", time.clock() - walltime
 
     walltime = time.clock()
     xyMin = [recGrid.regX.min(), recGrid.regY.min()]
     xyMax = [recGrid.regX.max(), recGrid.regY.max()]
-    tstep, sedrate = flow.compute_sedflux(FVmesh.control_volumes, elevation, fillH, xyMin, xyMax,
+    # The implicit stream power law erodes the uplifted surface
+    splelev = elevation
+    if input.implicit and applyDisp:
+        splelev = elevation + disp * CFLtime
+    tstep, sedrate = flow.compute_sedflux(FVmesh.control_volumes, splelev, fillH, xyMin, xyMax,
                                           diff_flux, CFLtime, force.sealevel, cumdiff)
     if rank == 0 and verbose:
         print " -   Get stream fluxes ", time.clock() - walltime
@@ -167,6 +207,24 @@ def sediment_flux(input, recGrid, hillslope, FVmesh, tMesh, flow, force, applyDi
     if applyDisp:
         elevation += disp * timestep
 
+    # Linear diffusion solved implicitly on the updated surface
+    if input.Hillslope and input.CDimplicit:
+        walltime = time.clock()
+        hdiff = hillslope.implicit_diffusion(elevation, force.sealevel, timestep)
+        elevation += hdiff
+        cumdiff += hdiff
+        diff += hdiff
+        if rank == 0 and verbose:
+            print " -   Get implicit hillslope diffusion ", time.clock() - walltime
+    elif input.Hillslope and input.CDsubcycle:
+        walltime = time.clock()
+        hdiff = hillslope.sub_cycling(elevation, force.sealevel, FVmesh.control_volumes, timestep)
+        elevation += hdiff
+        cumdiff += hdiff
+        diff += hdiff
+        if rank == 0 and verbose:
+            print " -   Get sub-cycled hillslope diffusion ", time.clock() - walltime
+
     # Update erodibility values
     if input.erolays >= 0:
         mapero.getErodibility(diff)
@@ -14,7 +14,7 @@ import time
 import numpy as np
 import mpi4py.MPI as mpi
 
-from pyBadlands import (partitionTIN, FVmethod, elevationTIN, raster2TIN,
+from pyBadlands import (partitionTIN, FVmethod, elevationTIN, raster2TIN, meshCache,
                         eroMesh, strataMesh, isoFlex, forceSim)
 
 def construct_mesh(input, filename, verbose=False):
@@ -35,8 +35,20 @@ def construct_mesh(input, filename, verbose=False):
     strata = None
     mapero = None
 
+    # Look for the TIN and its Finite Volume discretisation in the mesh cache
+    cache = None
+    tinCache = None
+    partCache = None
+    if input.meshcache is not None:
+        walltime = time.clock()
+        cache = meshCache.meshCache(input.meshcache, filename, input.Afactor, input.reorder)
+        tinCache, partCache = cache.load()
+        if rank == 0 and verbose and tinCache is not None:
+            print " - load mesh from cache ", time.clock() - walltime
+
     # Get DEM regular grid and create Badlands TIN.
-    recGrid = raster2TIN.raster2TIN(filename, areaDelFactor=input.Afactor)
+    recGrid = raster2TIN.raster2TIN(filename, areaDelFactor=input.Afactor, reorder=input.reorder,
+                                    cache=tinCache)
 
     fixIDs = recGrid.boundsPt + recGrid.edgesPt
 
@@ -45,7 +57,8 @@ def construct_mesh(input, filename, verbose=False):
                 input.rbgd, input.rmin, input.rmax , input.windx,
                 input.windy, input.tauc, input.tauf, input.nm,
                 input.cw, input.hw, input.ortime, input.tectFile,
-                input.tectTime, recGrid.regX, recGrid.regY, input.tDisplay)
+                input.tectTime, recGrid.regX, recGrid.regY, input.tDisplay,
+                input.forcearchive, input.prefetch, input.orfactor)
 
     if input.disp3d:
         force.time3d = input.time3d
@@ -58,63 +71,46 @@ def construct_mesh(input, filename, verbose=False):
     walltime = time.clock()
     FVmesh = FVmethod.FVmethod(recGrid.tinMesh['vertices'], recGrid.tinMesh['triangles'],
                                 recGrid.tinMesh['edges'])
-
-    # Perform partitioning by equivalent domain splitting
-    partitionIDs, RowProc, ColProc = partitionTIN.simple(recGrid.tinMesh['vertices'][:, 0],
-                                                         recGrid.tinMesh['vertices'][:, 1])
-    FVmesh.partIDs = partitionIDs
-
-    # Get each partition global node ID
-    inGIDs = np.where(partitionIDs == rank)[0]
-
-    # Build Finite Volume discretisation
-    # Define overlapping partitions
-    lGIDs, localTIN = partitionTIN.overlap(recGrid.tinMesh['vertices'][:, 0], recGrid.tinMesh['vertices'][:, 1],
-                                            RowProc, ColProc, 2*recGrid.resEdges, verbose)
-
-    # Set parameters of the finite volume mesh
-    tMesh = FVmethod.FVmethod(localTIN['vertices'], localTIN['triangles'], localTIN['edges'])
-
-    if rank == 0 and size > 1 and verbose:
-        print " - partition TIN amongst processors and create local TINs", time.clock() - walltime
-
-    # Define Finite Volume parameters
-    walltime = time.clock()
     totPts = len(recGrid.tinMesh['vertices'][:, 0])
-    FVmesh.neighbours = np.zeros((totPts, 20), dtype=np.int32, order='F')
-    FVmesh.neighbours.fill(-2)
-    FVmesh.edge_length = np.zeros((totPts, 20), dtype=np.float)
-    FVmesh.vor_edges = np.zeros((totPts, 20), dtype=np.float)
-    FVmesh.control_volumes = np.zeros(totPts, dtype=np.float)
-
-    # Compute Finite Volume parameters
-    tGIDs, tNgbh, tEdgs, tVors, tVols = tMesh.construct_FV(inGIDs, lGIDs, totPts,
-                                                  recGrid.resEdges*input.Afactor, verbose)
 
-    FVmesh.neighbours[tGIDs,:tMesh.maxNgbh] = tNgbh
-    FVmesh.edge_length[tGIDs,:tMesh.maxNgbh] = tEdgs
-    FVmesh.vor_edges[tGIDs,:tMesh.maxNgbh] = tVors
-    FVmesh.control_volumes[tGIDs] = tVols
+    # Partitions and Finite Volume parameters are read from the cache
+    if partCache is not None:
+        FVmesh.partIDs = tinCache['partIDs']
+        inGIDs = np.where(FVmesh.partIDs == rank)[0]
+        lGIDs = partCache['lGIDs']
+        localTIN = {'vertices':partCache['local_vertices'], 'triangles':partCache['local_triangles'],
+                    'edges':partCache['local_edges']}
+        tMesh = FVmethod.FVmethod(localTIN['vertices'], localTIN['triangles'], localTIN['edges'])
+        FVmesh.control_volumes = tinCache['control_volumes']
+        FVmesh.ngbOffsets = tinCache['ngbOffsets']
+        FVmesh.neighbours = tinCache['neighbours']
+        FVmesh.edge_length = tinCache['edge_length']
+        FVmesh.vor_edges = tinCache['vor_edges']
+    else:
+        FVmesh, tMesh, lGIDs, localTIN, inGIDs = _build_FVmesh(FVmesh, recGrid, input, totPts,
+                                                               walltime, verbose)
+        if cache is not None:
+            cache.save(recGrid, FVmesh, lGIDs, localTIN)
 
-    if rank == 0 and verbose:
-        print " - FV mesh ", time.clock() - walltime
+    # Set default to no rain and build the regular grid to TIN interpolation operator
+    force.update_force_TIN(FVmesh.node_coords[:,:2])
 
     # Define TIN parameters
     if input.flexure:
-        elevation, cumdiff, cumflex, inIDs = _define_TINparams(totPts, input, FVmesh, recGrid, verbose)
+        elevation, cumdiff, cumflex, inIDs = _define_TINparams(totPts, input, FVmesh, recGrid,
+                                                               force.interp, verbose)
     else:
-        elevation, cumdiff, inIDs = _define_TINparams(totPts, input, FVmesh, recGrid, verbose)
+        elevation, cumdiff, inIDs = _define_TINparams(totPts, input, FVmesh, recGrid,
+                                                      force.interp, verbose)
 
     # Build stratigraphic and erodibility meshes
     if input.laytime > 0 and input.erolays >= 0:
-        strata, mapero = _build_strateroMesh(input, FVmesh, recGrid, cumdiff, rank, verbose)
+        strata, mapero = _build_strateroMesh(input, FVmesh, recGrid, cumdiff, rank, force.interp,
+                                             verbose)
     elif input.laytime > 0:
-        strata = _build_strateroMesh(input, FVmesh, recGrid, cumdiff, rank, verbose)
+        strata = _build_strateroMesh(input, FVmesh, recGrid, cumdiff, rank, force.interp, verbose)
     elif input.erolays >= 0:
-        mapero = _build_strateroMesh(input, FVmesh, recGrid, cumdiff, rank, verbose)
-
-    # Set default to no rain
-    force.update_force_TIN(FVmesh.node_coords[:,:2])
+        mapero = _build_strateroMesh(input, FVmesh, recGrid, cumdiff, rank, force.interp, verbose)
 
     # Flexural isostasy initialisation
     if input.flexure:
@@ -164,19 +160,12 @@ def reconstruct_mesh(recGrid, input, verbose=False):
 
     # Define Finite Volume parameters
     totPts = len(recGrid.tinMesh['vertices'][:, 0])
-    FVmesh.neighbours = np.zeros((totPts, 20), dtype=np.int32)
-    FVmesh.neighbours.fill(-2)
-    FVmesh.edge_length = np.zeros((totPts, 20), dtype=np.float)
-    FVmesh.vor_edges = np.zeros((totPts, 20), dtype=np.float)
     FVmesh.control_volumes = np.zeros(totPts, dtype=np.float)
 
     # Compute Finite Volume parameters
-    tGIDs, tNgbh, tEdgs, tVors, tVols = tMesh.construct_FV(inGIDs, lGIDs, totPts,
-                                            recGrid.resEdges*input.Afactor, verbose)
+    tGIDs, FVmesh.ngbOffsets, FVmesh.neighbours, FVmesh.edge_length, FVmesh.vor_edges, \
+        tVols = tMesh.construct_FV(inGIDs, lGIDs, totPts, recGrid.resEdges*input.Afactor, verbose)
 
-    FVmesh.neighbours[tGIDs,:tMesh.maxNgbh] = tNgbh
-    FVmesh.edge_length[tGIDs,:tMesh.maxNgbh] = tEdgs
-    FVmesh.vor_edges[tGIDs,:tMesh.maxNgbh] = tVors
     FVmesh.control_volumes[tGIDs] = tVols
 
     if rank == 0 and verbose:
@@ -185,11 +174,57 @@ def reconstruct_mesh(recGrid, input, verbose=False):
     inIDs = np.where(FVmesh.partIDs[recGrid.boundsPt:] == rank)[0]
     inIDs += recGrid.boundsPt
 
-    elevationTIN.assign_parameter_pit(FVmesh.neighbours, recGrid.boundsPt, input.fillmax)
+    elevationTIN.assign_parameter_pit(FVmesh.ngbOffsets, FVmesh.neighbours, recGrid.boundsPt,
+                                      input.fillmax)
+    if input.pitfill == 'priority' and input.pitrefill == 0 and size > 1:
+        FVmesh.pitSend, FVmesh.pitRecv = elevationTIN.assign_partition_pit(FVmesh.ngbOffsets,
+                                                           FVmesh.neighbours, FVmesh.partIDs)
 
     return FVmesh, tMesh, lGIDs, inIDs, inGIDs, totPts
 
-def _define_TINparams(totPts, input, FVmesh, recGrid, verbose=False):
+def _build_FVmesh(FVmesh, recGrid, input, totPts, walltime, verbose=False):
+    """
+    This function partitions the TIN and builds the Finite Volume discretisation.
+    """
+
+    rank = mpi.COMM_WORLD.rank
+    size = mpi.COMM_WORLD.size
+
+    # Perform partitioning by equivalent domain splitting
+    partitionIDs, RowProc, ColProc = partitionTIN.simple(recGrid.tinMesh['vertices'][:, 0],
+                                                         recGrid.tinMesh['vertices'][:, 1])
+    FVmesh.partIDs = partitionIDs
+
+    # Get each partition global node ID
+    inGIDs = np.where(partitionIDs == rank)[0]
+
+    # Build Finite Volume discretisation
+    # Define overlapping partitions
+    lGIDs, localTIN = partitionTIN.overlap(recGrid.tinMesh['vertices'][:, 0], recGrid.tinMesh['vertices'][:, 1],
+                                            RowProc, ColProc, 2*recGrid.resEdges, verbose)
+
+    # Set parameters of the finite volume mesh
+    tMesh = FVmethod.FVmethod(localTIN['vertices'], localTIN['triangles'], localTIN['edges'])
+
+    if rank == 0 and size > 1 and verbose:
+        print " - partition TIN amongst processors and create local TINs", time.clock() - walltime
+
+    # Define Finite Volume parameters
+    walltime = time.clock()
+    FVmesh.control_volumes = np.zeros(totPts, dtype=np.float)
+
+    # Compute Finite Volume parameters
+    tGIDs, FVmesh.ngbOffsets, FVmesh.neighbours, FVmesh.edge_length, FVmesh.vor_edges, \
+        tVols = tMesh.construct_FV(inGIDs, lGIDs, totPts, recGrid.resEdges*input.Afactor, verbose)
+
+    FVmesh.control_volumes[tGIDs] = tVols
+
+    if rank == 0 and verbose:
+        print " - FV mesh ", time.clock() - walltime
+
+    return FVmesh, tMesh, lGIDs, localTIN, inGIDs
+
+def _define_TINparams(totPts, input, FVmesh, recGrid, operator=None, verbose=False):
     """
     This function is defining the main values declared on the TIN.
     """
@@ -232,7 +267,8 @@ def _define_TINparams(totPts, input, FVmesh, recGrid, verbose=False):
     # Otherwise interpolate elevation from DEM to TIN
     else:
         local_elev[inIDs] = elevationTIN.getElevation(recGrid.regX, recGrid.regY,
-                                            recGrid.regZ, FVmesh.node_coords[inIDs, :2])
+                                            recGrid.regZ, FVmesh.node_coords[inIDs, :2],
+                                            operator=operator, ids=inIDs)
         comm.Allreduce(mpi.IN_PLACE, local_elev, op=mpi.MAX)
         # Initialise TIN parameters
         cumdiff = np.zeros(totPts)
@@ -240,11 +276,15 @@ def _define_TINparams(totPts, input, FVmesh, recGrid, verbose=False):
             cumflex = np.zeros(totPts)
 
     # Assign boundary values
-    elevation = elevationTIN.update_border_elevation(local_elev, FVmesh.neighbours,
+    elevation = elevationTIN.update_border_elevation(local_elev, FVmesh.ngbOffsets, FVmesh.neighbours,
                                 FVmesh.edge_length, recGrid.boundsPt, btype=input.btype)
 
     # Define pit filling algorithm
-    elevationTIN.assign_parameter_pit(FVmesh.neighbours,recGrid.boundsPt,input.fillmax)
+    elevationTIN.assign_parameter_pit(FVmesh.ngbOffsets, FVmesh.neighbours, recGrid.boundsPt,
+                                      input.fillmax)
+    if input.pitfill == 'priority' and input.pitrefill == 0 and size > 1:
+        FVmesh.pitSend, FVmesh.pitRecv = elevationTIN.assign_partition_pit(FVmesh.ngbOffsets,
+                                                           FVmesh.neighbours, FVmesh.partIDs)
     if rank == 0 and verbose:
         print " - define paramters on TIN grid ", time.clock() - walltime
 
@@ -253,7 +293,7 @@ def _define_TINparams(totPts, input, FVmesh, recGrid, verbose=False):
     else:
         return elevation, cumdiff, inIDs
 
-def _build_strateroMesh(input, FVmesh, recGrid, cumdiff, rank, verbose=False):
+def _build_strateroMesh(input, FVmesh, recGrid, cumdiff, rank, operator=None, verbose=False):
     """
     This function is creating the stratigraphic mesh and the erodibility maps
     in cases where these functions are turned on.
@@ -273,10 +313,11 @@ def _build_strateroMesh(input, FVmesh, recGrid, cumdiff, rank, verbose=False):
             strata = [None]
             if input.restart:
                 strata[0] = strataMesh.strataMesh(sdx, bbX, bbY, layNb, FVmesh.node_coords[:, :2],
-                                    input.outDir, input.sh5file, cumdiff, input.rfolder, input.rstep)
+                                    input.outDir, input.sh5file, cumdiff, input.rfolder, input.rstep,
+                                    dtype=input.dtype)
             else:
                 strata[0] = strataMesh.strataMesh(sdx, bbX, bbY, layNb, FVmesh.node_coords[:, :2],
-                                    input.outDir, input.sh5file)
+                                    input.outDir, input.sh5file, dtype=input.dtype)
         else:
             strata = [None]*input.region
             layNb = int((input.tEnd - input.tStart)/input.laytime)+2
@@ -285,10 +326,11 @@ def _build_strateroMesh(input, FVmesh, recGrid, cumdiff, rank, verbose=False):
                 bbY = [input.llcXY[rid,1],input.urcXY[rid,1]]
                 if input.restart:
                     strata[rid] = strataMesh.strataMesh(sdx, bbX, bbY, layNb, FVmesh.node_coords[:, :2],
-                                    input.outDir, input.sh5file, cumdiff, input.rfolder, input.rstep, rid)
+                                    input.outDir, input.sh5file, cumdiff, input.rfolder, input.rstep, rid,
+                                    dtype=input.dtype)
                 else:
                     strata[rid] = strataMesh.strataMesh(sdx, bbX, bbY, layNb, FVmesh.node_coords[:, :2],
-                                    input.outDir, input.sh5file, rid)
+                                    input.outDir, input.sh5file, rid, dtype=input.dtype)
         if rank == 0 and verbose:
             print " - create stratigraphic regions ", time.clock() - walltime
 
@@ -301,12 +343,12 @@ def _build_strateroMesh(input, FVmesh, recGrid, cumdiff, rank, verbose=False):
             mapero = eroMesh.eroMesh(input.erolays, input.eroMap, input.eroVal, input.SPLero,
                                     input.thickMap, input.thickVal, FVmesh.node_coords[:, :2],
                                     recGrid.regX, recGrid.regY, bPts, recGrid.edgesPt, input.outDir,
-                                    rfolder=input.rfolder, rstep=input.rstep)
+                                    rfolder=input.rfolder, rstep=input.rstep, operator=operator)
         else:
             mapero = eroMesh.eroMesh(input.erolays, input.eroMap, input.eroVal, input.SPLero,
                                      input.thickMap, input.thickVal, FVmesh.node_coords[:, :2],
                                      recGrid.regX, recGrid.regY, bPts, recGrid.edgesPt, input.outDir,
-                                     rfolder=None, rstep=0)
+                                     rfolder=None, rstep=0, operator=operator)
 
         if rank == 0 and verbose:
             print " - create erodibility mesh ", time.clock() - walltime
@@ -346,7 +388,8 @@ def _init_flexure(FVmesh, input, recGrid, force, elevation, cumdiff,
     force.getSea(input.tStart)
     tinFlex = flex.get_flexure(elevation, cumdiff, force.sealevel,
                                recGrid.boundsPt, initFlex=True)
-    tinFlex = force.disp_border(tinFlex, FVmesh.neighbours, FVmesh.edge_length, recGrid.boundsPt)
+    tinFlex = force.disp_border(tinFlex, FVmesh.ngbOffsets, FVmesh.neighbours, FVmesh.edge_length,
+                                recGrid.boundsPt)
     cumflex += tinFlex
     if rank == 0 and verbose:
         print "   - Initialise flexural isostasy ", time.clock() - walltime
@@ -60,6 +60,7 @@ def write_checkpoints(input, recGrid, lGIDs, inIDs, tNow, FVmesh, \
     comm.Allreduce(mpi.IN_PLACE, fline, op=mpi.MAX)
 
     # Compute flow parameters
+    flow.gather_discharge()
     flow.compute_parameters()
 
     # Write HDF5 files
@@ -26,6 +26,10 @@ class FVmethod:
         1. the voronoi cell area
         2. an ordered list of voronoi edges length
 
+    The global neighbourhood is stored in compressed sparse row (CSR) form: the neighbours,
+    edges length and voronoi edges length of node i are found between the positions
+    ngbOffsets[i] and ngbOffsets[i+1] of the neighbours, edge_length and vor_edges arrays.
+
     Parameters
     ----------
     string : nodes
@@ -43,6 +47,7 @@ class FVmethod:
         self.edges = edges
         self.cells = cells
         self.control_volumes = None
+        self.ngbOffsets = None
         self.neighbours = None
         self.vor_edges = None
         self.edge_length = None
@@ -50,6 +55,8 @@ class FVmethod:
         self.partIDs = None
         self.maxNgbh = None
         self.localIDs = None
+        self.pitSend = None
+        self.pitRecv = None
 
     def _FV_utils(self, lGIDs, verbose=False):
         """
@@ -76,13 +83,16 @@ class FVmethod:
         if rank == 0 and verbose:
             print " - build the voronoi diagram ", time.clock() - walltime
 
+        # Largest number of edges connected to a single node
+        ngbNb = numpy.bincount(self.edges[:,:2].ravel()).max()
+
         # Call the finite volume frame construction function from libUtils
         walltime = time.clock()
         self.control_volumes, self.neighbours, self.vor_edges, \
         self.edge_length, maxNgbhs = FVframe.discretisation.build( \
              lGIDs+1, self.localIDs+1, self.node_coords[:,0], self.node_coords[:,1],
             self.edges[:,:2]+1, self.cells[:,:3]+1, Vor_pts[:,0], Vor_pts[:,1], \
-            Vor_edges[:,:2]+1)
+            Vor_edges[:,:2]+1, ngbNb)
         if rank == 0 and verbose:
             print " - construct Finite Volume representation ", time.clock() - walltime
 
@@ -159,7 +169,7 @@ class FVmethod:
 
         return exportVols
 
-    def _gather_Neighbours(self, localPtsNb, totPts):
+    def _gather_Neighbours(self, localPtsNb):
         """
         Gather local neigbours ID to all processors.
 
@@ -168,16 +178,16 @@ class FVmethod:
         variable : localPtsNb
             Number of points on each local partition.
 
-        variable : totPts
-            Total number of points on the global TIN surface.
-
         Return
         ----------
+        variable : exportNgbhNb
+            Numpy integer-type array filled with the number of neighbours of each node.
+
         variable : exportNgbhIDs
-            Numpy integer-type array filled with the global neighbourhood IDs.
+            Numpy integer-type array filled with the flatten global neighbourhood IDs.
 
-        variable : shape
-            Shape of the neighbours array.
+        variable : mask
+            Numpy boolean-type array defining the existing neighbours of each local node.
 
         variable : ngbhNbs
             Numpy integer-type array filled with the local neighbourhood IDs.
@@ -185,36 +195,36 @@ class FVmethod:
 
         comm = mpi.COMM_WORLD
 
-        # Get local neighbourhood declaration
-        ngbh = numpy.zeros((localPtsNb,self.maxNgbh), dtype=numpy.int)
-        ngbh.fill(-2)
+        # Get local neighbourhood declaration without the padding values
         ngbh = self.neighbours[self.localIDs,:self.maxNgbh]
-        ngbh = numpy.ravel(ngbh)
-        ngbhINT = ngbh.astype(numpy.int32)
+        mask = ngbh >= 0
+        ngbhNb = numpy.sum(mask, axis=1).astype(numpy.int32)
+        ngbhINT = ngbh[mask].astype(numpy.int32)
+
+        # Gather the number of neighbours of each node globally
+        arraylocNb = comm.allgather(localPtsNb)
+        exportNgbhNb = numpy.zeros(sum(arraylocNb),dtype=numpy.int32)
+        comm.Allgatherv(sendbuf=[ngbhNb, mpi.INT],
+                     recvbuf=[exportNgbhNb, (arraylocNb, None), mpi.INT])
 
         # Find each partition contribution to global dataset
         ngbhNbs = comm.allgather(len(ngbhINT))
 
         # Gather flatten neighbour array definition from each region globally
-        shape = (totPts, self.maxNgbh)
-        globalNgbh = numpy.zeros(sum(ngbhNbs),dtype=ngbhINT.dtype)
+        exportNgbhIDs = numpy.zeros(sum(ngbhNbs),dtype=ngbhINT.dtype)
         comm.Allgatherv(sendbuf=[ngbhINT, mpi.INT],
-                     recvbuf=[globalNgbh, (ngbhNbs, None), mpi.INT])
-        exportNgbhIDs = numpy.reshape(globalNgbh,shape)
+                     recvbuf=[exportNgbhIDs, (ngbhNbs, None), mpi.INT])
 
-        return exportNgbhIDs, shape, ngbhNbs
+        return exportNgbhNb, exportNgbhIDs, mask, ngbhNbs
 
-    def _gather_Edges(self, localPtsNb, shape, ngbhNbs):
+    def _gather_Edges(self, mask, ngbhNbs):
         """
         Gather local edges to all processors.
 
         Parameters
         ----------
-        variable : localPtsNb
-            Number of points on each local partition.
-
-        variable : shape
-            Shape of the neighbours array.
+        variable : mask
+            Numpy boolean-type array defining the existing neighbours of each local node.
 
         variable : ngbhNbs
             Numpy integer-type array filled with the local neighbourhood IDs.
@@ -228,30 +238,24 @@ class FVmethod:
         comm = mpi.COMM_WORLD
 
         # Get local edges length declaration
-        edges = numpy.zeros((localPtsNb,self.maxNgbh), dtype=numpy.float)
         edges = self.edge_length[self.localIDs,:self.maxNgbh]
-        edges = numpy.ravel(edges)
-        edgesFLT = edges.astype(numpy.float32)
+        edgesFLT = edges[mask].astype(numpy.float32)
 
         # Gather flatten array definition from each region globally
         globalEdges = numpy.zeros(sum(ngbhNbs),dtype=edgesFLT.dtype)
         comm.Allgatherv(sendbuf=[edgesFLT, mpi.FLOAT],
                      recvbuf=[globalEdges, (ngbhNbs, None), mpi.FLOAT])
-        exportEdges = numpy.reshape(globalEdges,shape)
 
-        return exportEdges
+        return globalEdges.astype(numpy.float)
 
-    def _gather_VorEdges(self, localPtsNb, shape, ngbhNbs):
+    def _gather_VorEdges(self, mask, ngbhNbs):
         """
         Gather local voronoi edges to all processors.
 
         Parameters
         ----------
-        variable : localPtsNb
-            Number of points on each local partition.
-
-        variable : shape
-            Shape of the neighbours array.
+        variable : mask
+            Numpy boolean-type array defining the existing neighbours of each local node.
 
         variable : ngbhNbs
             Numpy integer-type array filled with the local neighbourhood IDs.
@@ -265,18 +269,54 @@ class FVmethod:
         comm = mpi.COMM_WORLD
 
         # Get local voronoi length declaration
-        vors = numpy.zeros((localPtsNb,self.maxNgbh), dtype=numpy.float)
         vors = self.vor_edges[self.localIDs,:self.maxNgbh]
-        vors = numpy.ravel(vors)
-        vorsFLT = vors.astype(numpy.float32)
+        vorsFLT = vors[mask].astype(numpy.float32)
 
         # Gather flatten array definition from each region globally
         globalVors = numpy.zeros(sum(ngbhNbs),dtype=vorsFLT.dtype)
         comm.Allgatherv(sendbuf=[vorsFLT, mpi.FLOAT],
                      recvbuf=[globalVors, (ngbhNbs, None), mpi.FLOAT])
-        exportVors = numpy.reshape(globalVors,shape)
 
-        return exportVors
+        return globalVors.astype(numpy.float)
+
+    def _build_topology(self, exportGIDs, exportNgbhNb, totPts):
+        """
+        Define the compressed sparse row (CSR) topology of the global TIN from the gathered
+        neighbourhoods. Neighbours of node i are stored in positions ngbOffsets[i] to
+        ngbOffsets[i+1] of the flatten neighbourhood arrays.
+
+        Parameters
+        ----------
+        variable: exportGIDs
+            Numpy integer-type array filled with the global vertex IDs ordered by processor ID.
+
+        variable : exportNgbhNb
+            Numpy integer-type array filled with the number of neighbours of each node.
+
+        variable : totPts
+            Total number of points on the global TIN surface.
+
+        Return
+        ----------
+        variable : ngbOffsets
+            Numpy integer-type array containing the offsets of each node neighbourhood.
+
+        variable : order
+            Numpy integer-type array used to reorder the gathered neighbourhood arrays by
+            global node ID.
+        """
+
+        ngbOffsets = numpy.zeros(totPts+1, dtype=numpy.int32)
+        ngbOffsets[exportGIDs+1] = exportNgbhNb
+        ngbOffsets = numpy.cumsum(ngbOffsets, dtype=numpy.int32)
+
+        # Position of each gathered neighbour in the global topology
+        gatherStart = numpy.cumsum(exportNgbhNb) - exportNgbhNb
+        shift = numpy.repeat(ngbOffsets[exportGIDs] - gatherStart, exportNgbhNb)
+        order = numpy.empty(len(shift), dtype=numpy.int32)
+        order[numpy.arange(len(shift)) + shift] = numpy.arange(len(shift))
+
+        return ngbOffsets, order
 
     def construct_FV(self, inIDs, lGIDs, totPts, res, verbose=False):
         """
@@ -303,13 +343,16 @@ class FVmethod:
         variable: exportGIDs
             Numpy integer-type array filled with the global vertex IDs ordered by processor ID.
 
-        variable : exportNgbhIDs
+        variable : ngbOffsets
+            Numpy integer-type array containing the offsets of each node neighbourhood.
+
+        variable : ngbIDs
             Numpy integer-type array filled with the global neighbourhood IDs.
 
-        variable : exportEdges
+        variable : ngbEdges
             Numpy float-type array containing the lengths to each neighbour.
 
-        variable : exportVors
+        variable : ngbVors
             Numpy float-type array containing the voronoi edge lengths to each neighbour.
 
         variable : exportVols
@@ -340,15 +383,24 @@ class FVmethod:
         # Gather voronoi area from each region globally
         exportVols = self._gather_Area(localPtsNb)
         # Gather neighbourhood IDs from each region globally
-        exportNgbhIDs, shape, ngbhNbs = self._gather_Neighbours(localPtsNb, totPts)
+        exportNgbhNb, exportNgbhIDs, mask, ngbhNbs = self._gather_Neighbours(localPtsNb)
         # Gather edges lengths from each region globally
-        exportEdges = self._gather_Edges(localPtsNb, shape, ngbhNbs)
+        exportEdges = self._gather_Edges(mask, ngbhNbs)
         maxdist = numpy.sqrt(2.*res**2)
         exportEdges[exportEdges > 2.*maxdist] = maxdist
         # Gather voronoi edges lengths from each region globally
-        exportVors = self._gather_VorEdges(localPtsNb, shape, ngbhNbs)
+        exportVors = self._gather_VorEdges(mask, ngbhNbs)
 
         if rank == 0 and verbose:
             print " - perform MPI communication ", time.clock() - walltime
 
-        return exportGIDs, exportNgbhIDs, exportEdges, exportVors, exportVols
+        # Sort neighbourhoods by global node ID
+        ngbOffsets, order = self._build_topology(exportGIDs, exportNgbhNb, totPts)
+
+        # Local padded arrays are not needed once the global topology is defined
+        self.neighbours = None
+        self.edge_length = None
+        self.vor_edges = None
+
+        return exportGIDs, ngbOffsets, exportNgbhIDs[order], exportEdges[order], \
+            exportVors[order], exportVols
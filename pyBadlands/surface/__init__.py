@@ -13,3 +13,4 @@
 import visSurf
 import FVmethod
 import raster2TIN
+import reorderTIN
@@ -13,13 +13,15 @@ This module encapsulates functions related to Badlands surface elevation.
 import time
 import numpy
 from pyBadlands.libUtils import PDalgo
+from pyBadlands.surface import partitionTIN
+import mpi4py.MPI as mpi
 import warnings
 
 from scipy.interpolate import interpn
 from scipy.interpolate import LinearNDInterpolator
 from scipy.interpolate import NearestNDInterpolator
 
-def _boundary_elevation(elevation, neighbours, edge_length, boundPts, btype):
+def _boundary_elevation(elevation, ngbOffsets, neighbours, edge_length, boundPts, btype):
     """
     This function defines the elevation of the TIN surface edges for 2 different types of conditions:
         1. Infinitely flat condition,
@@ -30,6 +32,9 @@ def _boundary_elevation(elevation, neighbours, edge_length, boundPts, btype):
     variable : elevation
         Numpy arrays containing the internal nodes elevation.
 
+    variable : ngbOffsets
+        Numpy integer-type array containing the offsets of each node neighbourhood.
+
     variable : neighbours
         Numpy integer-type array containing for each nodes its neigbhours IDs.
 
@@ -52,12 +57,12 @@ def _boundary_elevation(elevation, neighbours, edge_length, boundPts, btype):
     if btype == 0:
         missedPts = []
         for id in range(boundPts):
-            ngbhs = neighbours[id,:]
+            ngbhs = neighbours[ngbOffsets[id]:ngbOffsets[id+1]]
             ids = numpy.where(ngbhs >= boundPts)[0]
             if len(ids) == 1:
                 elevation[id] = elevation[ngbhs[ids]]
             elif len(ids) > 1:
-                lselect = edge_length[id,ids]
+                lselect = edge_length[ngbOffsets[id]+ids]
                 picked = numpy.argmin(lselect)
                 elevation[id] = elevation[ngbhs[ids[picked]]]
             else:
@@ -66,11 +71,11 @@ def _boundary_elevation(elevation, neighbours, edge_length, boundPts, btype):
         if len(missedPts) > 0 :
             for p in range(len(missedPts)):
                 id = int(missedPts[p])
-                ngbhs = neighbours[id,:]
-                ids = numpy.where((elevation[ngbhs] < 9.e6) & (ngbhs >= 0))[0]
+                ngbhs = neighbours[ngbOffsets[id]:ngbOffsets[id+1]]
+                ids = numpy.where(elevation[ngbhs] < 9.e6)[0]
                 if len(ids) == 0:
                     raise ValueError('Error while getting boundary elevation for point ''%d''.' % id)
-                lselect = edge_length[id,ids]
+                lselect = edge_length[ngbOffsets[id]+ids]
                 picked = numpy.argmin(lselect)
                 elevation[id] = elevation[ngbhs[ids[picked]]]
 
@@ -78,16 +83,16 @@ def _boundary_elevation(elevation, neighbours, edge_length, boundPts, btype):
     elif btype == 1:
         missedPts = []
         for id in range(boundPts):
-            ngbhs = neighbours[id,:]
+            ngbhs = neighbours[ngbOffsets[id]:ngbOffsets[id+1]]
             ids = numpy.where(ngbhs >= boundPts)[0]
             if len(ids) == 1:
                 # Pick closest non-boundary vertice
-                ln1 = edge_length[id,ids[0]]
+                ln1 = edge_length[ngbOffsets[id]+ids[0]]
                 id1 = ngbhs[ids[0]]
                 # Pick closest non-boundary vertice to first picked
-                ngbhs2 = neighbours[id1,:]
+                ngbhs2 = neighbours[ngbOffsets[id1]:ngbOffsets[id1+1]]
                 ids2 = numpy.where(ngbhs2 >= boundPts)[0]
-                lselect = edge_length[id1,ids2]
+                lselect = edge_length[ngbOffsets[id1]+ids2]
                 if len(lselect) > 0:
                     picked = numpy.argmin(lselect)
                     id2 = ngbhs2[ids2[picked]]
@@ -97,14 +102,14 @@ def _boundary_elevation(elevation, neighbours, edge_length, boundPts, btype):
                     missedPts = numpy.append(missedPts,id)
             elif len(ids) > 1:
                 # Pick closest non-boundary vertice
-                lselect = edge_length[id,ids]
+                lselect = edge_length[ngbOffsets[id]+ids]
                 picked = numpy.argmin(lselect)
                 id1 = ngbhs[ids[picked]]
                 ln1 = lselect[picked]
                 # Pick closest non-boundary vertice to first picked
-                ngbhs2 = neighbours[id1,:]
+                ngbhs2 = neighbours[ngbOffsets[id1]:ngbOffsets[id1+1]]
                 ids2 = numpy.where(ngbhs2 >= boundPts)[0]
-                lselect2 = edge_length[id1,ids2]
+                lselect2 = edge_length[ngbOffsets[id1]+ids2]
                 if len(lselect2) > 0:
                     picked2 = numpy.argmin(lselect2)
                     id2 = ngbhs2[ids2[picked2]]
@@ -118,17 +123,17 @@ def _boundary_elevation(elevation, neighbours, edge_length, boundPts, btype):
         if len(missedPts) > 0 :
             for p in range(0,len(missedPts)):
                 id = int(missedPts[p])
-                ngbhs = neighbours[id,:]
-                ids = numpy.where((elevation[ngbhs] < 9.e6) & (ngbhs >= 0))[0]
+                ngbhs = neighbours[ngbOffsets[id]:ngbOffsets[id+1]]
+                ids = numpy.where(elevation[ngbhs] < 9.e6)[0]
                 if len(ids) == 0:
                     raise ValueError('Error while getting boundary elevation for point ''%d''.' % id)
-                lselect = edge_length[id,ids]
+                lselect = edge_length[ngbOffsets[id]+ids]
                 picked = numpy.argmin(lselect)
                 elevation[id] = elevation[ngbhs[ids[picked]]]
 
     return elevation
 
-def update_border_elevation(elev, neighbours, edge_length, boundPts, btype='flat'):
+def update_border_elevation(elev, ngbOffsets, neighbours, edge_length, boundPts, btype='flat'):
     """
     This function computes the domain boundary elevation for 3 different types of conditions:
         1. Infinitely flat condition,
@@ -140,6 +145,9 @@ def update_border_elevation(elev, neighbours, edge_length, boundPts, btype='flat
     variable : elev
         Numpy arrays containing the internal nodes elevation.
 
+    variable : ngbOffsets
+        Numpy integer-type array containing the offsets of each node neighbourhood.
+
     variable : neighbours
         Numpy integer-type array containing for each nodes its neigbhours IDs.
 
@@ -172,13 +180,13 @@ def update_border_elevation(elev, neighbours, edge_length, boundPts, btype='flat
         if btype == 'slope':
             thetype = 1
 
-        newelev = _boundary_elevation(elev, neighbours, edge_length, boundPts, thetype)
+        newelev = _boundary_elevation(elev, ngbOffsets, neighbours, edge_length, boundPts, thetype)
     else:
         raise ValueError('Unknown boundary type ''%s''.' % btype)
 
     return newelev
 
-def getElevation(rX, rY, rZ, coords, interp='linear'):
+def getElevation(rX, rY, rZ, coords, interp='linear', operator=None, ids=None):
     """
     This function interpolates elevation from a regular grid to a cloud of points using SciPy interpolation.
 
@@ -193,6 +201,12 @@ def getElevation(rX, rY, rZ, coords, interp='linear'):
     variable : interp
         Define the interpolation technique as in SciPy interpn function. The default is 'linear'
 
+    variable : operator
+        Regular grid to TIN interpolation operator (optional) used instead of SciPy interpolation.
+
+    variable : ids
+        Numpy integer-type array containing the IDs of the coords within the operator points.
+
     Return
     ----------
     variable: elev
@@ -203,16 +217,22 @@ def getElevation(rX, rY, rZ, coords, interp='linear'):
     elev = numpy.zeros(len(coords[:,0]))
 
     # Get the TIN points elevation values using the regular grid dataset
-    elev = interpn( (rX, rY), rZ, (coords[:,:2]), method=interp)
+    if operator is not None:
+        elev = operator.apply(numpy.ravel(rZ, order='F'), ids, method=interp)
+    else:
+        elev = interpn( (rX, rY), rZ, (coords[:,:2]), method=interp)
 
     return elev
 
-def assign_parameter_pit(neighbours, boundPts, fillTH=1., epsilon=0.01):
+def assign_parameter_pit(ngbOffsets, neighbours, boundPts, fillTH=1., epsilon=0.01):
     """
     This function defines global variables used in the pit filling algorithm.
 
     Parameters
     ----------
+    variable : ngbOffsets
+        Numpy integer-type array containing the offsets of each node neighbourhood.
+
     variable : neighbours
         Numpy integer-type array containing for each nodes its neigbhours IDs.
 
@@ -228,7 +248,7 @@ def assign_parameter_pit(neighbours, boundPts, fillTH=1., epsilon=0.01):
         pathways. Default is set to 0.01 metres.
     """
 
-    PDalgo.pdstack.pitparams(neighbours, fillTH, epsilon, boundPts)
+    PDalgo.pdstack.pitparams(ngbOffsets, neighbours, fillTH, epsilon, boundPts)
 
 
 def pit_stack_PD(elev, sea, allFill):
@@ -258,8 +278,177 @@ def pit_stack_PD(elev, sea, allFill):
 
     return fillH
 
+def pit_priority_flood(elev, sea, allFill):
+    """
+    This function calls a priority-flood depression-less algorithm (Barnes et al., 2014) to compute
+    the flow pathway. It returns the same surface as the Planchon & Darboux method (minimal slope and
+    filling thickness limit) in O(n log n) operations.
 
-def pit_filling_PD(elev, neighbours, boundPts, sea, fillTH=1., epsilon=0.01):
+    Parameters
+    ----------
+    variable : elev
+        Numpy arrays containing the nodes elevation.
+
+    variable : sea
+        Current elevation of sea level.
+
+    variable : allFill
+        Produce depression-less surface.
+
+    Return
+    ----------
+    variable: fillH
+        Numpy array containing the filled elevations.
+    """
+
+    # Call priority-flood pit filling function from libUtils
+    fillH = PDalgo.pdstack.pitpriority(elev, sea, allFill)
+
+    return fillH
+
+def pit_update(elev, sea, allFill, tolerance, nrefill, searefill):
+    """
+    This function updates the depression-less surface obtained at the previous call. Only the nodes
+    which moved by more than a given tolerance and the depressions spilling through them are flooded
+    again. A complete priority-flood filling is performed periodically.
+
+    Parameters
+    ----------
+    variable : elev
+        Numpy arrays containing the nodes elevation.
+
+    variable : sea
+        Current elevation of sea level.
+
+    variable : allFill
+        Produce depression-less surface.
+
+    variable : tolerance
+        Elevation variation above which a node is flooded again.
+
+    variable : nrefill
+        Number of updates between two complete filling.
+
+    variable : searefill
+        Sea-level variation forcing a complete filling.
+
+    Return
+    ----------
+    variable: fillH
+        Numpy array containing the filled elevations.
+    """
+
+    # Call incremental pit filling function from libUtils
+    fillH, nbupdate = PDalgo.pdstack.pitupdate(elev, sea, allFill, tolerance, nrefill, searefill)
+
+    return fillH
+
+def assign_partition_pit(ngbOffsets, neighbours, partIDs):
+    """
+    This function restricts the priority-flood algorithm to the nodes of the local partition and
+    defines the ghost nodes exchanged with the neighbouring partitions.
+
+    Parameters
+    ----------
+    variable : ngbOffsets
+        Numpy integer-type array containing the offsets of each node neighbourhood.
+
+    variable : neighbours
+        Numpy integer-type array containing for each nodes its neigbhours IDs.
+
+    variable : partIDs
+        Numpy integer-type array filled with the ID of the partition each node belongs to.
+
+    Return
+    ----------
+    variable: sendIDs
+        List containing for each processor the global IDs of the local nodes it needs.
+
+    variable: recvIDs
+        List containing for each processor the global IDs of the ghost nodes it owns.
+    """
+
+    rank = mpi.COMM_WORLD.Get_rank()
+
+    # Ghost nodes are the neighbours of the partition owned by other processors
+    inGIDs = numpy.where(partIDs == rank)[0]
+    rows = numpy.repeat(numpy.arange(len(partIDs)), numpy.diff(ngbOffsets))
+    ghosts = numpy.setdiff1d(neighbours[partIDs[rows] == rank], inGIDs)
+
+    owned = numpy.zeros(len(partIDs), dtype=numpy.int32)
+    owned[inGIDs] = 1
+    PDalgo.pdstack.pitpartition(owned, ghosts+1)
+
+    sendIDs, recvIDs = partitionTIN.halo(numpy.union1d(inGIDs, ghosts), inGIDs, partIDs)
+
+    return sendIDs, recvIDs
+
+def pit_parallel_flood(elev, sea, allFill, sendIDs, recvIDs):
+    """
+    This function calls the priority-flood depression-less algorithm on each partition. The filled
+    elevations of the partition borders are then exchanged until the depressions spreading over
+    several partitions are resolved. The result is identical to the serial filling.
+
+    Parameters
+    ----------
+    variable : elev
+        Numpy arrays containing the nodes elevation.
+
+    variable : sea
+        Current elevation of sea level.
+
+    variable : allFill
+        Produce depression-less surface.
+
+    variable: sendIDs
+        List containing for each processor the global IDs of the local nodes it needs.
+
+    variable: recvIDs
+        List containing for each processor the global IDs of the ghost nodes it owns.
+
+    Return
+    ----------
+    variable: fillH
+        Numpy array containing the filled elevations.
+    """
+
+    comm = mpi.COMM_WORLD
+    size = comm.Get_size()
+
+    # Fill the local partition
+    fillH = PDalgo.pdstack.pitlocal(elev, sea, allFill)
+
+    ghostIDs = numpy.concatenate([recvIDs[p] for p in range(size)])
+    ghostH = numpy.zeros(len(ghostIDs), dtype=numpy.float64)
+    nbupdate = 1
+    while nbupdate > 0:
+        # Exchange partition borders filled elevations
+        requests = []
+        offset = 0
+        for p in range(size):
+            nb = len(recvIDs[p])
+            if nb > 0:
+                requests.append(comm.Irecv([ghostH[offset:offset+nb], mpi.DOUBLE], source=p, tag=11))
+            offset += nb
+        sendbufs = []
+        for p in range(size):
+            if len(sendIDs[p]) > 0:
+                sbuf = fillH[sendIDs[p]]
+                requests.append(comm.Isend([sbuf, mpi.DOUBLE], dest=p, tag=11))
+                sendbufs.append(sbuf)
+        mpi.Request.Waitall(requests)
+
+        # Flood again from the lowered ghost nodes
+        nbupdate = PDalgo.pdstack.pitghosts(elev, allFill, fillH, ghostIDs+1, ghostH)
+        nbupdate = comm.allreduce(nbupdate, op=mpi.SUM)
+
+    # Each node is filled on its partition and higher elsewhere
+    comm.Allreduce(mpi.IN_PLACE, fillH, op=mpi.MIN)
+
+    return fillH
+
+
+def pit_filling_PD(elev, ngbOffsets, neighbours, boundPts, sea, fillTH=1., epsilon=0.01):
     """
     This function calls a depression-less algorithm from Planchon & Darboux to compute the flow pathway.
 
@@ -268,6 +457,9 @@ def pit_filling_PD(elev, neighbours, boundPts, sea, fillTH=1., epsilon=0.01):
     variable : elev
         Numpy arrays containing the nodes elevation.
 
+    variable : ngbOffsets
+        Numpy integer-type array containing the offsets of each node neighbourhood.
+
     variable : neighbours
         Numpy integer-type array containing for each nodes its neigbhours IDs.
 
@@ -292,6 +484,6 @@ def pit_filling_PD(elev, neighbours, boundPts, sea, fillTH=1., epsilon=0.01):
     """
 
     # Call pit filling function from libUtils
-    fillH = PDalgo.pdcompute.filling(elev, neighbours, fillTH, epsilon, boundPts, sea )
+    fillH = PDalgo.pdcompute.filling(elev, ngbOffsets, neighbours, fillTH, epsilon, boundPts, sea )
 
     return fillH
@@ -0,0 +1,208 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module reads the regular grids (DEM and forcing maps) either from ASCII files or from
+binary numpy (.npy) and HDF5 (.h5, .hdf5) files which are memory mapped. It can also be used
+from the command line to convert ASCII grids to binary ones:
+
+    python -m pyBadlands.surface.gridFile [--format npy|h5] [--dem demfile] file1.csv ...
+"""
+
+import os
+import sys
+import h5py
+import numpy
+import pandas
+import argparse
+
+# Extensions of the binary grid files
+NPY_EXT = ['.npy']
+HDF5_EXT = ['.h5', '.hdf5']
+
+def is_binary(filename):
+    """
+    This function checks if a grid file is stored in a binary format.
+
+    Parameters
+    ----------
+    string : filename
+        Path to the grid file.
+
+    Return
+    ----------
+    variable: binary
+        Boolean set to True for numpy and HDF5 files.
+    """
+
+    ext = os.path.splitext(filename)[1].lower()
+
+    return ext in NPY_EXT or ext in HDF5_EXT
+
+def _read_hdf5(filename):
+    """
+    This function reads the grid dataset of an HDF5 file. Contiguous datasets are memory mapped
+    and the others are loaded in memory.
+
+    Parameters
+    ----------
+    string : filename
+        Path to the HDF5 grid file.
+
+    Return
+    ----------
+    variable: data
+        Numpy array containing the grid columns.
+    """
+
+    with h5py.File(filename, 'r') as f:
+        if 'grid' not in f:
+            raise ValueError('The HDF5 grid file %s has no grid dataset.'%filename)
+        dset = f['grid']
+        shape = dset.shape
+        dtype = dset.dtype
+        if 'nx' in dset.attrs and 'ny' in dset.attrs:
+            if int(dset.attrs['nx']) * int(dset.attrs['ny']) != shape[0]:
+                raise ValueError('The HDF5 grid file %s header does not match its size.'%filename)
+        offset = None
+        if dset.chunks is None and dset.compression is None:
+            offset = dset.id.get_offset()
+        if offset is None:
+            data = numpy.array(dset)
+
+    if offset is not None:
+        data = numpy.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+    return data
+
+def read_grid(filename, delimiter=r'\s+'):
+    """
+    This function reads a regular grid file. The nodes are ordered by row from SW to NE corner
+    and each column of the file contains one variable.
+
+    Parameters
+    ----------
+    string : filename
+        Path to the grid file. Files with .npy, .h5 or .hdf5 extensions are memory mapped, the
+        other ones are read as ASCII files without header.
+
+    string : delimiter
+        The delimiter between columns of ASCII files.
+
+    Return
+    ----------
+    variable: data
+        Numpy 2D array containing the grid columns.
+    """
+
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in NPY_EXT:
+        data = numpy.load(filename, mmap_mode='r')
+    elif ext in HDF5_EXT:
+        data = _read_hdf5(filename)
+    else:
+        data = pandas.read_csv(filename, sep=delimiter, engine='c', header=None, na_filter=False,
+                               dtype=numpy.float, low_memory=False).values
+
+    if data.ndim == 1:
+        data = data.reshape((len(data), 1))
+
+    return data
+
+def write_grid(filename, data, nx=None, ny=None):
+    """
+    This function writes a regular grid in binary format. HDF5 datasets are stored contiguous
+    so that they can be memory mapped.
+
+    Parameters
+    ----------
+    string : filename
+        Path to the numpy (.npy) or HDF5 (.h5, .hdf5) grid file.
+
+    variable : data
+        Numpy 2D array containing the grid columns.
+
+    variable : nx, ny
+        Number of nodes of the regular grid along the X and Y axes stored in the HDF5 header.
+    """
+
+    ext = os.path.splitext(filename)[1].lower()
+    data = numpy.ascontiguousarray(data, dtype=numpy.float64)
+    if ext in NPY_EXT:
+        numpy.save(filename, data)
+    elif ext in HDF5_EXT:
+        with h5py.File(filename, 'w') as f:
+            dset = f.create_dataset('grid', data=data)
+            if nx is not None and ny is not None:
+                dset.attrs['nx'] = nx
+                dset.attrs['ny'] = ny
+    else:
+        raise ValueError('Unknown binary grid format for %s.'%filename)
+
+    return
+
+def convert_grid(infile, outfile, dem=None):
+    """
+    This function converts an ASCII grid file to a binary one.
+
+    Parameters
+    ----------
+    string : infile
+        Path to the ASCII grid file.
+
+    string : outfile
+        Path to the numpy (.npy) or HDF5 (.h5, .hdf5) grid file.
+
+    string : dem
+        Path to the DEM file defining the regular grid of forcing maps. The DEM file itself
+        defines the grid when its X and Y columns are given.
+    """
+
+    data = read_grid(infile)
+
+    # Regular grid dimensions
+    nx = None
+    ny = None
+    xy = None
+    if dem is not None:
+        xy = read_grid(dem)
+    elif data.shape[1] == 3:
+        xy = data
+    if xy is not None:
+        nx = len(numpy.unique(xy[:,0]))
+        ny = len(numpy.unique(xy[:,1]))
+        if nx * ny != data.shape[0]:
+            raise ValueError('The grid file %s does not match the regular grid size.'%infile)
+
+    write_grid(outfile, data, nx, ny)
+
+    return
+
+def main(args=None):
+    """
+    Command line interface converting ASCII grid files to binary ones. Each file is written next
+    to the ASCII one with the extension of the requested format.
+    """
+
+    parser = argparse.ArgumentParser(description='Convert Badlands ASCII grids to binary files.')
+    parser.add_argument('files', nargs='+', help='ASCII grid files to convert')
+    parser.add_argument('--format', choices=['npy', 'h5'], default='npy',
+                        help='binary format (default: npy)')
+    parser.add_argument('--dem', default=None,
+                        help='DEM file defining the regular grid of forcing maps')
+    args = parser.parse_args(args)
+
+    for infile in args.files:
+        outfile = os.path.splitext(infile)[0]+'.'+args.format
+        convert_grid(infile, outfile, args.dem)
+        print infile, '->', outfile
+
+    return
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
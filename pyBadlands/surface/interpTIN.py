@@ -0,0 +1,222 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module defines the interpolation operator from the regular grid to the TIN nodes. The
+cells containing the nodes are searched once and the interpolation of any grid map becomes
+a sparse matrix product giving the same values as SciPy interpn function.
+"""
+
+import copy
+import numpy
+from scipy import sparse
+
+class interpTIN:
+    """
+    This class builds the sparse interpolation operators from the regular grid to a set of
+    points. The linear operator is built on creation and the nearest one on first use.
+
+    Parameters
+    ----------
+    float : regX
+        Numpy array containing the X-coordinates of the regular grid.
+
+    float : regY
+        Numpy array containing the Y-coordinates of the regular grid.
+
+    float : XY
+        Numpy float-type array containing the X, Y coordinates of the points.
+    """
+
+    def __init__(self, regX, regY, XY):
+
+        self.regX = regX
+        self.regY = regY
+        self.XY = XY
+        self.nPts = len(XY[:,0])
+        self.nGrid = len(regX) * len(regY)
+
+        self.outside = self._check_bounds()
+        self.matrix = {}
+        self.matrix['linear'] = self._build('linear')
+
+        self._ids = None
+        self._sub = None
+
+    def _check_bounds(self):
+        """
+        Check that the points are located within the regular grid.
+
+        Return
+        ----------
+        variable: outside
+            Error message raised when the operator is applied to points outside of the regular
+            grid or None.
+        """
+
+        for d, (p, grid) in enumerate(zip(self.XY.T, (self.regX, self.regY))):
+            if not numpy.logical_and(numpy.all(grid[0] <= p), numpy.all(p <= grid[-1])):
+                return 'One of the requested xi is out of bounds in dimension %d'%d
+
+        return None
+
+    def _find_cells(self):
+        """
+        Find the regular grid cells containing the points.
+
+        Return
+        ----------
+        variable: indices
+            List of numpy integer-type arrays containing the lower cell index along X and Y.
+
+        variable: distances
+            List of numpy float-type arrays containing the normalised distances to the lower
+            cell edges along X and Y.
+        """
+
+        indices = []
+        distances = []
+        for x, grid in zip(self.XY.T, (self.regX, self.regY)):
+            i = numpy.searchsorted(grid, x) - 1
+            i[i < 0] = 0
+            i[i > grid.size - 2] = grid.size - 2
+            indices.append(i)
+            distances.append((x - grid[i]) / (grid[i + 1] - grid[i]))
+
+        return indices, distances
+
+    def _build(self, method):
+        """
+        Build the interpolation operator. Each row of the linear operator stores the four cell
+        corners in the same order as SciPy so that the sums are performed identically.
+
+        Parameters
+        ----------
+        string : method
+            Interpolation method (linear or nearest).
+
+        Return
+        ----------
+        variable: matrix
+            Sparse CSR matrix of the operator.
+        """
+
+        (i, j), (dx, dy) = self._find_cells()
+        nx = len(self.regX)
+
+        if method == 'linear':
+            cols = numpy.empty((self.nPts, 4), dtype=numpy.int32)
+            data = numpy.empty((self.nPts, 4), dtype=numpy.float64)
+            c = 0
+            for ei, wx in [(i, 1 - dx), (i + 1, dx)]:
+                for ej, wy in [(j, 1 - dy), (j + 1, dy)]:
+                    cols[:,c] = ei + ej * nx
+                    data[:,c] = wx * wy
+                    c += 1
+        elif method == 'nearest':
+            cols = numpy.where(dx <= .5, i, i + 1) + numpy.where(dy <= .5, j, j + 1) * nx
+            cols = cols.astype(numpy.int32).reshape((self.nPts, 1))
+            data = numpy.ones((self.nPts, 1), dtype=numpy.float64)
+        else:
+            raise ValueError('Unknown interpolation method %s.'%method)
+
+        return self._csr(cols, data)
+
+    def _csr(self, cols, data):
+        """
+        Assemble a CSR matrix with the same number of entries on each row. The entries are kept
+        in the given order.
+
+        Parameters
+        ----------
+        variable : cols
+            Numpy integer-type array (point, entry) containing the regular grid node IDs.
+
+        variable : data
+            Numpy float-type array (point, entry) containing the interpolation weights.
+
+        Return
+        ----------
+        variable: matrix
+            Sparse CSR matrix of the operator.
+        """
+
+        ptr = numpy.arange(0, cols.size + 1, cols.shape[1], dtype=numpy.int32)
+
+        return sparse.csr_matrix((data.ravel(), cols.ravel(), ptr), shape=(len(cols), self.nGrid))
+
+    def subset(self, ids):
+        """
+        Restrict the operator to a subset of the points.
+
+        Parameters
+        ----------
+        variable : ids
+            Numpy integer-type array containing the IDs of the points.
+
+        Return
+        ----------
+        variable: interp
+            Interpolation operator of the subset.
+        """
+
+        sub = copy.copy(self)
+        sub.XY = self.XY[ids,:]
+        sub.nPts = len(ids)
+        sub.outside = sub._check_bounds()
+        sub.matrix = {}
+        for method, matrix in self.matrix.items():
+            # Row indexing of SciPy sparse matrices may reorder the entries of each row
+            k = 4 if method == 'linear' else 1
+            sub.matrix[method] = sub._csr(matrix.indices.reshape((-1, k))[ids],
+                                          matrix.data.reshape((-1, k))[ids])
+        sub._ids = None
+        sub._sub = None
+
+        return sub
+
+    def apply(self, data, ids=None, method='linear'):
+        """
+        Interpolate regular grid values on the points.
+
+        Parameters
+        ----------
+        variable : data
+            Numpy array containing the regular grid values ordered by row from SW to NE corner
+            as in the grid files, either one value or several columns for each grid node.
+
+        variable : ids
+            Numpy integer-type array containing the IDs of the requested points. The operator of
+            the last requested subset is kept for the next calls.
+
+        string : method
+            Interpolation method (linear or nearest).
+
+        Return
+        ----------
+        variable: values
+            Numpy array containing the interpolated values.
+        """
+
+        if ids is not None:
+            if ids is not self._ids:
+                self._sub = self.subset(ids)
+                self._ids = ids
+            return self._sub.apply(data, method=method)
+
+        if self.outside is not None:
+            raise ValueError(self.outside)
+
+        if method not in self.matrix:
+            self.matrix[method] = self._build(method)
+
+        values = numpy.asarray(data, dtype=numpy.float64)
+        if values.shape[0] != self.nGrid:
+            raise ValueError('The regular grid values do not match the interpolation operator.')
+
+        return self.matrix[method].dot(values)
@@ -0,0 +1,254 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module stores on disk the TIN, its partitioning and the Finite Volume discretisation so
+that the simulations sharing a DEM do not rebuild them.
+"""
+
+import os
+import glob
+import numpy
+import hashlib
+import mpi4py.MPI as mpi
+from uuid import uuid4
+from shutil import rmtree
+
+# Increase when the content of the cache changes
+CACHE_VERSION = 1
+
+# Grid parameters stored with the TIN arrays
+GRID_SCALARS = ['nx', 'ny', 'rnx', 'rny', 'edgesPt', 'boundsPt', 'resEdges', 'areaDel']
+GRID_ARRAYS = ['rectX', 'rectY', 'rectZ', 'regX', 'regY', 'regZ', 'edges', 'bounds', 'bmask']
+
+# Finite Volume arrays, shared by all processors
+TOPO_ARRAYS = ['ngbOffsets', 'neighbours', 'edge_length', 'vor_edges']
+
+class meshCache:
+    """
+    This class reads and writes the mesh cache. Each cache entry is a folder named after a hash
+    of the DEM file content, the TIN parameters and the number of processors. Arrays are saved
+    in numpy binary format and loaded as copy-on-write memory maps.
+
+    Parameters
+    ----------
+    string : folder
+        Path to the folder containing the cache entries.
+
+    string : demfile
+        Path to the DEM file.
+
+    variable : Afactor
+        Factor used to define the TIN resolution.
+
+    string : reorder
+        Space-filling curve used to renumber the TIN vertices.
+    """
+
+    def __init__(self, folder, demfile, Afactor, reorder):
+
+        comm = mpi.COMM_WORLD
+        self.rank = comm.Get_rank()
+        self.size = comm.Get_size()
+
+        self.folder = folder
+
+        # Hash the DEM file content on the master processor
+        demhash = None
+        if self.rank == 0:
+            sha = hashlib.sha1()
+            with open(demfile, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(chunk)
+            demhash = sha.hexdigest()
+        demhash = comm.bcast(demhash, root=0)
+
+        self.key = [('version', str(CACHE_VERSION)), ('dem', demhash),
+                    ('afactor', str(Afactor)), ('reorder', reorder), ('size', str(self.size))]
+        digest = hashlib.sha1(';'.join('%s=%s'%k for k in self.key)).hexdigest()
+        self.path = os.path.join(folder, digest)
+
+    def _read_meta(self, path):
+        """
+        Read the description of a cache entry.
+
+        Parameters
+        ----------
+        string : path
+            Path to the cache entry.
+
+        Return
+        ----------
+        variable: meta
+            Dictionary containing the key and grid parameters of the entry or None when the
+            entry does not exist.
+        """
+
+        try:
+            with open(os.path.join(path, 'meta.txt'), 'r') as f:
+                return dict(line.rstrip('\n').split('=', 1) for line in f if '=' in line)
+        except IOError:
+            return None
+
+    def _load_arrays(self, prefix):
+        """
+        Memory map the arrays of the cache entry whose file names start with prefix.
+
+        Parameters
+        ----------
+        string : prefix
+            Prefix of the file names.
+
+        Return
+        ----------
+        variable: arrays
+            Dictionary containing the memory mapped arrays.
+        """
+
+        arrays = {}
+        for fname in glob.glob(os.path.join(self.path, prefix+'*.npy')):
+            name = os.path.basename(fname)[len(prefix):-4]
+            arrays[name] = numpy.load(fname, mmap_mode='c')
+
+        return arrays
+
+    def load(self):
+        """
+        Load the cache entry matching the current DEM and TIN parameters. An entry which does
+        not match or cannot be read is removed.
+
+        Return
+        ----------
+        variable: tin
+            Dictionary containing the grid parameters, the TIN arrays and the shared Finite
+            Volume arrays or None when the cache has to be built.
+
+        variable: part
+            Dictionary containing the local processor arrays or None.
+        """
+
+        comm = mpi.COMM_WORLD
+
+        valid = 0
+        if self.rank == 0:
+            meta = self._read_meta(self.path)
+            if meta is not None:
+                valid = int(all(meta.get(k) == v for k, v in self.key))
+                if not valid:
+                    rmtree(self.path, ignore_errors=True)
+        valid = comm.bcast(valid, root=0)
+        if not valid:
+            return None, None
+
+        # Each processor maps its own arrays, any missing or corrupted file invalidates the entry
+        tin = None
+        part = None
+        try:
+            meta = self._read_meta(self.path)
+            tin = self._load_arrays('tin.')
+            part = self._load_arrays('p%d.'%self.rank)
+            for name in GRID_SCALARS:
+                tin[name] = float(meta[name])
+                if name not in ['resEdges', 'areaDel']:
+                    tin[name] = int(tin[name])
+            for name in GRID_ARRAYS + TOPO_ARRAYS + ['mesh_vertices', 'mesh_triangles',
+                                                     'mesh_edges', 'partIDs', 'control_volumes']:
+                if name not in tin:
+                    raise IOError('Missing %s array'%name)
+            for name in ['lGIDs', 'local_vertices', 'local_triangles', 'local_edges']:
+                if name not in part:
+                    raise IOError('Missing %s array'%name)
+            if len(tin['partIDs']) != len(tin['mesh_vertices']):
+                raise IOError('Inconsistent number of nodes')
+            ok = 1
+        except (IOError, ValueError, KeyError):
+            ok = 0
+        ok = comm.allreduce(ok, op=mpi.MIN)
+
+        if not ok:
+            comm.Barrier()
+            if self.rank == 0:
+                rmtree(self.path, ignore_errors=True)
+            return None, None
+
+        return tin, part
+
+    def save(self, recGrid, FVmesh, lGIDs, localTIN):
+        """
+        Write the cache entry of the current DEM and TIN parameters. The entry is written in a
+        temporary folder which is renamed once complete.
+
+        Parameters
+        ----------
+        variable : recGrid
+            Regular grid and TIN object.
+
+        variable : FVmesh
+            Finite Volume mesh object.
+
+        variable : lGIDs
+            Numpy integer-type array filled with the global vertex IDs for each local grid located
+            within the partition (including those on the edges).
+
+        variable : localTIN
+            Dictionary containing the local TIN arrays.
+        """
+
+        comm = mpi.COMM_WORLD
+
+        tmp = None
+        if self.rank == 0:
+            try:
+                if not os.path.exists(self.folder):
+                    os.makedirs(self.folder)
+                tmp = self.path+'.tmp'+str(uuid4())
+                os.mkdir(tmp)
+            except OSError:
+                tmp = None
+        tmp = comm.bcast(tmp, root=0)
+        if tmp is None:
+            return
+
+        # Local processor arrays
+        ok = 1
+        try:
+            local = dict(lGIDs=lGIDs, local_vertices=localTIN['vertices'],
+                         local_triangles=localTIN['triangles'], local_edges=localTIN['edges'])
+            for name, array in local.items():
+                numpy.save(os.path.join(tmp, 'p%d.%s.npy'%(self.rank, name)), array)
+        except (IOError, OSError):
+            ok = 0
+        ok = comm.allreduce(ok, op=mpi.MIN)
+
+        if self.rank == 0:
+            try:
+                if not ok:
+                    raise IOError('Cannot write the processors arrays')
+                shared = dict(partIDs=FVmesh.partIDs, control_volumes=FVmesh.control_volumes)
+                for name in GRID_ARRAYS:
+                    shared[name] = getattr(recGrid, name)
+                for name, array in recGrid.tinMesh.items():
+                    shared['mesh_'+name] = array
+                for name in TOPO_ARRAYS:
+                    shared[name] = getattr(FVmesh, name)
+                for name, array in shared.items():
+                    numpy.save(os.path.join(tmp, 'tin.%s.npy'%name), array)
+
+                # The description is written last, it marks a complete entry
+                with open(os.path.join(tmp, 'meta.txt'), 'w') as f:
+                    for k, v in self.key:
+                        f.write('%s=%s\n'%(k, v))
+                    for name in GRID_SCALARS:
+                        f.write('%s=%r\n'%(name, getattr(recGrid, name)))
+                os.rename(tmp, self.path)
+            except (IOError, OSError):
+                # Another simulation wrote the same entry or the folder is not writable
+                rmtree(tmp, ignore_errors=True)
+        comm.Barrier()
+
+        return
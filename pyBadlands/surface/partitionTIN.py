@@ -253,6 +253,51 @@ def overlap(X, Y, nbprocX, nbprocY, overlapLen, verbose=False):
 
     return globIDs, localTIN
 
+def halo(lGIDs, inGIDs, partIDs):
+    """
+    This function defines the halo (ghost) nodes shared between neighbouring partitions.
+    For each processor it returns the list of local nodes to send and the list of ghost
+    nodes to receive when the values of the overlapping regions are exchanged.
+
+    Parameters
+    ----------
+    variable : lGIDs
+        Numpy integer-type array filled with the global vertex IDs for each local grid located
+        within the partition (including those on the edges).
+
+    variable: inGIDs
+        Numpy integer-type array filled with the global vertex IDs for each local grid located
+        within the partition (not those on the edges).
+
+    variable : partIDs
+        Numpy integer-type array filled with the ID of the partition each node belongs to.
+
+    Return
+    ----------
+    variable: sendIDs
+        List containing for each processor the global IDs of the local nodes it needs.
+
+    variable: recvIDs
+        List containing for each processor the global IDs of the ghost nodes it owns.
+    """
+
+    # Initialise MPI communications
+    comm = mpi.COMM_WORLD
+    size = comm.Get_size()
+
+    # Ghost nodes are the ones from the overlapping region owned by other partitions
+    ghosts = numpy.setdiff1d(lGIDs, inGIDs)
+    owners = partIDs[ghosts]
+
+    recvIDs = []
+    for p in range(size):
+        recvIDs.append(ghosts[owners == p].astype(numpy.int32))
+
+    # Each processor tells its neighbours which of their nodes are ghosts locally
+    sendIDs = comm.alltoall(recvIDs)
+
+    return sendIDs, recvIDs
+
 @jit
 def _robin_distribution(X,Y):
     """
@@ -303,7 +348,7 @@ def _robin_distribution(X,Y):
     return GIDs, Lx, Ly
 
 @jit
-def _compute_partition_ghosts(size, neighbours, partID):
+def _compute_partition_ghosts(size, ngbOffsets, neighbours, partID):
     """
     This function find the ghosts (nodes) in the vicinity of each decomposition zone.
 
@@ -312,6 +357,9 @@ def _compute_partition_ghosts(size, neighbours, partID):
     variable : size
         Number of processors.
 
+    variable : ngbOffsets
+        Numpy integer-type array containing the offsets of each node neighbourhood.
+
     variable : neighbours
         Numpy integer-type array containing for each nodes its neigbhours IDs
 
@@ -325,13 +373,9 @@ def _compute_partition_ghosts(size, neighbours, partID):
     """
 
     ghosts = {}
+    rows = numpy.repeat(numpy.arange(len(partID)), numpy.diff(ngbOffsets))
     for p in range(size):
-        ghostIDs = numpy.array([], dtype=int)
-        localIDs = numpy.where(partID == p)[0]
-        for id in range(len(localIDs)):
-            ids = numpy.where( (partID[neighbours[localIDs[id]]] != p) & (neighbours>=0))[0]
-            for k in range(len(ids)):
-                ghostIDs = numpy.append(ghostIDs, neighbours[localIDs[id]][ids[k]])
-        ghosts[p] = numpy.unique(ghostIDs)
+        ids = numpy.where( (partID[rows] == p) & (partID[neighbours] != p) )[0]
+        ghosts[p] = numpy.unique(neighbours[ids])
 
     return ghosts
@@ -15,10 +15,11 @@ import glob
 import h5py
 import numpy
 import errno
-import pandas
 import os.path
 import warnings
 import triangle
+from pyBadlands.surface import reorderTIN
+from pyBadlands.surface import gridFile
 from uuid import uuid4
 from shutil import rmtree
 from scipy import interpolate
@@ -59,9 +60,20 @@ class raster2TIN:
         irregular grid delaunay cells
                     >> TIN cells resolution = areaDelFactor x (TIN edges resolution)^2
         Default: 1
+
+    string : reorder
+        Space-filling curve (hilbert or morton) used to renumber the TIN vertices after the
+        triangulation. The boundary and edge nodes remain at the front of the arrays.
+        Default: 'none'
+
+    variable : cache
+        Dictionary containing the grid parameters and the TIN arrays loaded from the mesh
+        cache. When given, the DEM file is not read and the TIN is not triangulated.
+        Default: None
     """
 
-    def __init__(self, inputfile=None, rank=0, delimiter=r'\s+', resRecFactor=1, areaDelFactor=1):
+    def __init__(self, inputfile=None, rank=0, delimiter=r'\s+', resRecFactor=1, areaDelFactor=1,
+                 reorder='none', cache=None):
 
         if inputfile==None:
             raise RuntimeError('DEM input file name must be defined to construct Badlands irregular grid.')
@@ -78,6 +90,7 @@ class raster2TIN:
         if areaDelFactor < 1:
             raise ValueError( "TIN cell area factor needs to be at least 1." )
         self.areaDelFactor = areaDelFactor
+        self.reorder = reorder
 
         # Define class parameters
         self.nx = None
@@ -100,21 +113,22 @@ class raster2TIN:
         self.bmask = None
 
         # TIN creation
-        self._triangulate_raster_from_file()
+        if cache is None:
+            self._triangulate_raster_from_file()
+        else:
+            self._load_cache(cache)
 
     def _raster_edges(self):
         """
-        Using Pandas library to read the DEM file and allocating nodes and edges.
+        Read the DEM file (ASCII or memory mapped binary file) and allocate nodes and edges.
         This function also sets the TIN parameters.
         """
 
         # Read DEM file
-        data = pandas.read_csv(self.inputfile, sep=self.delimiter, engine='c',
-                               header=None, na_filter=False,
-                               dtype=numpy.float, low_memory=False)
-        self.rectX = data.values[:,0]
-        self.rectY = data.values[:,1]
-        self.rectZ = data.values[:,2]
+        data = gridFile.read_grid(self.inputfile, self.delimiter)
+        self.rectX = data[:,0]
+        self.rectY = data[:,1]
+        self.rectZ = data[:,2]
         resDEM = self.rectX[1]-self.rectX[0]
         minX = self.rectX.min()
         maxX = self.rectX.max()
@@ -217,6 +231,12 @@ class raster2TIN:
         # Create TIN
         tinPts = numpy.vstack(( self.bounds, self.edges))
         self.tinMesh = triangle.triangulate( dict(vertices=tinPts),'Dqa'+str(self.areaDel))
+
+        # Renumber vertices for memory locality
+        if self.reorder != 'none':
+            perm = reorderTIN.curve_order(self.tinMesh['vertices'], self.boundsPt+self.edgesPt,
+                                          self.reorder)
+            self.tinMesh = reorderTIN.renumber_mesh(self.tinMesh, perm)
         ptsTIN = self.tinMesh['vertices']
 
         # Check extent
@@ -236,6 +256,27 @@ class raster2TIN:
 
         return
 
+    def _load_cache(self, cache):
+        """
+        Set the regular grid and TIN parameters from the mesh cache.
+
+        Parameters
+        ----------
+        variable : cache
+            Dictionary containing the grid parameters and the TIN arrays.
+        """
+
+        for name in ['nx', 'ny', 'rnx', 'rny', 'edgesPt', 'boundsPt', 'resEdges', 'areaDel',
+                     'rectX', 'rectY', 'rectZ', 'regX', 'regY', 'regZ', 'edges', 'bounds', 'bmask']:
+            setattr(self, name, cache[name])
+
+        self.tinMesh = {}
+        for name in cache:
+            if name.startswith('mesh_'):
+                self.tinMesh[name[5:]] = cache[name]
+
+        return
+
     def load_hdf5(self, restartFolder, timestep, tXY):
         """
         Read the HDF5 file for a given time step.
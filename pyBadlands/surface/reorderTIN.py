@@ -0,0 +1,176 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module renumbers the triangular irregular network (TIN) vertices along a space-filling
+curve so that nodes which are close in space are also close in memory.
+"""
+
+import numpy
+
+def _grid_coordinates(xy, order):
+    """
+    This function maps the vertices coordinates on an integer grid of 2^order cells along each axis.
+
+    Parameters
+    ----------
+    variable : xy
+        Numpy float-type array containing the X and Y coordinates of the vertices.
+
+    variable : order
+        Integer defining the number of bits used along each axis.
+
+    Return
+    ----------
+    variable: ix, iy
+        Numpy integer-type arrays containing the grid coordinates of the vertices.
+    """
+
+    n = 2**order
+    xmin = xy[:,0].min()
+    ymin = xy[:,1].min()
+    extent = max(xy[:,0].max() - xmin, xy[:,1].max() - ymin)
+    if extent == 0.:
+        extent = 1.
+    ix = numpy.floor((xy[:,0] - xmin) / extent * (n - 1)).astype(numpy.int64)
+    iy = numpy.floor((xy[:,1] - ymin) / extent * (n - 1)).astype(numpy.int64)
+
+    return ix, iy
+
+def morton_keys(xy, order=16):
+    """
+    This function computes the position of each vertex along a Morton (Z-order) curve by
+    interleaving the bits of its grid coordinates.
+
+    Parameters
+    ----------
+    variable : xy
+        Numpy float-type array containing the X and Y coordinates of the vertices.
+
+    variable : order
+        Integer defining the number of bits used along each axis.
+
+    Return
+    ----------
+    variable: keys
+        Numpy integer-type array containing the curve index of each vertex.
+    """
+
+    ix, iy = _grid_coordinates(xy, order)
+    keys = numpy.zeros(len(ix), dtype=numpy.int64)
+    for b in range(order):
+        keys |= ((ix >> b) & 1) << (2*b)
+        keys |= ((iy >> b) & 1) << (2*b + 1)
+
+    return keys
+
+def hilbert_keys(xy, order=16):
+    """
+    This function computes the position of each vertex along a Hilbert curve.
+
+    Parameters
+    ----------
+    variable : xy
+        Numpy float-type array containing the X and Y coordinates of the vertices.
+
+    variable : order
+        Integer defining the number of bits used along each axis.
+
+    Return
+    ----------
+    variable: keys
+        Numpy integer-type array containing the curve index of each vertex.
+    """
+
+    x, y = _grid_coordinates(xy, order)
+    n = 2**order
+    keys = numpy.zeros(len(x), dtype=numpy.int64)
+    s = n // 2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        keys += s * s * ((3 * rx.astype(numpy.int64)) ^ ry.astype(numpy.int64))
+        # Rotate the quadrant
+        flip = ~ry & rx
+        x[flip] = n - 1 - x[flip]
+        y[flip] = n - 1 - y[flip]
+        swap = ~ry
+        tmp = x[swap]
+        x[swap] = y[swap]
+        y[swap] = tmp
+        s //= 2
+
+    return keys
+
+def curve_order(xy, fixIDs, curve='hilbert'):
+    """
+    This function defines the new vertices numbering following a space-filling curve. The
+    first fixIDs vertices (boundary and edge nodes) are left at the front in their original
+    order as the rest of the code relies on this layout.
+
+    Parameters
+    ----------
+    variable : xy
+        Numpy float-type array containing the X and Y coordinates of the vertices.
+
+    variable : fixIDs
+        Number of vertices which need to keep their position (edges and borders nodes).
+
+    variable : curve
+        String defining the space-filling curve (hilbert or morton).
+
+    Return
+    ----------
+    variable: perm
+        Numpy integer-type array such that the new vertex i is the old vertex perm[i].
+    """
+
+    if curve == 'hilbert':
+        keys = hilbert_keys(xy[fixIDs:,:2])
+    elif curve == 'morton':
+        keys = morton_keys(xy[fixIDs:,:2])
+    else:
+        raise ValueError('Unknown space-filling curve: %s' %curve)
+
+    perm = numpy.empty(len(xy), dtype=numpy.int64)
+    perm[:fixIDs] = numpy.arange(fixIDs)
+    perm[fixIDs:] = fixIDs + numpy.argsort(keys, kind='mergesort')
+
+    return perm
+
+def renumber_mesh(tinMesh, perm):
+    """
+    This function applies a vertices permutation to a triangle mesh dictionary. Per-vertex
+    arrays are reordered and connectivity arrays are relabelled.
+
+    Parameters
+    ----------
+    variable : tinMesh
+        Dictionary returned by triangle containing the TIN parameters.
+
+    variable : perm
+        Numpy integer-type array such that the new vertex i is the old vertex perm[i].
+
+    Return
+    ----------
+    variable: tinMesh
+        Dictionary containing the renumbered TIN parameters.
+    """
+
+    inv = numpy.empty(len(perm), dtype=numpy.int64)
+    inv[perm] = numpy.arange(len(perm))
+
+    for key in ['vertices', 'vertex_markers', 'vertex_attributes']:
+        if key in tinMesh:
+            tinMesh[key] = tinMesh[key][perm]
+
+    for key in ['triangles', 'edges', 'segments']:
+        if key in tinMesh:
+            tinMesh[key] = inv[tinMesh[key]].astype(tinMesh[key].dtype)
+
+    return tinMesh
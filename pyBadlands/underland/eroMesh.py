@@ -14,9 +14,9 @@ import glob
 import time
 import h5py
 import numpy
-import pandas
-from scipy import interpolate
 from scipy.spatial import cKDTree
+from pyBadlands.surface import gridFile
+from pyBadlands.surface import interpTIN
 
 class eroMesh():
     """
@@ -24,7 +24,7 @@ class eroMesh():
     """
 
     def __init__(self, layNb, eroMap, eroVal, eroTop, thickMap, thickVal, xyTIN,
-                 regX, regY, bPts, ePts, folder, rfolder=None, rstep=0):
+                 regX, regY, bPts, ePts, folder, rfolder=None, rstep=0, operator=None):
         """
         Constructor.
 
@@ -68,6 +68,9 @@ class eroMesh():
 
         variable: rfolder, rstep
             Restart folder and step.
+
+        variable: operator
+            Regular grid to TIN interpolation operator built on xyTIN (optional).
         """
 
         self.regX = regX
@@ -107,6 +110,11 @@ class eroMesh():
             inTree = cKDTree(xyTIN[bPts:ePts+bPts,:])
             dist, inID = inTree.query(xyTIN[:bPts,:],k=1)
 
+            # Interpolation operator of the inside nodes
+            if operator is None:
+                operator = interpTIN.interpTIN(self.regX, self.regY, xyTIN)
+            inInterp = operator.subset(numpy.arange(bPts, nbPts))
+
             # Loop through the underlying layers
             for l in range(1,self.layNb):
                 # Uniform erodibility value
@@ -114,10 +122,8 @@ class eroMesh():
                     self.Ke[:,l] = eroVal[l-1]
                 # Erodibility map
                 else:
-                    eMap = pandas.read_csv(str(eroMap[l-1]), sep=r'\s+', engine='c',
-                                       header=None, na_filter=False, dtype=numpy.float, low_memory=False)
-                    reMap = numpy.reshape(eMap.values,(len(self.regX), len(self.regY)), order='F')
-                    self.Ke[bPts:,l] = interpolate.interpn( (self.regX, self.regY), reMap, xyTIN[bPts:,:], method='nearest')
+                    eMap = gridFile.read_grid(str(eroMap[l-1]))
+                    self.Ke[bPts:,l] = inInterp.apply(eMap[:,0], method='nearest')
                     # Assign boundary nodes
                     tmpK = self.Ke[bPts:,l]
                     self.Ke[:bPts,l] = tmpK[inID]
@@ -127,10 +133,8 @@ class eroMesh():
                     self.thickness[:,l] = thickVal[l-1]
                 # Thickness map
                 else:
-                    tMap = pandas.read_csv(str(thickMap[l-1]), sep=r'\s+', engine='c',
-                                       header=None, na_filter=False, dtype=numpy.float, low_memory=False)
-                    rtMap = numpy.reshape(tMap.values,(len(self.regX), len(self.regY)), order='F')
-                    self.thickness[bPts:,l] = interpolate.interpn( (self.regX, self.regY), rtMap, xyTIN[bPts:,:], method='linear')
+                    tMap = gridFile.read_grid(str(thickMap[l-1]))
+                    self.thickness[bPts:,l] = inInterp.apply(tMap[:,0])
                     # Assign boundary nodes
                     tmpH = self.thickness[bPts:,l]
                     self.thickness[:bPts,l] = tmpH[inID]
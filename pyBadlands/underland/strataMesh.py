@@ -40,7 +40,7 @@ class strataMesh():
     """
 
     def __init__(self, sdx, bbX, bbY, layNb, xyTIN, folder, h5file,
-                 cumdiff=0, rfolder=None, rstep=0, regionID=0):
+                 cumdiff=0, rfolder=None, rstep=0, regionID=0, dtype=numpy.float64):
         """
         Constructor.
 
@@ -75,6 +75,9 @@ class strataMesh():
 
         variable: regionID
             Stratal domain ID.
+
+        variable: dtype
+            Floating point precision used to store the stratigraphic layers.
         """
 
         # Initialise MPI communications
@@ -130,9 +133,9 @@ class strataMesh():
 
         # Define global stratigraphic dataset
         self.stratIn = numpy.zeros([self.ptsNb],dtype=int)
-        self.stratElev = numpy.zeros([self.ptsNb,layNb])
-        self.stratThick = numpy.zeros([self.ptsNb,layNb])
-        self.stratDepth = numpy.zeros([self.ptsNb,layNb])
+        self.stratElev = numpy.zeros([self.ptsNb,layNb],dtype=dtype)
+        self.stratThick = numpy.zeros([self.ptsNb,layNb],dtype=dtype)
+        self.stratDepth = numpy.zeros([self.ptsNb,layNb],dtype=dtype)
 
         if rstep > 0:
             self.stratDepth[:,:rstlays] = layDepth
@@ -500,8 +503,8 @@ class strataMesh():
         ids = nids[tmpIDs]
         ero = -erosion[ids]
 
-        # Compute cumulative stratal thicknesses
-        cumThick = numpy.cumsum(self.stratThick[ids,self.step::-1],axis=1)[:,::-1]
+        # Compute cumulative stratal thicknesses, in double precision for single precision layers
+        cumThick = numpy.cumsum(self.stratThick[ids,self.step::-1],axis=1,dtype=numpy.float64)[:,::-1]
 
         # Find nodes with no remaining stratigraphic thicknesses
         tmpIDs = numpy.where(ero>=cumThick[:,0])[0]
@@ -550,8 +553,8 @@ class strataMesh():
         if len(tmpIDs) == 0:
             return
 
-        # Compute cumulative stratal thicknesses
-        cumThick = numpy.cumsum(self.stratThick[tmpIDs,self.step::-1],axis=1)[:,::-1]
+        # Compute cumulative stratal thicknesses, in double precision for single precision layers
+        cumThick = numpy.cumsum(self.stratThick[tmpIDs,self.step::-1],axis=1,dtype=numpy.float64)[:,::-1]
 
         # Updata stratal depth
         surf = numpy.array([topsurf[tmpIDs],]*int(self.step+1)).transpose()
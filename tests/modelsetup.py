@@ -0,0 +1,129 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Helpers shared by the tests: a small synthetic DEM, the XmL input files built around it and
+the runs of the model on one or several processors. The MPI launcher is taken from the MPIEXEC
+environment variable (default mpiexec).
+"""
+
+import os
+import sys
+import numpy
+import pytest
+import subprocess
+from distutils.spawn import find_executable
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+XML_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<badlands>
+    <grid><demfile>{dem}</demfile><boundary>slope</boundary><resfactor>1</resfactor>{grid}</grid>
+    <time><start>0.</start><end>{tend}</end><mindt>1.</mindt><display>{tend}</display></time>
+    <sea><position>-50.</position><limit>10.</limit></sea>
+    <precipitation><climates>1</climates><rain><rstart>0.</rstart><rend>{tend}</rend><rval>1.</rval></rain></precipitation>
+    <sp_law><dep>{dep}</dep><fillmax>2.</fillmax><m>0.5</m><n>1.0</n><erodibility>5.e-5</erodibility></sp_law>
+    <creep><caerial>5.e-2</caerial><cmarine>5.e-1</cmarine>{creep}</creep>
+    {extra}
+    <outfolder>{out}</outfolder>
+</badlands>
+"""
+
+def write_dem(filename, nx=41, ny=41, dx=50.):
+    """
+    Write a regular grid DEM made of a ridge sloping towards the sea with some random
+    roughness creating depressions.
+    """
+
+    rs = numpy.random.RandomState(7)
+    x = numpy.arange(nx) * dx
+    y = numpy.arange(ny) * dx
+    X, Y = numpy.meshgrid(x, y)
+    Z = 400. * numpy.exp(-((X - x[-1]/2.)**2) / (0.1 * x[-1]**2)) * (1. - 0.6 * Y / y[-1]) \
+        - 80. * Y / y[-1] + 5. * rs.rand(ny, nx)
+    numpy.savetxt(filename, numpy.column_stack((X.ravel(), Y.ravel(), Z.ravel())), fmt='%.4f')
+
+    return filename
+
+def write_disp(filename, nx=41, ny=41, dx=50.):
+    """
+    Write a 3D displacements map on the synthetic DEM grid shearing the domain along the X
+    axis and uplifting its centre.
+    """
+
+    X, Y = numpy.meshgrid(numpy.arange(nx) * dx, numpy.arange(ny) * dx)
+    xc = 0.5 * (nx - 1) * dx
+    yc = 0.5 * (ny - 1) * dx
+    disp = numpy.column_stack((30. * numpy.sin(numpy.pi * Y.ravel() / (2. * yc)),
+                               numpy.zeros(nx*ny),
+                               20. * numpy.exp(-((X.ravel() - xc)**2 + (Y.ravel() - yc)**2) / 2.e5)))
+    numpy.savetxt(filename, disp, fmt='%.6f')
+
+    return filename
+
+def write_xml(folder, name, tend=5000., dep=1, grid='', creep='', extra=''):
+    """
+    Write an XmL input file using the synthetic DEM of the folder.
+    """
+
+    folder = str(folder)
+    dem = os.path.join(folder, 'dem.csv')
+    if not os.path.isfile(dem):
+        write_dem(dem)
+    filename = os.path.join(folder, name + '.xml')
+    with open(filename, 'w') as f:
+        f.write(XML_TEMPLATE.format(dem=dem, tend=tend, dep=dep, grid=grid, creep=creep,
+                                    extra=extra, out=os.path.join(folder, 'out_' + name)))
+
+    return filename
+
+def run_model(xmlfile, tend):
+    """
+    Run the model on the current processor and return it.
+    """
+
+    from pyBadlands.model import Model
+
+    model = Model()
+    model.load_xml(xmlfile)
+    numpy.random.seed(12345)
+    model.run_to_time(tend)
+
+    return model
+
+def mpi_call(nprocs, script, *args, **kwargs):
+    """
+    Run one of the test scripts on several processors, the number of OpenMP threads of each
+    processor can be given with the threads keyword.
+    """
+
+    launcher = os.environ.get('MPIEXEC', 'mpiexec').split()
+    if find_executable(launcher[0]) is None:
+        pytest.skip('MPI launcher %s not found' % launcher[0])
+
+    # The launcher must not inherit the MPI environment of the test processor
+    env = dict((k, v) for k, v in os.environ.items() if not k.startswith(('OMPI_', 'PMIX_')))
+    if kwargs.get('threads') is not None:
+        env['OMP_NUM_THREADS'] = str(kwargs['threads'])
+
+    subprocess.check_call(launcher + ['-n', str(nprocs), sys.executable,
+                                      os.path.join(TESTS_DIR, script)] + list(args), env=env)
+
+    return
+
+def mpi_run(nprocs, xmlfile, tend, threads=None, fused=True):
+    """
+    Run the model on several processors and return the final elevation. The flow network
+    arrays are reduced one by one with blocking collectives when fused is False.
+    """
+
+    mode = 'fused' if fused else 'blocking'
+    outfile = os.path.splitext(xmlfile)[0] + '_%d_%s_%s.npy' % (nprocs, threads, mode)
+    mpi_call(nprocs, 'mpi_model.py', xmlfile, str(tend), outfile, mode, threads=threads)
+
+    return numpy.load(outfile)
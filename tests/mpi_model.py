@@ -0,0 +1,30 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Run a model under MPI and save the final elevation from the master processor:
+
+    mpiexec -n 2 python mpi_model.py input.xml tEnd elevation.npy [blocking]
+
+The optional blocking argument reduces the flow network arrays one by one with blocking
+collectives instead of the packed non-blocking ones.
+"""
+
+import sys
+import numpy
+from pyBadlands.model import Model
+
+if __name__ == '__main__':
+    model = Model()
+    model.load_xml(sys.argv[1])
+    if len(sys.argv) > 4 and sys.argv[4] == 'blocking':
+        model.flow.fused = False
+    numpy.random.seed(12345)
+    model.run_to_time(float(sys.argv[2]))
+    if model._rank == 0:
+        numpy.save(sys.argv[3], model.elevation)
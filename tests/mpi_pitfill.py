@@ -0,0 +1,45 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Fill rough topographies with the priority-flood algorithm distributed over the partitions and
+on the entire TIN, the master processor saves both filled surfaces:
+
+    mpiexec -n 3 python mpi_pitfill.py input.xml fillmax sea allFill filled.npy
+"""
+
+import sys
+import numpy
+from pyBadlands.model import Model
+from pyBadlands.surface import elevationTIN
+
+if __name__ == '__main__':
+    model = Model()
+    model.load_xml(sys.argv[1])
+    fillmax = float(sys.argv[2])
+    sea = float(sys.argv[3])
+    allFill = int(sys.argv[4])
+
+    FVmesh = model.FVmesh
+    rs = numpy.random.RandomState(3)
+    filled = []
+    for k in range(5):
+        elev = model.elevation + 20. * rs.rand(len(model.elevation))
+
+        elevationTIN.assign_parameter_pit(FVmesh.ngbOffsets, FVmesh.neighbours,
+                                          model.recGrid.boundsPt, fillmax)
+        sendIDs, recvIDs = elevationTIN.assign_partition_pit(FVmesh.ngbOffsets,
+                                                             FVmesh.neighbours, FVmesh.partIDs)
+        filled.append(elevationTIN.pit_parallel_flood(elev, sea, allFill, sendIDs, recvIDs))
+
+        elevationTIN.assign_parameter_pit(FVmesh.ngbOffsets, FVmesh.neighbours,
+                                          model.recGrid.boundsPt, fillmax)
+        filled.append(elevationTIN.pit_priority_flood(elev, sea, allFill))
+
+    if model._rank == 0:
+        numpy.save(sys.argv[5], numpy.array(filled))
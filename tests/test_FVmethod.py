@@ -0,0 +1,86 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Tests of the Finite Volume discretisation.
+"""
+
+import numpy
+import pytest
+from modelsetup import write_xml
+from pyBadlands.model import Model
+from pyBadlands.surface import FVmethod
+
+@pytest.fixture(scope='module')
+def model(tmpdir_factory):
+    """
+    Model built on the synthetic DEM.
+    """
+
+    model = Model()
+    model.load_xml(write_xml(tmpdir_factory.mktemp('fv'), 'fv'))
+
+    return model
+
+@pytest.fixture(scope='module')
+def padded(model):
+    """
+    Padded (nodes, maxNgbh) neighbourhood arrays of the Finite Volume frame, ordered by global
+    node ID as they were stored before the compressed sparse row form.
+    """
+
+    tMesh = model.tMesh
+    ref = FVmethod.FVmethod(tMesh.node_coords, tMesh.cells, tMesh.edges)
+    ref.localIDs = numpy.where(numpy.in1d(model.lGIDs, model.inGIDs))[0]
+    ref._FV_utils(model.lGIDs)
+
+    gids = model.lGIDs[ref.localIDs]
+    shape = (model.totPts, ref.maxNgbh)
+    neighbours = -numpy.ones(shape, dtype=numpy.int32)
+    edges = numpy.zeros(shape)
+    vors = numpy.zeros(shape)
+    neighbours[gids] = ref.neighbours[ref.localIDs,:ref.maxNgbh]
+    edges[gids] = ref.edge_length[ref.localIDs,:ref.maxNgbh].astype(numpy.float32)
+    vors[gids] = ref.vor_edges[ref.localIDs,:ref.maxNgbh].astype(numpy.float32)
+
+    maxdist = numpy.sqrt(2.*(model.recGrid.resEdges*model.input.Afactor)**2)
+    edges[edges > 2.*maxdist] = maxdist
+
+    return neighbours, edges, vors
+
+def test_csr_matches_padded_arrays(model, padded):
+    """
+    The neighbours, edges and voronoi edges lengths of each node are the same in the compressed
+    sparse row topology and in the padded arrays.
+    """
+
+    neighbours, edges, vors = padded
+    mask = neighbours >= 0
+    FVmesh = model.FVmesh
+
+    assert numpy.array_equal(numpy.diff(FVmesh.ngbOffsets), mask.sum(axis=1))
+    assert numpy.isfinite(FVmesh.edge_length).all() and (FVmesh.edge_length >= 0.).all()
+    assert numpy.array_equal(FVmesh.neighbours, neighbours[mask])
+    assert numpy.array_equal(FVmesh.edge_length, edges[mask])
+    assert numpy.array_equal(FVmesh.vor_edges, vors[mask])
+
+def test_topology_of_shuffled_partitions(model, padded):
+    """
+    Neighbourhoods gathered from the processors in any node order are sorted by global node ID.
+    """
+
+    neighbours, edges, vors = padded
+    mask = neighbours >= 0
+    rs = numpy.random.RandomState(5)
+    gids = rs.permutation(model.totPts)
+
+    ngbOffsets, order = model.FVmesh._build_topology(gids, mask[gids].sum(axis=1), model.totPts)
+
+    assert numpy.array_equal(ngbOffsets, model.FVmesh.ngbOffsets)
+    assert numpy.array_equal(neighbours[gids][mask[gids]][order], model.FVmesh.neighbours)
+    assert numpy.array_equal(vors[gids][mask[gids]][order], model.FVmesh.vor_edges)
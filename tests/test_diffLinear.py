@@ -0,0 +1,121 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Tests of the linear hillslope diffusion solvers.
+"""
+
+import numpy
+import pytest
+from modelsetup import write_xml
+from pyBadlands.model import Model
+
+@pytest.fixture(scope='module')
+def model(tmpdir_factory):
+    """
+    Model built on the synthetic DEM with the implicit linear diffusion solver.
+    """
+
+    model = Model()
+    model.load_xml(write_xml(tmpdir_factory.mktemp('creep'), 'creep',
+                             creep='<implicit>1</implicit>'))
+
+    return model
+
+@pytest.fixture(scope='module')
+def subcycle(tmpdir_factory):
+    """
+    Model built on the synthetic DEM with the sub-cycled linear diffusion.
+    """
+
+    model = Model()
+    model.load_xml(write_xml(tmpdir_factory.mktemp('creep'), 'subcycle',
+                             creep='<subcycle>1</subcycle>'))
+
+    return model
+
+def explicit_step(model, elev, sea, dt):
+    """
+    Elevation change of the explicit linear diffusion over a time step: diffusion flux of the
+    flow network on the aerial and marine nodes, border nodes keep their elevations.
+    """
+
+    FVmesh = model.FVmesh
+    model.flow.sfdInputs = None
+    model.flow.SFD_receivers(elev, elev, FVmesh.ngbOffsets, FVmesh.neighbours, FVmesh.vor_edges,
+                             FVmesh.edge_length, model.lGIDs, sea)
+    model.flow.complete_network()
+    rate = model.hillslope.sedflux(model.flow.diff_flux, sea, elev, FVmesh.control_volumes)
+
+    xy = FVmesh.node_coords[:,:2]
+    border = (xy[:,0] < model.recGrid.regX.min()) | (xy[:,1] < model.recGrid.regY.min()) | \
+        (xy[:,0] > model.recGrid.regX.max()) | (xy[:,1] > model.recGrid.regY.max())
+    rate[border] = 0.
+
+    return rate * dt
+
+def test_implicit_matches_explicit(model):
+    """
+    At a fraction of the explicit stability time step the backward Euler scheme gives the same
+    elevation change as the explicit scheme, over aerial and marine nodes.
+    """
+
+    hillslope = model.hillslope
+    hillslope.dt_stability(model.FVmesh.edge_length)
+    dt = 1.e-3 * hillslope.CFL
+    elev = model.elevation.copy()
+    assert (elev < -50.).any() and (elev > -50.).any()
+
+    for k in range(3):
+        explicit = explicit_step(model, elev, -50., dt)
+        implicit = hillslope.implicit_diffusion(elev, -50., dt)
+        assert numpy.abs(explicit).max() > 0.
+        assert numpy.abs(implicit - explicit).max() < 1.e-3 * numpy.abs(explicit).max()
+        elev = elev + implicit
+
+@pytest.mark.parametrize('scale', [1., 1.05, 3.])
+def test_implicit_conserves_mass(model, scale):
+    """
+    Far from the borders and for a single diffusion coefficient the implicit scheme conserves
+    the sediment volume at large time steps, for a reused, preconditioning or new factorisation.
+    """
+
+    hillslope = model.hillslope
+    xy = model.FVmesh.node_coords[:,:2]
+    centre = 0.5 * (xy.min(axis=0) + xy.max(axis=0))
+    elev = 100. * numpy.exp(-((xy - centre)**2).sum(axis=1) / 1.e4)
+    area = model.FVmesh.control_volumes
+
+    hillslope.implicit_diffusion(elev, -1.e4, 2000.)
+    dh = hillslope.implicit_diffusion(elev, -1.e4, 2000. * scale)
+    assert numpy.abs(dh).max() > 1.
+    assert abs((area * dh).sum()) < 1.e-7 * (area * numpy.abs(dh)).sum()
+    assert hillslope._dt == (2000. if scale < 1.1 else 2000. * scale)
+
+def test_subcycle_matches_explicit(subcycle):
+    """
+    A fluvial time step made of a single sub-cycle at the explicit stability time step gives
+    the same elevations, bit for bit, as the explicit diffusion step. Longer time steps chain
+    the explicit steps.
+    """
+
+    hillslope = subcycle.hillslope
+    hillslope.dt_stability(subcycle.FVmesh.edge_length)
+    elev = subcycle.elevation.copy()
+    for k in range(3):
+        dh = hillslope.sub_cycling(elev, -50., subcycle.FVmesh.control_volumes, hillslope.CFL)
+        explicit = elev + explicit_step(subcycle, elev, -50., hillslope.CFL)
+        elev = elev + dh
+        assert numpy.array_equal(elev, explicit)
+
+    dt = 2.5 * hillslope.CFL
+    dh = hillslope.sub_cycling(elev, -50., subcycle.FVmesh.control_volumes, dt)
+    chained = elev.copy()
+    for subdt in [hillslope.CFL, hillslope.CFL, dt - 2. * hillslope.CFL]:
+        chained += explicit_step(subcycle, chained, -50., subdt)
+    assert numpy.array_equal(elev + dh, chained)
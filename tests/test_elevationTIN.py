@@ -0,0 +1,108 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Tests of the depression filling algorithms.
+"""
+
+import os
+import numpy
+import pytest
+from modelsetup import write_xml, mpi_call
+from pyBadlands.model import Model
+from pyBadlands.surface import elevationTIN
+
+@pytest.fixture(scope='module')
+def model(tmpdir_factory):
+    """
+    Model built on the synthetic DEM, only its TIN and Finite Volume mesh are used.
+    """
+
+    model = Model()
+    model.load_xml(write_xml(tmpdir_factory.mktemp('pit'), 'pit'))
+
+    return model
+
+@pytest.mark.parametrize('fillmax', [2., 1000.])
+@pytest.mark.parametrize('sea', [-60., 50.])
+@pytest.mark.parametrize('allFill', [0, 1])
+def test_priority_flood_matches_planchon(model, fillmax, sea, allFill):
+    """
+    The priority-flood and the Planchon & Darboux algorithms fill the same surface, bit for bit,
+    on rough topographies with many depressions.
+    """
+
+    elevationTIN.assign_parameter_pit(model.FVmesh.ngbOffsets, model.FVmesh.neighbours,
+                                      model.recGrid.boundsPt, fillmax)
+    rs = numpy.random.RandomState(3)
+    for k in range(5):
+        elev = model.elevation + 20. * rs.rand(len(model.elevation))
+        planchon = elevationTIN.pit_stack_PD(elev, sea, allFill)
+        priority = elevationTIN.pit_priority_flood(elev, sea, allFill)
+        assert (planchon > elev).any()
+        assert numpy.array_equal(planchon, priority)
+
+@pytest.mark.parametrize('fillmax, sea, allFill', [(2., -60., 0), (2., 50., 0), (1000., 50., 1)])
+def test_parallel_flood_matches_serial(tmpdir, fillmax, sea, allFill):
+    """
+    The priority-flood distributed over three partitions fills the same surface, bit for bit,
+    as the filling of the entire TIN.
+    """
+
+    xmlfile = write_xml(tmpdir, 'pit', grid='<pitfill>priority</pitfill>')
+    outfile = os.path.join(str(tmpdir), 'filled.npy')
+    mpi_call(3, 'mpi_pitfill.py', xmlfile, str(fillmax), str(sea), str(allFill), outfile)
+
+    filled = numpy.load(outfile)
+    for k in range(0, len(filled), 2):
+        assert numpy.array_equal(filled[k], filled[k+1])
+
+@pytest.mark.parametrize('fillmax, sea, allFill', [(2., -60., 0), (2., 50., 0), (1000., 50., 1)])
+def test_update_matches_priority_flood(model, fillmax, sea, allFill):
+    """
+    Without tolerance the incremental update of the surface over several steps of erosion and
+    deposition fills the same surface, bit for bit, as the complete priority-flood.
+    """
+
+    elevationTIN.assign_parameter_pit(model.FVmesh.ngbOffsets, model.FVmesh.neighbours,
+                                      model.recGrid.boundsPt, fillmax)
+    rs = numpy.random.RandomState(7)
+    elev = model.elevation + 20. * rs.rand(len(model.elevation))
+    steps = []
+    for k in range(6):
+        moved = rs.rand(len(elev)) < 0.05
+        elev = elev + moved * 10. * (rs.rand(len(elev)) - 0.5)
+        level = sea + 0.5 * k
+        steps.append((elev, level, elevationTIN.pit_update(elev, level, allFill, 0., 100, 10.)))
+
+    for elev, level, updated in steps:
+        assert numpy.array_equal(updated, elevationTIN.pit_priority_flood(elev, level, allFill))
+
+def test_update_refill(model):
+    """
+    The nodes which moved by less than the tolerance keep the surface of the previous step until
+    the refilling period or the sea-level variation force a complete filling.
+    """
+
+    elevationTIN.assign_parameter_pit(model.FVmesh.ngbOffsets, model.FVmesh.neighbours,
+                                      model.recGrid.boundsPt, 2.)
+    rs = numpy.random.RandomState(8)
+    elevs = [model.elevation + 20. * rs.rand(len(model.elevation)) for k in range(4)]
+    updated = [elevationTIN.pit_update(elev, -500., 0, 1000., 2, 10.) for elev in elevs]
+    updated.append(elevationTIN.pit_update(elevs[0], -480., 0, 1000., 2, 10.))
+    filled = [elevationTIN.pit_priority_flood(elev, -500., 0) for elev in elevs]
+    filled.append(elevationTIN.pit_priority_flood(elevs[0], -480., 0))
+
+    assert numpy.array_equal(updated[0], filled[0])
+    for k in [1, 2]:
+        assert not numpy.array_equal(updated[k], filled[k])
+        flooded = updated[k-1] > elevs[k-1]
+        kept = numpy.where(flooded, numpy.maximum(updated[k-1], elevs[k]), elevs[k])
+        assert numpy.array_equal(updated[k], kept)
+    assert numpy.array_equal(updated[3], filled[3])
+    assert numpy.array_equal(updated[4], filled[4])
@@ -0,0 +1,138 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Tests of the flow network computation.
+"""
+
+import copy
+import numpy
+import pytest
+from scipy.spatial import cKDTree
+from scipy.interpolate import RegularGridInterpolator
+from scipy.ndimage.filters import gaussian_filter
+from modelsetup import write_xml, mpi_run
+from pyBadlands.model import Model
+from pyBadlands.flow.flowNetwork import flowNetwork
+
+@pytest.mark.parametrize('dep, creep', [(1, ''), (0, ''), (1, '<cslp>1.25</cslp>')])
+def test_owned_network_matches_reduction(tmpdir, dep, creep):
+    """
+    The flow network gathered from the nodes owned by each processor gives the same
+    topography, bit for bit, as the network reduced over the entire TIN.
+    """
+
+    reduced = write_xml(tmpdir, 'reduced', dep=dep, creep=creep)
+    owned = write_xml(tmpdir, 'owned', dep=dep, creep=creep,
+                      extra='<parallel><gather>1</gather></parallel>')
+
+    assert numpy.array_equal(mpi_run(2, reduced, 5000.), mpi_run(2, owned, 5000.))
+
+@pytest.mark.parametrize('dep, creep, extra', [(1, '', ''), (0, '', ''),
+                                               (1, '<cslp>1.25</cslp>', ''),
+                                               (1, '', '<parallel><gather>1</gather></parallel>')])
+def test_fused_reductions_match_blocking(tmpdir, dep, creep, extra):
+    """
+    The flow network arrays packed in non-blocking reductions give the same topography, bit
+    for bit, as the arrays reduced one by one with blocking reductions.
+    """
+
+    xmlfile = write_xml(tmpdir, 'fused', dep=dep, creep=creep, extra=extra)
+
+    assert numpy.array_equal(mpi_run(2, xmlfile, 5000.), mpi_run(2, xmlfile, 5000., fused=False))
+
+@pytest.mark.parametrize('dep', [1, 0])
+def test_network_independent_of_threads(tmpdir, dep):
+    """
+    The drainage basins processed concurrently give the same topography, bit for bit, whatever
+    the number of OpenMP threads.
+    """
+
+    xmlfile = write_xml(tmpdir, 'threads', dep=dep)
+
+    assert numpy.array_equal(mpi_run(2, xmlfile, 5000., threads=1),
+                             mpi_run(2, xmlfile, 5000., threads=4))
+
+@pytest.mark.parametrize('dep', [1, 0])
+def test_incremental_receivers_match_full(tmpdir, dep):
+    """
+    The flow directions updated on the nodes whose neighbourhood or sea level position have
+    changed are the same, bit for bit, as the ones computed on all the nodes.
+    """
+
+    model = Model()
+    model.load_xml(write_xml(tmpdir, 'sfd', dep=dep))
+    FVmesh = model.FVmesh
+    flow = model.flow
+    flow.sfdRatio = 1.
+    args = (FVmesh.ngbOffsets, FVmesh.neighbours, FVmesh.vor_edges, FVmesh.edge_length,
+            model.lGIDs)
+
+    rs = numpy.random.RandomState(11)
+    elev = model.elevation.copy()
+    for sea in [-50., -50., -20., 10., 5.]:
+        moved = rs.rand(len(elev)) < 0.02
+        elev[moved] += 5. * rs.randn(moved.sum())
+        fillH = elev + (rs.rand(len(elev)) < 0.02)
+        flow.SFD_receivers(fillH, elev, *(args + (sea,)))
+
+        full = copy.copy(flow)
+        full.sfdInputs = None
+        full.SFD_receivers(fillH, elev, *(args + (sea,)))
+
+        for incr, ref in zip(flow.sfdOutputs, full.sfdOutputs):
+            numpy.testing.assert_array_equal(incr, ref)
+
+def baseline_filter(xycoords, diff, dsmooth, esmooth):
+    """
+    Gaussian filter computed by querying the 3 closest TIN nodes of each grid point and
+    interpolating the smoothed grids back on the TIN, as done before the operators were cached.
+    """
+
+    dx = xycoords[1,0] - xycoords[0,0]
+    xgrid = numpy.arange(xycoords[:,0].min(), xycoords[:,0].max()+dx, dx)
+    ygrid = numpy.arange(xycoords[:,1].min(), xycoords[:,1].max()+dx, dx)
+    xi, yi = numpy.meshgrid(xgrid, ygrid)
+    distances, indices = cKDTree(xycoords).query(numpy.column_stack((xi.ravel(), yi.ravel())), k=3)
+    onIDs = numpy.where(distances[:,0] == 0)[0]
+
+    smooth = numpy.zeros(len(xycoords))
+    for values, sigma in [(diff.clip(0.), dsmooth), (diff.clip(max=0.), esmooth)]:
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            zi = numpy.average(values[indices], weights=(1./distances), axis=1)
+        zi[onIDs] = values[indices[onIDs,0]]
+        grid = gaussian_filter(numpy.reshape(zi, (len(ygrid), len(xgrid))), sigma=sigma)
+        smooth += RegularGridInterpolator((ygrid, xgrid), grid)((xycoords[:,1], xycoords[:,0]))
+
+    return smooth
+
+@pytest.mark.parametrize('duplicates', [0, 20])
+def test_filter_operators_match_baseline(duplicates):
+    """
+    The cached interpolation operators of the gaussian filter give the same smoothed erosion and
+    deposition as the interpolations they replace, including on grid points lying on duplicated
+    TIN nodes.
+    """
+
+    rs = numpy.random.RandomState(6)
+    X, Y = numpy.meshgrid(numpy.arange(0., 2000., 50.), numpy.arange(0., 1500., 50.))
+    xycoords = numpy.column_stack((X.ravel(), Y.ravel()))
+    xycoords[2:-1:3] += rs.uniform(-20., 20., xycoords[2:-1:3].shape)
+    xycoords = numpy.vstack((xycoords, xycoords[rs.permutation(len(xycoords))[:duplicates]]))
+
+    flow = flowNetwork()
+    flow.xycoords = xycoords
+    flow.dsmooth = 2.
+    flow.esmooth = 1.5
+    diff = rs.uniform(-5., 5., len(xycoords))
+    for k in range(2):
+        smooth = flow.gaussian_filter(diff)
+        assert numpy.isfinite(smooth).all()
+        assert numpy.allclose(smooth, baseline_filter(xycoords, diff, 2., 1.5), rtol=1.e-12,
+                              atol=1.e-12)
+        diff = numpy.roll(diff, 7)
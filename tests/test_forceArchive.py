@@ -0,0 +1,52 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Tests of the forcing archive.
+"""
+
+import os
+import h5py
+import numpy
+import pytest
+from pyBadlands.forcing import forceArchive
+
+@pytest.fixture
+def archive(tmpdir, monkeypatch):
+    """
+    Archive holding two rain maps of two columns on a TIN of 1000 nodes stored by chunks of
+    100 nodes.
+    """
+
+    monkeypatch.setattr(forceArchive, 'CHUNK_NODES', 100)
+    rs = numpy.random.RandomState(2)
+    maps = [rs.rand(2, 1000) for k in range(2)]
+    rtimes = numpy.array([[0., 1.], [1., 2.]])
+    dtimes = numpy.zeros((0, 2))
+
+    filename = os.path.join(str(tmpdir), 'archive.h5')
+    with h5py.File(filename, 'w') as f:
+        for kind, times in [('rain', rtimes), ('disp', dtimes)]:
+            group = f.create_group(kind)
+            group.create_dataset('time', data=times)
+            group.create_dataset('index', data=numpy.arange(len(times), dtype=numpy.int32))
+        forceArchive._write_stack(f['rain'], 'tin', maps, 2)
+
+    return forceArchive.forceArchive(filename, rtimes, ['r0', 'r1'], dtimes, None), maps
+
+@pytest.mark.parametrize('nodes', [[5], [7, 3, 950, 951, 420, 99, 100], range(1000)[::-1], []])
+def test_read_tin_by_chunks(archive, nodes):
+    """
+    The nodes read from the chunks of the stack are the ones of the map, in the order they were
+    requested.
+    """
+
+    archive, maps = archive
+    ids = numpy.array(nodes, dtype=int)
+    for event in range(2):
+        assert numpy.array_equal(archive.read_tin('rain', event, ids), maps[event][:,ids].T)
@@ -0,0 +1,147 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Tests of the background loading of the forcing maps.
+"""
+
+import os
+import numpy
+import pytest
+from modelsetup import write_xml, write_disp, run_model
+from pyBadlands.forcing import forceSim, forcePrefetch
+
+PRECIPITATION = """<precipitation><climates>3</climates>
+    <rain><rstart>0.</rstart><rend>1000.</rend><map>{0}</map></rain>
+    <rain><rstart>1000.</rstart><rend>2000.</rend><map>{1}</map></rain>
+    <rain><rstart>2000.</rstart><rend>3000.</rend><map>{2}</map></rain></precipitation>"""
+
+TECTONIC = """<tectonic><disp3d>1</disp3d><merge3d>20.</merge3d><time3d>500.</time3d><events>2</events>
+    <disp><dstart>0.</dstart><dend>1000.</dend><dfile>{0}</dfile></disp>
+    <disp><dstart>1000.</dstart><dend>2000.</dend><dfile>{0}</dfile></disp></tectonic>
+    <parallel><prefetch>{1}</prefetch></parallel>"""
+
+def write_rain(folder, nb, nx=41, ny=41):
+    """
+    Write the rain maps of the events on a regular grid.
+    """
+
+    rs = numpy.random.RandomState(6)
+    maps = []
+    for k in range(nb):
+        filename = os.path.join(str(folder), 'rain%d.csv' % k)
+        numpy.savetxt(filename, 0.5 + rs.rand(nx*ny), fmt='%.6f')
+        maps.append(filename)
+
+    return maps
+
+def build_force(folder, prefetch, nb=4):
+    """
+    Forcing with one rain map per event on a 21 x 21 regular grid.
+    """
+
+    maps = numpy.array(write_rain(folder, nb, 21, 21), dtype=object)
+    times = numpy.column_stack((numpy.arange(nb), numpy.arange(1, nb+1))).astype(float)
+    regX = numpy.linspace(0., 1000., 21)
+    regY = numpy.linspace(0., 1000., 21)
+
+    return forceSim.forceSim(MapRain=maps, TimeRain=times, ValRain=numpy.zeros(nb),
+                             orographic=numpy.zeros(nb, dtype=bool), regX=regX, regY=regY,
+                             prefetch=prefetch)
+
+def random_tin(seed):
+    """
+    Nodes located randomly inside the regular grid.
+    """
+
+    return numpy.random.RandomState(seed).uniform(0., 1000., (300, 2))
+
+def test_release_past_maps(tmpdir):
+    """
+    Only the map of the current event and the maps of the next events are held.
+    """
+
+    force = build_force(tmpdir, 2)
+    force.update_force_TIN(random_tin(1))
+    ids = numpy.arange(0, 300, 2)
+
+    held = [[0, 1, 2], [1, 2, 3], [2, 3], [3]]
+    for event in range(4):
+        force.get_Rain(event + 0.5, None, ids)
+        assert sorted(k[1] for k in force.prefetch.entries) == held[event]
+
+def test_maps_interpolated_on_new_tin(tmpdir):
+    """
+    The maps held before the TIN is rebuilt by 3D displacements are interpolated again on
+    the new TIN, bit for bit, as the maps loaded when their events start.
+    """
+
+    prefetched = build_force(tmpdir, 1)
+    direct = build_force(tmpdir, 0)
+    assert direct.prefetch is None
+
+    ids = numpy.arange(0, 300, 3)
+    prefetched.update_force_TIN(random_tin(1))
+    prefetched.get_Rain(0.5, None, ids)
+    old = prefetched.interp
+    assert prefetched.prefetch.get(('rain', 1))['interp'] is old
+
+    for seed, time in [(2, 0.5), (3, 1.5), (4, 1.5)]:
+        ids = numpy.arange(0, 300, seed)
+        prefetched.update_force_TIN(random_tin(seed))
+        direct.update_force_TIN(random_tin(seed))
+        assert numpy.array_equal(prefetched.get_Rain(time, None, ids),
+                                 direct.get_Rain(time, None, ids))
+        held = prefetched.prefetch.get(('rain', int(time)))
+        assert held['interp'] is prefetched.interp and held['ids'] is ids
+
+def test_loading_error_raised():
+    """
+    The error raised when a map is loaded on the background thread is raised again when the
+    map is requested.
+    """
+
+    def fail():
+        raise IOError('Missing map')
+
+    prefetch = forcePrefetch.forcePrefetch(1)
+    prefetch.schedule(('rain', 1), fail)
+    prefetch.schedule(('rain', 2), lambda: 'map')
+    with pytest.raises(IOError):
+        prefetch.get(('rain', 1))
+    assert prefetch.get(('rain', 2)) == 'map'
+    assert prefetch.get(('rain', 3)) is None
+
+@pytest.mark.parametrize('ahead', [1, 3])
+def test_prefetch_matches_direct_loading(tmpdir, ahead):
+    """
+    A simulation with rain map events and 3D displacements remeshing the TIN gives the same
+    topography, bit for bit, with and without the maps loaded ahead.
+    """
+
+    tend = 3000.
+    dfile = write_disp(os.path.join(str(tmpdir), 'disp.csv'))
+    precip = PRECIPITATION.format(*write_rain(tmpdir, 3))
+
+    models = []
+    for prefetch in [0, ahead]:
+        xmlfile = write_xml(tmpdir, 'prefetch%d' % prefetch, tend=tend,
+                            extra=TECTONIC.format(dfile, prefetch))
+        with open(xmlfile, 'r') as f:
+            xml = f.read()
+        start = xml.index('<precipitation>')
+        end = xml.index('</precipitation>') + len('</precipitation>')
+        with open(xmlfile, 'w') as f:
+            f.write(xml[:start] + precip + xml[end:])
+        models.append(run_model(xmlfile, tend))
+
+    assert models[0].force.prefetch is None and models[1].force.prefetch is not None
+    assert len(models[0].elevation) != 41*41
+    assert numpy.array_equal(models[0].FVmesh.node_coords, models[1].FVmesh.node_coords)
+    assert numpy.array_equal(models[0].elevation, models[1].elevation)
+    assert numpy.array_equal(models[0].rain, models[1].rain)
@@ -0,0 +1,102 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Tests of the ASCII and binary regular grid files.
+"""
+
+import os
+import h5py
+import numpy
+import pytest
+from modelsetup import write_dem, write_xml
+from pyBadlands.model import Model
+from pyBadlands.surface import gridFile
+
+@pytest.fixture
+def ascii(tmpdir):
+    """
+    Synthetic DEM and a one column rain map defined on its grid, both in ASCII format.
+    """
+
+    dem = write_dem(os.path.join(str(tmpdir), 'dem.csv'))
+    rain = os.path.join(str(tmpdir), 'rain.csv')
+    numpy.savetxt(rain, numpy.random.RandomState(3).rand(41*41), fmt='%.6f')
+
+    return dem, rain
+
+@pytest.mark.parametrize('fmt', ['npy', 'h5'])
+def test_binary_round_trip(ascii, fmt):
+    """
+    The converted DEM and forcing maps are memory mapped and read back, bit for bit, as the
+    ASCII grids. HDF5 files record the regular grid dimensions.
+    """
+
+    dem, rain = ascii
+    gridFile.main(['--format', fmt, '--dem', dem, dem, rain])
+
+    for name in [dem, rain]:
+        binary = os.path.splitext(name)[0] + '.' + fmt
+        assert gridFile.is_binary(binary) and not gridFile.is_binary(name)
+        data = gridFile.read_grid(binary)
+        assert isinstance(data, numpy.memmap)
+        assert numpy.array_equal(data, gridFile.read_grid(name))
+        if fmt == 'h5':
+            with h5py.File(binary, 'r') as f:
+                assert (f['grid'].attrs['nx'], f['grid'].attrs['ny']) == (41, 41)
+
+    assert gridFile.read_grid(os.path.splitext(rain)[0] + '.' + fmt).shape == (41*41, 1)
+
+def test_hdf5_not_contiguous(tmpdir):
+    """
+    Chunked and compressed HDF5 grids are loaded in memory.
+    """
+
+    data = numpy.random.RandomState(5).rand(100, 3)
+    filename = os.path.join(str(tmpdir), 'grid.h5')
+    with h5py.File(filename, 'w') as f:
+        f.create_dataset('grid', data=data, compression='gzip')
+
+    grid = gridFile.read_grid(filename)
+    assert not isinstance(grid, numpy.memmap)
+    assert numpy.array_equal(grid, data)
+
+def test_hdf5_header_mismatch(tmpdir):
+    """
+    HDF5 grids whose dimensions do not match their size are rejected.
+    """
+
+    filename = os.path.join(str(tmpdir), 'grid.h5')
+    gridFile.write_grid(filename, numpy.zeros((100, 3)), nx=10, ny=11)
+
+    with pytest.raises(ValueError):
+        gridFile.read_grid(filename)
+
+def test_model_from_binary_dem(tmpdir):
+    """
+    A model built from the binary DEM has the same TIN elevations as the one built from the
+    ASCII DEM.
+    """
+
+    xmlfile = write_xml(tmpdir, 'grid')
+    dem = os.path.join(str(tmpdir), 'dem.csv')
+    gridFile.convert_grid(dem, os.path.join(str(tmpdir), 'dem.npy'))
+    binfile = os.path.join(str(tmpdir), 'grid_npy.xml')
+    with open(xmlfile, 'r') as f:
+        xml = f.read().replace('dem.csv', 'dem.npy')
+    with open(binfile, 'w') as f:
+        f.write(xml)
+
+    models = []
+    for filename in [xmlfile, binfile]:
+        model = Model()
+        model.load_xml(filename)
+        models.append(model)
+
+    assert numpy.array_equal(models[0].recGrid.regZ, models[1].recGrid.regZ)
+    assert numpy.array_equal(models[0].elevation, models[1].elevation)
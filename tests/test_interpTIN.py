@@ -0,0 +1,74 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Tests of the regular grid to TIN interpolation operator.
+"""
+
+import numpy
+import pytest
+from scipy.interpolate import interpn
+from pyBadlands.surface import interpTIN
+
+@pytest.fixture(scope='module')
+def grid():
+    """
+    Regular grid of 41 x 31 nodes with points located randomly inside it, on its nodes, in the
+    middle of its cells and on its borders.
+    """
+
+    regX = numpy.linspace(0., 2000., 41)
+    regY = numpy.linspace(-500., 1000., 31)
+    rs = numpy.random.RandomState(9)
+    XY = numpy.column_stack((rs.uniform(regX[0], regX[-1], 500),
+                             rs.uniform(regY[0], regY[-1], 500)))
+    X, Y = numpy.meshgrid(regX[::4], regY[::3])
+    nodes = numpy.column_stack((X.ravel(), Y.ravel()))
+    X, Y = numpy.meshgrid(regX[1:-1:4], regY[1:-1:3])
+    middle = numpy.column_stack((X.ravel(), Y.ravel())) + 0.5 * (regX[1] - regX[0])
+    borders = numpy.array([[regX[0], 100.], [regX[-1], 100.], [700., regY[0]], [700., regY[-1]],
+                           [regX[-1], regY[-1]]])
+
+    return regX, regY, numpy.vstack((XY, nodes, middle, borders))
+
+@pytest.mark.parametrize('method', ['linear', 'nearest'])
+@pytest.mark.parametrize('ncols', [0, 3])
+def test_matches_interpn(grid, method, ncols):
+    """
+    The interpolated values are the same, bit for bit, as the ones of SciPy interpn function for
+    maps with one or several columns, on all the points and on a subset of them.
+    """
+
+    regX, regY, XY = grid
+    rs = numpy.random.RandomState(4)
+    shape = (len(regX) * len(regY),) if ncols == 0 else (len(regX) * len(regY), ncols)
+    data = 100. * rs.rand(*shape)
+
+    # Grid files are ordered by row from SW to NE corner
+    cube = data.reshape((len(regY), len(regX)) + shape[1:]).swapaxes(0, 1)
+    ref = interpn((regX, regY), cube, XY, method=method)
+
+    interp = interpTIN.interpTIN(regX, regY, XY)
+    assert numpy.array_equal(interp.apply(data, method=method), ref)
+
+    ids = rs.permutation(len(XY))[:200]
+    assert numpy.array_equal(interp.apply(data, ids, method=method), ref[ids])
+    assert numpy.array_equal(interp.subset(ids).apply(data, method=method), ref[ids])
+
+def test_outside_points(grid):
+    """
+    Points outside of the regular grid are rejected as with SciPy interpn function.
+    """
+
+    regX, regY, XY = grid
+    interp = interpTIN.interpTIN(regX, regY, numpy.vstack((XY, [[regX[-1] + 1., 0.]])))
+    data = numpy.zeros(len(regX) * len(regY))
+
+    with pytest.raises(ValueError):
+        interp.apply(data)
+    assert numpy.array_equal(interp.apply(data, numpy.arange(len(XY))), numpy.zeros(len(XY)))
@@ -0,0 +1,97 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Tests of the mesh cache.
+"""
+
+import os
+import glob
+import numpy
+import pytest
+from modelsetup import write_xml
+from pyBadlands.model import Model
+from pyBadlands.surface import meshCache
+
+def build_model(folder):
+    """
+    Model built on the synthetic DEM with the mesh cache stored in the folder.
+    """
+
+    cache = os.path.join(str(folder), 'cache')
+    model = Model()
+    model.load_xml(write_xml(folder, 'cache', grid='<meshcache>%s</meshcache>' % cache))
+
+    return model
+
+def open_cache(model):
+    """
+    Cache entry matching the model DEM and TIN parameters.
+    """
+
+    return meshCache.meshCache(model.input.meshcache, model.input.demfile, model.input.Afactor,
+                               model.input.reorder)
+
+def assert_same_mesh(built, loaded):
+    """
+    Check that two models have the same TIN, partitioning and Finite Volume mesh.
+    """
+
+    for name in ['ngbOffsets', 'neighbours', 'edge_length', 'vor_edges', 'control_volumes',
+                 'partIDs']:
+        assert numpy.array_equal(getattr(built.FVmesh, name), getattr(loaded.FVmesh, name))
+    for name in ['vertices', 'triangles', 'edges']:
+        assert numpy.array_equal(built.recGrid.tinMesh[name], loaded.recGrid.tinMesh[name])
+    for name in meshCache.GRID_SCALARS:
+        assert getattr(built.recGrid, name) == getattr(loaded.recGrid, name)
+    assert numpy.array_equal(built.lGIDs, loaded.lGIDs)
+    assert numpy.array_equal(built.elevation, loaded.elevation)
+
+def test_cache_round_trip(tmpdir):
+    """
+    A simulation sharing the DEM of a previous one maps the cached mesh, which is identical to
+    the mesh built from the DEM.
+    """
+
+    built = build_model(tmpdir)
+    entries = glob.glob(os.path.join(built.input.meshcache, '*'))
+    assert entries == [open_cache(built).path]
+    assert os.path.isfile(os.path.join(entries[0], 'meta.txt'))
+
+    loaded = build_model(tmpdir)
+    assert isinstance(loaded.FVmesh.neighbours, numpy.memmap)
+    assert_same_mesh(built, loaded)
+
+@pytest.mark.parametrize('damage', ['key', 'missing', 'truncated'])
+def test_cache_invalidated(tmpdir, damage):
+    """
+    An entry whose key does not match or whose files cannot be read is removed and the mesh
+    is rebuilt and cached again.
+    """
+
+    built = build_model(tmpdir)
+    cache = open_cache(built)
+    if damage == 'key':
+        meta = os.path.join(cache.path, 'meta.txt')
+        with open(meta, 'r') as f:
+            lines = f.read().replace('afactor=', 'afactor=2')
+        with open(meta, 'w') as f:
+            f.write(lines)
+    elif damage == 'missing':
+        os.remove(os.path.join(cache.path, 'tin.neighbours.npy'))
+    else:
+        with open(os.path.join(cache.path, 'p0.lGIDs.npy'), 'w') as f:
+            f.write('NUMPY')
+
+    assert cache.load() == (None, None)
+    assert not os.path.exists(cache.path)
+
+    rebuilt = build_model(tmpdir)
+    assert not isinstance(rebuilt.FVmesh.neighbours, numpy.memmap)
+    assert os.path.isfile(os.path.join(cache.path, 'meta.txt'))
+    assert_same_mesh(built, rebuilt)
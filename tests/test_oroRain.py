@@ -0,0 +1,94 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Tests of the orographic precipitation model.
+"""
+
+import numpy
+import pytest
+from scipy.ndimage.filters import gaussian_filter
+from pyBadlands.forcing import oroRain
+from pyBadlands.libUtils import ORmodel
+
+# Rain range and Smith & Barstad parameters (rmin, rmax, rbgd, windx, windy, nm, cw, hw, tauc, tauf)
+PARAMS = (0.2, 4., 1., -3., 2., 0.005, 0.005, 3000., 1000., 1000.)
+
+@pytest.fixture(scope='module')
+def terrain():
+    """
+    Two hills on a 61 x 51 regular grid whose nodes are used as TIN.
+    """
+
+    dx = 500.
+    regX = dx * numpy.arange(61)
+    regY = dx * numpy.arange(51)
+    X, Y = numpy.meshgrid(regX, regY)
+    Z = 2000. * numpy.exp(-((X - 10000.)**2 + (Y - 12000.)**2) / 8.e6) \
+        + 1200. * numpy.exp(-((X - 20000.)**2 + (Y - 8000.)**2) / 2.e7) - 100.
+    tXY = numpy.column_stack((X.ravel(), Y.ravel()))
+
+    return dx, regX, regY, tXY, Z.ravel()
+
+def fortran_rain(regZ, dx, params):
+    """
+    Precipitation computed by the Fortran implementation of the model.
+    """
+
+    rmin, rmax, rbgd, windx, windy, nm, cw, hw, tauc, tauf = params
+
+    return ORmodel.orographicrain.compute(regZ, dx, windx, windy, rmin, rmax, rbgd, nm, cw, hw,
+                                          tauc, tauf)
+
+def test_matches_fortran_model(terrain):
+    """
+    The rain field and its interpolation on the TIN match the Fortran implementation of the
+    model within its single precision.
+    """
+
+    dx, regX, regY, tXY, elev = terrain
+    orain = oroRain.oroRain(regX, regY)
+    orain.update_mesh(tXY)
+
+    regZ = numpy.reshape(elev.clip(0), (len(regX), len(regY)), order='F')
+    ref = fortran_rain(regZ, dx, PARAMS)
+    assert ref.max() > PARAMS[2] and ref.min() < PARAMS[2]
+
+    rain = orain._rain_grid(regZ.ravel(order='F'), dx, *PARAMS)
+    assert numpy.abs(rain - ref).max() < 1.e-5 * numpy.abs(ref).max()
+
+    ids = numpy.arange(0, len(tXY), 3)
+    tinRain = orain.compute(elev, 0., ids, dx, *PARAMS)
+    smooth = numpy.ravel(gaussian_filter(ref, sigma=3), order='F')
+    assert numpy.abs(tinRain - smooth[ids]).max() < 1.e-5 * numpy.abs(ref).max()
+
+def test_transfer_function_kept(terrain):
+    """
+    A single transfer function is stored, it is reused by the events sharing the model
+    parameters and rebuilt when they change.
+    """
+
+    dx, regX, regY, tXY, elev = terrain
+    orain = oroRain.oroRain(regX, regY)
+    orain.update_mesh(tXY)
+    ids = numpy.arange(len(tXY))
+
+    first = orain.compute(elev, 0., ids, dx, *PARAMS)
+    transfer = orain.transfer
+    assert numpy.array_equal(orain.compute(elev, 0., ids, dx, *PARAMS), first)
+    assert orain.transfer is transfer
+
+    # Background rain and range only rescale the field
+    orain.compute(elev, 0., ids, dx, 0., 6., 2., *PARAMS[3:])
+    assert orain.transfer is transfer
+
+    wind = PARAMS[:3] + (3., -2.) + PARAMS[5:]
+    other = orain.compute(elev, 0., ids, dx, *wind)
+    assert orain.transfer is not transfer
+    assert not numpy.allclose(other, first)
+    assert numpy.array_equal(orain.compute(elev, 0., ids, dx, *PARAMS), first)
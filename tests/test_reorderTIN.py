@@ -0,0 +1,60 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Tests of the space-filling curve renumbering of the TIN vertices.
+"""
+
+import os
+import numpy
+import pytest
+from modelsetup import write_xml, write_disp, run_model
+
+TECTONIC = """<tectonic><disp3d>1</disp3d><merge3d>20.</merge3d><time3d>500.</time3d><events>1</events>
+    <disp><dstart>0.</dstart><dend>1000.</dend><dfile>{dfile}</dfile></disp></tectonic>
+    <erocoeff><erolayers>2</erolayers>
+    <erolay><erocst>1.e-4</erocst><thcst>2.</thcst></erolay>
+    <erolay><erocst>2.e-5</erocst><thcst>50.</thcst></erolay></erocoeff>"""
+
+def sorted_state(model):
+    """
+    Coordinates, elevation, cumulative erosion/deposition and erodibility of the TIN nodes
+    sorted by coordinates.
+    """
+
+    xy = model.FVmesh.node_coords[:,:2]
+    order = numpy.lexsort((xy[:,1], xy[:,0]))
+
+    return [xy[order], model.elevation[order], model.cumdiff[order],
+            model.flow.erodibility[order]]
+
+@pytest.mark.parametrize('tecto', [False, True])
+def test_hilbert_matches_original_order(tmpdir, tecto):
+    """
+    The nodes renumbered along a Hilbert curve, before and after the remeshing of 3D
+    displacements, carry the same elevation, cumulative erosion/deposition and erodibility, bit
+    for bit, as the nodes in their original order.
+    """
+
+    tend = 3000.
+    dfile = write_disp(os.path.join(str(tmpdir), 'disp.csv'))
+    extra = TECTONIC.format(dfile=dfile) if tecto else ''
+    models = {}
+    for reorder in ['none', 'hilbert']:
+        xmlfile = write_xml(tmpdir, reorder, tend=tend, grid='<reorder>%s</reorder>' % reorder,
+                            extra=extra)
+        models[reorder] = run_model(xmlfile, tend)
+
+    xy = models['none'].FVmesh.node_coords[:,:2]
+    assert not numpy.array_equal(xy, models['hilbert'].FVmesh.node_coords[:,:2])
+    if tecto:
+        assert len(xy) != 41*41
+        assert len(numpy.unique(models['none'].flow.erodibility)) > 1
+
+    for ref, val in zip(sorted_state(models['none']), sorted_state(models['hilbert'])):
+        assert numpy.array_equal(ref, val)
@@ -0,0 +1,68 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the Badlands surface processes modelling application.    ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+Tests of the stratigraphic mesh.
+"""
+
+import numpy
+from modelsetup import write_xml, run_model
+from pyBadlands.underland import strataMesh
+
+STRATA = '<strata><stratdx>50.</stratdx><laytime>500.</laytime></strata>'
+
+def test_single_precision_layers(tmpdir):
+    """
+    Stratigraphic layers stored in single precision only differ from the double precision ones
+    by their rounding, the surface evolution is unchanged.
+    """
+
+    double = run_model(write_xml(tmpdir, 'double', extra=STRATA), 2000.)
+    single = run_model(write_xml(tmpdir, 'single', extra=STRATA,
+                                 grid='<precision>single</precision>'), 2000.)
+
+    assert single.elevation.dtype == numpy.float64
+    assert numpy.array_equal(single.elevation, double.elevation)
+    assert numpy.array_equal(single.cumdiff, double.cumdiff)
+
+    for name in ['stratElev', 'stratThick', 'stratDepth']:
+        layers = getattr(single.strata[0], name)
+        reference = getattr(double.strata[0], name)
+        assert layers.dtype == numpy.float32
+        assert numpy.abs(reference).max() > 0.
+        assert numpy.allclose(layers, reference, rtol=1.e-6, atol=1.e-6 * numpy.abs(reference).max())
+
+def test_single_precision_long_run(tmpdir):
+    """
+    Over thousands of layers of deposition and periodic erosion the single precision layers do
+    not accumulate round-off errors: each layer and each column thickness stay within the float32
+    rounding of the double precision ones.
+    """
+
+    X, Y = numpy.meshgrid(numpy.arange(0., 500., 50.), numpy.arange(0., 500., 50.))
+    xyTIN = numpy.column_stack((X.ravel(), Y.ravel()))
+    nlays = 2000
+    strata = []
+    for dtype in [numpy.float64, numpy.float32]:
+        strat = strataMesh.strataMesh(50., [0., 450.], [0., 450.], nlays+1, xyTIN, str(tmpdir),
+                                      'sed', dtype=dtype)
+        rs = numpy.random.RandomState(1)
+        cumdiff = numpy.zeros(len(xyTIN))
+        for k in range(nlays):
+            cumdiff = cumdiff + 0.06 * rs.rand(len(xyTIN)) - (0. if k % 10 else 0.2)
+            strat.buildStrata(1000. + cumdiff, cumdiff, 0., 0)
+        strat.layerMesh(1000. + cumdiff)
+        strata.append(strat)
+
+    double, single = [(s.stratThick[:,:nlays], s.stratDepth[:,:nlays]) for s in strata]
+    eps = numpy.finfo(numpy.float32).eps
+    total = double[0].sum(axis=1)
+    assert total.min() > 10.
+    assert numpy.abs(single[0] - double[0]).max() <= 2. * eps * double[0].max()
+    assert numpy.all(numpy.abs(single[0].sum(axis=1) - total) <= 1.e-6 * total)
+    assert numpy.abs(single[1] - double[1]).max() <= eps * 1100.